@@ -0,0 +1,132 @@
+"""Precision/recall and latency of civic_dedupe on synthetic reports.
+
+Builds an in-memory DuplicateDetector over --open synthetic open issues
+spread over Pune, then checks --reports new reports of which --dup-share
+are re-wordings of an existing issue made within a few tens of metres. No
+database is involved. A brute-force scan over every open issue is timed on
+a sample for comparison.
+
+    python benchmarks/bench_dedupe.py --open 50000 --reports 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import civic_dedupe  # noqa: E402
+import civic_spatial  # noqa: E402
+
+
+# Rough bounding box of Pune
+LAT_RANGE = (18.42, 18.64)
+LON_RANGE = (73.74, 73.98)
+CATEGORIES = 6
+
+PROBLEMS = [
+    "pothole", "garbage pile", "broken streetlight", "water leakage", "open drain", "fallen tree",
+    "damaged footpath", "illegal dumping", "sewage overflow", "stray cattle", "blocked gutter", "broken signal",
+]
+PLACES = [
+    "near the bus stop", "outside the school gate", "opposite the temple", "at the market corner",
+    "next to the hospital", "behind the police chowky", "on the main road", "by the railway crossing",
+    "in front of the bank", "near the park entrance", "at the flyover ramp", "beside the petrol pump",
+]
+DETAILS = [
+    "for two weeks", "causing traffic jams", "very dangerous at night", "kids walking here daily",
+    "getting worse after rain", "bad smell everywhere", "vehicles getting damaged", "nobody has fixed it",
+]
+FILLERS = ["please fix", "urgent", "sir kindly look", "again", "still", "huge", "big", "serious"]
+
+
+def describe(rng):
+    return f"{rng.choice(FILLERS)} {rng.choice(PROBLEMS)} {rng.choice(PLACES)}, {rng.choice(DETAILS)} {rng.randint(1, 999)}"
+
+
+def reword(rng, text):
+    # What a second citizen reporting the same thing tends to write
+    words = text.split()
+    words = [w for w in words if rng.random() > 0.12]
+    if rng.random() < 0.5:
+        words.insert(0, rng.choice(FILLERS))
+    if rng.random() < 0.5:
+        words.append(rng.choice(FILLERS))
+    text = " ".join(words)
+    return text.upper() if rng.random() < 0.2 else text
+
+
+def jitter(rng, lat, lon, metres):
+    return (lat + rng.uniform(-metres, metres) / 111320.0, lon + rng.uniform(-metres, metres) / 105000.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--open', type=int, default=50000, help='open issues in the index')
+    parser.add_argument('--reports', type=int, default=2000, help='new reports to check')
+    parser.add_argument('--dup-share', type=float, default=0.5)
+    parser.add_argument('--radius', type=float, default=civic_dedupe.RADIUS_M)
+    parser.add_argument('--threshold', type=float, default=civic_dedupe.SUGGEST_SIMILARITY)
+    parser.add_argument('--brute-sample', type=int, default=50, help='reports to time with a full scan')
+    parser.add_argument('--seed', type=int, default=11)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    detector = civic_dedupe.DuplicateDetector(args.radius, args.threshold)
+    issues = []
+    started = time.perf_counter()
+    for issue_id in range(1, args.open + 1):
+        category = rng.randrange(CATEGORIES)
+        lat, lon = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+        text = describe(rng)
+        detector.add(issue_id, category, lat, lon, text)
+        issues.append((issue_id, category, lat, lon, text))
+    build = time.perf_counter() - started
+
+    reports = []
+    for _ in range(args.reports):
+        if rng.random() < args.dup_share:
+            issue_id, category, lat, lon, text = rng.choice(issues)
+            reports.append((issue_id, category, *jitter(rng, lat, lon, 40), reword(rng, text)))
+        else:
+            reports.append((None, rng.randrange(CATEGORIES), rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE), describe(rng)))
+
+    latencies = []
+    true_pos = false_pos = false_neg = 0
+    for expected, category, lat, lon, text in reports:
+        started = time.perf_counter()
+        match = detector.check(category, lat, lon, text)
+        latencies.append(time.perf_counter() - started)
+        found = match.issue_id if match else None
+        if found is not None and found == expected:
+            true_pos += 1
+        elif found is not None:
+            false_pos += 1
+        if expected is not None and found != expected:
+            false_neg += 1
+
+    brute = []
+    for _, category, lat, lon, text in reports[:args.brute_sample]:
+        started = time.perf_counter()
+        sig = civic_dedupe.signature(text)
+        for issue_id, issue_category, issue_lat, issue_lon, issue_text in issues:
+            if issue_category == category and civic_spatial.haversine_m(lat, lon, issue_lat, issue_lon) <= args.radius:
+                civic_dedupe.similarity(sig, civic_dedupe.signature(issue_text))
+        brute.append(time.perf_counter() - started)
+
+    latencies.sort()
+    precision = true_pos / (true_pos + false_pos) if true_pos + false_pos else 1.0
+    recall = true_pos / (true_pos + false_neg) if true_pos + false_neg else 1.0
+    print(f"open issues:    {args.open} (index built in {build:.1f}s)")
+    print(f"reports:        {args.reports} ({args.dup_share:.0%} duplicates), radius {args.radius:.0f} m, threshold {args.threshold}")
+    print(f"precision:      {precision:.3f}")
+    print(f"recall:         {recall:.3f}")
+    print(f"check p50:      {statistics.median(latencies) * 1000:.2f} ms")
+    print(f"check p95:      {latencies[int(len(latencies) * 0.95) - 1] * 1000:.2f} ms")
+    print(f"full scan p50:  {statistics.median(brute) * 1000:.2f} ms ({len(brute)} reports)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Sign-in throughput and latency under a burst of concurrent logins.
+
+Creates --users accounts in a scratch SQLite file (or the CIVIC_DB_*
+database with --use-env), --legacy-share of them with the old unsalted
+SHA-256 hashes, then has --threads sessions sign in --logins times in total
+through civic_auth.authenticate (the app's login path: lookup by email,
+scrypt in the worker pool, rehash of legacy hashes). A probe thread runs
+a few milliseconds of pure-Python work in a loop meanwhile; its latency
+shows how much the storm slows down everybody else's reruns.
+
+    python benchmarks/bench_login.py --users 200 --threads 32 --logins 1000
+"""
+import argparse
+import hashlib
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import civic_auth  # noqa: E402
+import civic_db  # noqa: E402
+
+
+def percentile(values, share):
+    return sorted(values)[max(int(len(values) * share) - 1, 0)]
+
+
+def seed(user_count, legacy_share, rng):
+    accounts = [(f"user{n}-{time.time_ns()}@bench.local", f"Password-{n}") for n in range(user_count)]
+    legacy = set(rng.sample(range(user_count), int(user_count * legacy_share)))
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        hashes = list(pool.map(
+            lambda item: hashlib.sha256(item[1][1].encode()).hexdigest() if item[0] in legacy else civic_auth.make_hash(item[1][1]),
+            enumerate(accounts),
+        ))
+    with civic_db.connection() as conn:
+        conn.begin()
+        conn.executemany(
+            "INSERT INTO USERS (name, phone, email, role, password_hash) VALUES ('Bench Citizen', NULL, %s, 'citizen', %s)",
+            [(email, password_hash) for (email, _), password_hash in zip(accounts, hashes)],
+        )
+        conn.commit()
+    return accounts
+
+
+def probe(stop, delays):
+    # Stands in for another session's rerun: ~2 ms of Python, every 10 ms
+    while not stop.is_set():
+        started = time.perf_counter()
+        sum(i * i for i in range(20000))
+        delays.append(time.perf_counter() - started)
+        time.sleep(0.01)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--legacy-share', type=float, default=0.5)
+    parser.add_argument('--threads', type=int, default=32, help='concurrent sign-ins')
+    parser.add_argument('--logins', type=int, default=1000)
+    parser.add_argument('--wrong-share', type=float, default=0.1, help='share of attempts with a wrong password')
+    parser.add_argument('--use-env', action='store_true', help='use the CIVIC_DB_* backend instead of a scratch SQLite file')
+    parser.add_argument('--seed', type=int, default=21)
+    args = parser.parse_args()
+
+    if not args.use_env:
+        scratch = tempfile.mkdtemp(prefix='civic-bench-')
+        civic_db.use_backend(civic_db.SQLiteBackend(os.path.join(scratch, 'bench.sqlite3')), pool_size=args.threads)
+
+    rng = random.Random(args.seed)
+    accounts = seed(args.users, args.legacy_share, rng)
+    baseline = []
+    for _ in range(50):
+        started = time.perf_counter()
+        sum(i * i for i in range(20000))
+        baseline.append(time.perf_counter() - started)
+
+    plan = []
+    for _ in range(args.logins):
+        email, password = rng.choice(accounts)
+        plan.append((email, password if rng.random() >= args.wrong_share else password + '!'))
+    plan_lock = threading.Lock()
+    latencies, outcomes = [], {'ok': 0, 'denied': 0, 'busy': 0}
+
+    def worker():
+        while True:
+            with plan_lock:
+                if not plan:
+                    return
+                email, password = plan.pop()
+            started = time.perf_counter()
+            try:
+                outcome = 'ok' if civic_auth.authenticate(email, password, 'citizen') else 'denied'
+            except civic_auth.AuthBusy:
+                outcome = 'busy'
+            elapsed = time.perf_counter() - started
+            with plan_lock:
+                latencies.append(elapsed)
+                outcomes[outcome] += 1
+
+    stop, delays = threading.Event(), []
+    prober = threading.Thread(target=probe, args=(stop, delays))
+    prober.start()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    stop.set()
+    prober.join()
+
+    stats = civic_auth.stats()
+    print(f"scrypt:        n={civic_auth.SCRYPT_N} r={civic_auth.SCRYPT_R} p={civic_auth.SCRYPT_P}, {stats['workers']} workers, queue limit {stats['max_pending']}")
+    print(f"sign-ins:      {len(latencies)} in {wall:.2f}s ({len(latencies) / wall:.0f}/s) from {args.threads} threads")
+    print(f"outcomes:      {outcomes}, legacy hashes upgraded: {stats['rehashed']}")
+    print(f"latency:       p50 {statistics.median(latencies) * 1000:.0f} ms, p95 {percentile(latencies, 0.95) * 1000:.0f} ms, p99 {percentile(latencies, 0.99) * 1000:.0f} ms")
+    print(f"other work:    p50 {statistics.median(delays) * 1000:.1f} ms, p95 {percentile(delays, 0.95) * 1000:.1f} ms during the burst "
+          f"(p50 {statistics.median(baseline) * 1000:.1f} ms when idle)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Live Map cluster count, payload size and clustering time per zoom level.
+
+Spreads --issues synthetic issues over --locations random points in Pune,
+folds them into (location, status, severity) rows the way
+issue_location_counts stores them, and clusters those rows at every zoom
+level the map offers. The payload column is the size of the Plotly figure
+JSON the browser would receive. No database is involved.
+
+    python benchmarks/bench_map.py --issues 100000 --locations 5000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+import plotly.express as px  # noqa: E402
+
+import civic_map  # noqa: E402
+
+
+# Rough bounding box of Pune
+LAT_RANGE = (18.42, 18.64)
+LON_RANGE = (73.74, 73.98)
+STATUSES = ['Pending', 'In-Progress', 'Resolved', 'Closed', 'Duplicate']
+SEVERITIES = ['Low', 'Medium', 'High']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--issues', type=int, default=100000)
+    parser.add_argument('--locations', type=int, default=5000)
+    parser.add_argument('--max-clusters', type=int, default=civic_map.MAX_CLUSTERS)
+    parser.add_argument('--seed', type=int, default=18)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    points = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(args.locations)]
+    counts = {}
+    for _ in range(args.issues):
+        key = (rng.randrange(args.locations), rng.choice(STATUSES), rng.choice(SEVERITIES))
+        counts[key] = counts.get(key, 0) + 1
+    rows = [(*points[location], status, severity, count) for (location, status, severity), count in counts.items()]
+
+    print(f"issues: {args.issues}, locations: {args.locations}, rollup rows: {len(rows)}, cluster cap: {args.max_clusters}")
+    print(f"{'zoom':>4} {'used':>4} {'clusters':>9} {'cluster ms':>11} {'payload KB':>11}")
+    for zoom in range(civic_map.MIN_ZOOM, civic_map.MAX_ZOOM + 1):
+        started = time.perf_counter()
+        clusters, used = civic_map.cluster(rows, zoom, args.max_clusters)
+        elapsed = time.perf_counter() - started
+        df = pd.DataFrame([{
+            'latitude': c.latitude, 'longitude': c.longitude, 'issues': c.issue_count,
+            'status': civic_map.dominant(c.status_counts),
+        } for c in clusters])
+        payload = px.scatter_map(df, lat='latitude', lon='longitude', size='issues', color='status', zoom=used).to_json()
+        print(f"{zoom:>4} {used:>4} {len(clusters):>9} {elapsed * 1000:>11.1f} {len(payload) / 1024:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Latency of civic_nearby radius and k-nearest queries on synthetic issues.
+
+Builds an in-memory NearbyIndex over --locations random points in Pune and
+--issues open issues spread over them, then runs --queries radius and
+k-nearest lookups from random points. A full scan over every issue is
+timed on a sample for comparison. No database is involved.
+
+    python benchmarks/bench_nearby.py --issues 100000 --locations 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import civic_nearby  # noqa: E402
+import civic_spatial  # noqa: E402
+
+
+# Rough bounding box of Pune
+LAT_RANGE = (18.42, 18.64)
+LON_RANGE = (73.74, 73.98)
+CATEGORIES = 6
+
+
+def percentile(values, share):
+    return sorted(values)[max(int(len(values) * share) - 1, 0)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--issues', type=int, default=100000)
+    parser.add_argument('--locations', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--radius', type=float, default=civic_nearby.RADIUS_M)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--brute-sample', type=int, default=50, help='queries to time with a full scan')
+    parser.add_argument('--seed', type=int, default=19)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    now = datetime.now()
+    started = time.perf_counter()
+    index = civic_nearby.NearbyIndex()
+    points = {}
+    for location_id in range(1, args.locations + 1):
+        points[location_id] = (rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE))
+        index.set_location(location_id, *points[location_id])
+    issues = []
+    for issue_id in range(1, args.issues + 1):
+        location_id = rng.randint(1, args.locations)
+        category_id = rng.randrange(CATEGORIES)
+        index.add(issue_id, location_id, rng.choice(civic_nearby.OPEN_STATUS_IDS), category_id, 'High', 'pothole', now)
+        issues.append((issue_id, location_id, category_id))
+    build = time.perf_counter() - started
+
+    queries = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(args.queries)]
+    radius_times, knn_times, hits = [], [], []
+    for lat, lon in queries:
+        started = time.perf_counter()
+        found = index.nearby(lat, lon, args.radius)
+        radius_times.append(time.perf_counter() - started)
+        hits.append(len(found))
+        started = time.perf_counter()
+        index.nearest(lat, lon, args.k, {'category_id': 1})
+        knn_times.append(time.perf_counter() - started)
+
+    brute = []
+    for lat, lon in queries[:args.brute_sample]:
+        started = time.perf_counter()
+        found = [issue_id for issue_id, location_id, _ in issues if civic_spatial.haversine_m(lat, lon, *points[location_id]) <= args.radius]
+        brute.append(time.perf_counter() - started)
+
+    print(f"issues:         {args.issues} over {args.locations} locations (index built in {build:.1f}s)")
+    print(f"radius {args.radius:.0f} m:   p50 {statistics.median(radius_times) * 1000:.3f} ms, p95 {percentile(radius_times, 0.95) * 1000:.3f} ms, {statistics.mean(hits):.1f} issues per query")
+    print(f"{args.k}-nearest:     p50 {statistics.median(knn_times) * 1000:.3f} ms, p95 {percentile(knn_times, 0.95) * 1000:.3f} ms (one category)")
+    print(f"full scan:      p50 {statistics.median(brute) * 1000:.2f} ms ({len(brute)} queries)")
+
+
+if __name__ == '__main__':
+    main()
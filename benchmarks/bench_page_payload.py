@@ -0,0 +1,52 @@
+"""Measure the HTML/CSS the home page sends on each rerun.
+
+Renders the home page with Streamlit's AppTest against a scratch SQLite file
+and sums the st.markdown bodies, which is what a rerun re-sends (the hero
+image itself is a static file and is not part of it). Exits 1 if the total
+is over --budget-kb.
+
+    python benchmarks/bench_page_payload.py --budget-kb 64
+"""
+import argparse
+import base64
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import civic_assets  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget-kb', type=float, default=64, help='fail if a rerun sends more markdown than this')
+    parser.add_argument('--reruns', type=int, default=3)
+    args = parser.parse_args()
+
+    os.environ['CIVIC_DB_BACKEND'] = 'sqlite'
+    os.environ['CIVIC_SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='civic-bench-'), 'payload.sqlite3')
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, 'civic_issue.py'), default_timeout=60)
+    sizes = []
+    for _ in range(args.reruns):
+        app.run()
+        if app.exception:
+            print(app.exception[0].value)
+            sys.exit(1)
+        sizes.append(sum(len(block.value.encode()) for block in app.markdown))
+    css = max(len(block.value.encode()) for block in app.markdown)
+
+    with open(os.path.join(civic_assets.STATIC_DIR, civic_assets.HERO_SOURCE), 'rb') as image:
+        inline_hero = len(base64.b64encode(image.read()))
+    per_rerun = max(sizes)
+    print(f"markdown per rerun:   {per_rerun / 1024:.1f} KB (largest block, the page CSS: {css / 1024:.1f} KB)")
+    print(f"inlined hero (before): {inline_hero / 1024:.1f} KB of base64 per rerun avoided")
+    print(f"budget:               {args.budget_kb:.0f} KB -> {'OK' if per_rerun <= args.budget_kb * 1024 else 'OVER'}")
+    sys.exit(0 if per_rerun <= args.budget_kb * 1024 else 1)
+
+
+if __name__ == '__main__':
+    main()
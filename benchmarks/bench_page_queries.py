@@ -0,0 +1,81 @@
+"""Check that the staff Cards view runs the same queries at any page size.
+
+Renders the staff Issue Management list in the Cards view with Streamlit's
+AppTest against a scratch SQLite file filled by benchmarks/datagen.py, once
+per --page-sizes value. Every size is rendered with st.cache_data cleared
+(after one warm-up render for the process-wide stores), and the rerun's
+query count comes from civic_metrics. The update history of a page is one
+batched query, so the count must not grow with the page size. Exits 1 if
+it does.
+
+    python benchmarks/bench_page_queries.py --page-sizes 10,100
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ['CIVIC_DB_BACKEND'] = 'sqlite'
+os.environ['CIVIC_SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='civic-bench-'), 'queries.sqlite3')
+os.environ['CIVIC_METRICS'] = '1'
+
+import civic_db  # noqa: E402
+import datagen  # noqa: E402
+
+
+def render(page_size, staff_id):
+    # civic_metrics' summary of one cold-cache Cards render, and the number
+    # of issue cards it showed
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    st.cache_data.clear()
+    app = AppTest.from_file(os.path.join(ROOT, 'civic_issue.py'), default_timeout=60)
+    app.session_state['logged_in'] = True
+    app.session_state['user_id'] = staff_id
+    app.session_state['user_name'] = 'Bench'
+    app.session_state['user_role'] = 'staff'
+    app.session_state['current_page'] = 'dashboard'
+    app.session_state['f_view'] = 'Cards'
+    app.session_state['f_page_size'] = page_size
+    app.run()
+    if app.exception:
+        print(app.exception[0].value)
+        sys.exit(1)
+    shown = sum(1 for expander in app.expander if expander.label.startswith('#'))
+    return app.session_state['last_rerun_metrics'], shown
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--page-sizes', default='10,100', help='comma-separated sizes from the Per page choices (10, 25, 50, 100)')
+    parser.add_argument('--issues', type=int, default=300)
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.page_sizes.split(',')]
+    import streamlit.logger
+    from streamlit import config
+    # Loading the config resets the log level, so load it first; then keep
+    # the deprecation and bare-mode warnings of every run out of the output
+    config.get_config_options()
+    streamlit.logger.set_log_level('error')
+
+    datagen.generate(args.issues)
+    with civic_db.connection() as conn:
+        staff_id = int(conn.query("SELECT user_id FROM USERS WHERE role = 'staff' ORDER BY user_id LIMIT 1")[0]['user_id'])
+
+    render(sizes[0], staff_id)
+    counts = {}
+    for size in sizes:
+        metrics, shown = render(size, staff_id)
+        counts[size] = metrics['queries']
+        print(f"page size {size:>4}: {shown:>4} cards, {metrics['queries']:>3} queries, {metrics['db_seconds'] * 1000:.1f} ms in the database")
+    constant = len(set(counts.values())) == 1
+    print("query count per render: " + ("constant, OK" if constant else "grows with the page size, FAIL"))
+    sys.exit(0 if constant else 1)
+
+
+if __name__ == '__main__':
+    main()
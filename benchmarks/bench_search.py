@@ -0,0 +1,119 @@
+"""Latency of the staff dashboard's full-text search on a large database.
+
+Fills a scratch SQLite file (or the CIVIC_DB_* database with --use-env) with
+--issues synthetic reports, indexes them with civic_search.rebuild(), then
+times the ranked-page query the dashboard runs (which also returns the
+match count), with and without filters, on the first and a deep page.
+
+    python benchmarks/bench_search.py --issues 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import civic_db  # noqa: E402
+import civic_search  # noqa: E402
+
+PROBLEMS = [
+    "pothole", "garbage pile", "broken streetlight", "water leakage", "open drain", "fallen tree",
+    "damaged footpath", "illegal dumping", "sewage overflow", "stray cattle", "blocked gutter", "broken signal",
+]
+PLACES = [
+    "near the bus stop", "outside the school gate", "opposite the temple", "at the market corner",
+    "next to the hospital", "behind the police chowky", "on the main road", "by the railway crossing",
+    "in front of the bank", "near the park entrance", "at the flyover ramp", "beside the petrol pump",
+]
+DETAILS = [
+    "for two weeks", "causing traffic jams", "very dangerous at night", "kids walking here daily",
+    "getting worse after rain", "bad smell everywhere", "vehicles getting damaged", "nobody has fixed it",
+]
+AREAS = ["Kothrud", "Baner", "Hadapsar", "Aundh", "Wakad", "Hinjewadi", "Viman Nagar", "Shivajinagar", "Camp", "Katraj"]
+QUERIES = ["streetlight school", "pothole", "garbage market", "water leakage hospital", "kothrud drain", "fallen tree temple night"]
+BATCH = 10000
+
+
+def seed(issue_count, rng):
+    with civic_db.connection() as conn:
+        conn.begin()
+        _, user_id = conn.execute(
+            "INSERT INTO USERS (name, phone, email, role, password_hash) VALUES ('Bench Citizen', NULL, %s, 'citizen', '-')",
+            (f"citizen-{time.time_ns()}@bench.local",),
+        )
+        category_ids = [conn.execute("INSERT INTO CATEGORIES (Name) VALUES (%s)", (f"Bench {n} {time.time_ns()}",))[1] for n in range(6)]
+        location_ids = [
+            conn.execute("INSERT INTO LOCATIONS (area, address, latitude, longitude) VALUES (%s, %s, 18.52, 73.85)", (area, f"{n} {area} Road"))[1]
+            for n, area in enumerate(AREAS * 20)
+        ]
+        conn.commit()
+    start = datetime(2024, 1, 1)
+    for offset in range(0, issue_count, BATCH):
+        rows = []
+        for _ in range(min(BATCH, issue_count - offset)):
+            created_at = start + timedelta(minutes=rng.randrange(60 * 24 * 365))
+            description = f"{rng.choice(PROBLEMS)} {rng.choice(PLACES)}, {rng.choice(DETAILS)}"
+            rows.append((user_id, rng.choice(category_ids), rng.choice(location_ids), rng.randint(1, 5), description,
+                         rng.choice(['Low', 'Medium', 'High']), created_at, created_at))
+        with civic_db.connection() as conn:
+            conn.begin()
+            conn.executemany(
+                "INSERT INTO ISSUES (user_id, category_id, location_id, status_id, description, severity, photo_path, created_at, updated_at, master_issue_id) "
+                "VALUES (%s, %s, %s, %s, %s, %s, NULL, %s, %s, NULL)",
+                rows,
+            )
+            conn.commit()
+
+
+def timed(func, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--issues', type=int, default=1000000)
+    parser.add_argument('--page-size', type=int, default=25)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--use-env', action='store_true', help='use the CIVIC_DB_* backend instead of a scratch SQLite file')
+    parser.add_argument('--seed', type=int, default=20)
+    args = parser.parse_args()
+
+    if not args.use_env:
+        scratch = tempfile.mkdtemp(prefix='civic-bench-')
+        civic_db.use_backend(civic_db.SQLiteBackend(os.path.join(scratch, 'bench.sqlite3')))
+
+    started = time.perf_counter()
+    seed(args.issues, random.Random(args.seed))
+    seeded = time.perf_counter() - started
+    started = time.perf_counter()
+    indexed = civic_search.rebuild()
+    built = time.perf_counter() - started
+    print(f"backend: {civic_db.get_backend().name}, {args.issues} issues seeded in {seeded:.0f}s, {indexed} indexed in {built:.0f}s")
+
+    # The dashboard's own queries, minus st.cache_data
+    import civic_issue
+    page = civic_issue.get_issues_page.__wrapped__
+
+    print(f"{'query':<28} {'filter':<14} {'page 1 ms':>10} {'page 20 ms':>11} {'matches':>9}")
+    for text in QUERIES:
+        search = tuple(civic_search.terms(text))
+        for label, filters in (('-', {}), ('High, Pending', {'severity': 'High', 'status_id': 1})):
+            first, df = timed(lambda: page(**filters, search=search, page_size=args.page_size), args.repeat)
+            deep, _ = timed(lambda: page(**filters, search=search, page_size=args.page_size, offset=19 * args.page_size), args.repeat)
+            matches = int(df['search_matches'].iloc[0]) if not df.empty else 0
+            capped = '+' if matches >= civic_search.RANK_WINDOW else ''
+            print(f"{text:<28} {label:<14} {first * 1000:>10.1f} {deep * 1000:>11.1f} {matches:>8}{capped or ' '}")
+
+
+if __name__ == '__main__':
+    main()
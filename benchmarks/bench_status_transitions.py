@@ -0,0 +1,127 @@
+"""Hammer civic_store.change_status from many threads and check resolution_history.
+
+Every history row must start from the status the previous row ended on, and
+the last row must match ISSUES.status_id. Runs against a scratch SQLite file
+unless --use-env is given (then CIVIC_DB_* decides, so be careful with MySQL).
+
+    python benchmarks/bench_status_transitions.py --issues 50 --threads 32 --updates 500
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import civic_db  # noqa: E402
+import civic_store  # noqa: E402
+
+
+def seed(issue_count):
+    with civic_db.connection() as conn:
+        conn.begin()
+        _, citizen_id = conn.execute(
+            "INSERT INTO USERS (name, phone, email, role, password_hash) VALUES ('Bench Citizen', NULL, %s, 'citizen', '-')",
+            (f"citizen-{time.time_ns()}@bench.local",),
+        )
+        _, staff_id = conn.execute(
+            "INSERT INTO USERS (name, phone, email, role, password_hash) VALUES ('Bench Staff', NULL, %s, 'staff', '-')",
+            (f"staff-{time.time_ns()}@bench.local",),
+        )
+        _, category_id = conn.execute("INSERT INTO CATEGORIES (Name) VALUES (%s)", (f"Bench {time.time_ns()}",))
+        _, location_id = conn.execute("INSERT INTO LOCATIONS (area, address, latitude, longitude) VALUES ('Bench', 'Bench Rd', 18.52, 73.85)")
+        issue_ids = []
+        for n in range(issue_count):
+            _, issue_id = conn.execute(
+                "INSERT INTO ISSUES (user_id, category_id, location_id, status_id, description, severity, photo_path, created_at, updated_at, master_issue_id) "
+                "VALUES (%s, %s, %s, 1, %s, 'Medium', NULL, NOW(), NOW(), NULL)",
+                (citizen_id, category_id, location_id, f"bench issue {n}"),
+            )
+            issue_ids.append(issue_id)
+        conn.commit()
+    return issue_ids, staff_id
+
+
+def verify(issue_ids):
+    broken = []
+    with civic_db.connection() as conn:
+        for issue_id in issue_ids:
+            history = conn.query(
+                "SELECT old_status_id, new_status_id FROM resolution_history WHERE issue_id = %s ORDER BY history_id",
+                (issue_id,),
+            )
+            current = conn.query("SELECT status_id FROM ISSUES WHERE issue_id = %s", (issue_id,))[0]['status_id']
+            expected_old = 1
+            for row in history:
+                if row['old_status_id'] != expected_old:
+                    broken.append(issue_id)
+                    break
+                expected_old = row['new_status_id']
+            else:
+                if expected_old != current:
+                    broken.append(issue_id)
+    return broken
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--issues', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--updates', type=int, default=500, help='total status updates across all threads')
+    parser.add_argument('--use-env', action='store_true', help='use the CIVIC_DB_* backend instead of a scratch SQLite file')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    if not args.use_env:
+        scratch = tempfile.mkdtemp(prefix='civic-bench-')
+        civic_db.use_backend(civic_db.SQLiteBackend(os.path.join(scratch, 'bench.sqlite3')), pool_size=args.threads)
+
+    issue_ids, staff_id = seed(args.issues)
+    random.seed(args.seed)
+    plan = [(random.choice(issue_ids), random.randint(1, 5)) for _ in range(args.updates)]
+    plan_lock = threading.Lock()
+    latencies, outcomes = [], {}
+
+    def worker():
+        while True:
+            with plan_lock:
+                if not plan:
+                    return
+                issue_id, new_status_id = plan.pop()
+            # Read-then-write like a staff member would: the status we saw may
+            # already be stale by the time we submit.
+            with civic_db.connection() as conn:
+                seen = conn.query("SELECT status_id FROM ISSUES WHERE issue_id = %s", (issue_id,))[0]['status_id']
+            started = time.perf_counter()
+            result = civic_store.change_status(issue_id, new_status_id, staff_id, expected_status_id=seen)
+            elapsed = time.perf_counter() - started
+            with plan_lock:
+                latencies.append(elapsed)
+                outcomes[result.outcome] = outcomes.get(result.outcome, 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    broken = verify(issue_ids)
+    latencies.sort()
+    print(f"backend:      {civic_db.get_backend().name}")
+    print(f"updates:      {len(latencies)} in {wall:.2f}s ({len(latencies) / wall:.0f}/s) on {args.threads} threads")
+    print(f"outcomes:     {outcomes}")
+    print(f"latency p50:  {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"latency p95:  {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+    print(f"pool:         {civic_db.pool_stats()}")
+    print(f"history:      {'OK' if not broken else f'CORRUPT for issues {broken}'}")
+    sys.exit(1 if broken else 0)
+
+
+if __name__ == '__main__':
+    main()
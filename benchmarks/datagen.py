@@ -0,0 +1,254 @@
+"""Seeded synthetic city: users, locations, categories, issues and their history.
+
+Fills the CIVIC_DB_* database (or the SQLite file given with --sqlite) with
+--scale issues spread over the last --days days. Older issues have moved
+further through Pending -> In-Progress -> Resolved -> Closed (a few are
+marked Duplicate of an earlier report at the same place), and every move is
+in resolution_history with a staff member and a plausible timestamp. The
+pending schema migrations (the index pack) are then applied, after the bulk
+insert so the indexes are built once, and the derived tables (counters,
+KPIs, rollups, search index) rebuilt the way civic_admin.py does for an
+existing database.
+
+The same --seed and --scale always give the same issues and histories.
+
+    python benchmarks/datagen.py --scale 100k --sqlite /tmp/civic-100k.sqlite3
+
+benchmarks/run.py uses generate() to build its database.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import civic_auth  # noqa: E402
+import civic_db  # noqa: E402
+import civic_migrations  # noqa: E402
+import civic_search  # noqa: E402
+import civic_store  # noqa: E402
+
+
+SCALES = {'10k': 10000, '100k': 100000, '1m': 1000000}
+
+# Every generated account signs in with this password
+PASSWORD = 'Datagen@123'
+
+CATEGORIES = ['Roads & Potholes', 'Garbage & Sanitation', 'Streetlights', 'Water Supply', 'Drainage & Sewage', 'Trees & Parks', 'Traffic & Signals', 'Stray Animals']
+AREAS = ['Kothrud', 'Baner', 'Hadapsar', 'Aundh', 'Wakad', 'Hinjewadi', 'Viman Nagar', 'Shivajinagar', 'Camp', 'Katraj', 'Kharadi', 'Warje']
+STREETS = ['Main Road', 'Station Road', 'Market Lane', 'Temple Street', 'School Road', 'Link Road', 'Canal Road', 'Nagar Road']
+PROBLEMS = [
+    "pothole", "garbage pile", "broken streetlight", "water leakage", "open drain", "fallen tree",
+    "damaged footpath", "illegal dumping", "sewage overflow", "stray cattle", "blocked gutter", "broken signal",
+]
+PLACES = [
+    "near the bus stop", "outside the school gate", "opposite the temple", "at the market corner",
+    "next to the hospital", "behind the police chowky", "on the main road", "by the railway crossing",
+]
+DETAILS = [
+    "for two weeks", "causing traffic jams", "very dangerous at night", "kids walking here daily",
+    "getting worse after rain", "bad smell everywhere", "vehicles getting damaged", "nobody has fixed it",
+]
+SEVERITIES = ['Low', 'Medium', 'High']
+SEVERITY_WEIGHTS = [3, 5, 2]
+# Rough bounding box of Pune
+LAT_RANGE = (18.42, 18.64)
+LON_RANGE = (73.74, 73.98)
+
+PENDING, IN_PROGRESS, RESOLVED, CLOSED, DUPLICATE = 1, 2, 3, 4, 5
+# status -> [(next status, probability, mean hours until the move)]; what is
+# left of the probability means the issue stays where it is
+TRANSITIONS = {
+    PENDING: [(IN_PROGRESS, 0.70, 48), (RESOLVED, 0.10, 72), (DUPLICATE, 0.05, 24)],
+    IN_PROGRESS: [(RESOLVED, 0.80, 120), (PENDING, 0.03, 48)],
+    RESOLVED: [(CLOSED, 0.60, 96), (IN_PROGRESS, 0.05, 72)],
+}
+
+BATCH = 10000
+
+
+def _ids(conn, table, key):
+    return int(conn.query(f"SELECT COALESCE(MAX({key}), 0) as n FROM {table}")[0]['n'])
+
+
+def _history(rng, created_at, now):
+    # [(old, new, when)] for one issue, stopping at the present
+    status, when, steps = PENDING, created_at, []
+    while status in TRANSITIONS:
+        roll, move = rng.random(), None
+        for target, probability, hours in TRANSITIONS[status]:
+            if roll < probability:
+                move = (target, hours)
+                break
+            roll -= probability
+        if move is None:
+            break
+        when = when + timedelta(seconds=int(rng.expovariate(1 / (move[1] * 3600))) + 60)
+        if when > now:
+            break
+        steps.append((status, move[0], when))
+        status = move[0]
+    return steps
+
+
+def _seed_people_and_places(conn, rng, user_count, staff_count, location_count, tag):
+    password_hash = civic_auth.make_hash(PASSWORD)
+    first_user = _ids(conn, 'USERS', 'user_id') + 1
+    users = [
+        (first_user + n, f"Citizen {n}", None, f"citizen{n}.{tag}@datagen.local", 'citizen', password_hash)
+        for n in range(user_count)
+    ] + [
+        (first_user + user_count + n, f"Staff {n}", None, f"staff{n}.{tag}@datagen.local", 'staff', password_hash)
+        for n in range(staff_count)
+    ]
+    conn.executemany("INSERT INTO USERS (user_id, name, phone, email, role, password_hash) VALUES (%s, %s, %s, %s, %s, %s)", users)
+
+    conn.executemany("INSERT IGNORE INTO CATEGORIES (Name) VALUES (%s)", [(name,) for name in CATEGORIES])
+    placeholders = ', '.join(['%s'] * len(CATEGORIES))
+    category_ids = sorted(int(row['category_id']) for row in conn.query(f"SELECT category_id FROM CATEGORIES WHERE Name IN ({placeholders})", CATEGORIES))
+
+    first_location = _ids(conn, 'LOCATIONS', 'location_id') + 1
+    conn.executemany(
+        "INSERT INTO LOCATIONS (location_id, area, address, latitude, longitude) VALUES (%s, %s, %s, %s, %s)",
+        [
+            (first_location + n, rng.choice(AREAS), f"{rng.randint(1, 400)} {rng.choice(STREETS)}",
+             round(rng.uniform(*LAT_RANGE), 6), round(rng.uniform(*LON_RANGE), 6))
+            for n in range(location_count)
+        ],
+    )
+    citizen_ids = list(range(first_user, first_user + user_count))
+    staff_ids = list(range(first_user + user_count, first_user + user_count + staff_count))
+    location_ids = list(range(first_location, first_location + location_count))
+    return citizen_ids, staff_ids, category_ids, location_ids
+
+
+def generate(issue_count, seed=22, days=365, users=None, staff=20, locations=None, progress=None):
+    # Adds issue_count issues (and the people and places they need) to the
+    # configured database, then rebuilds the derived tables. Returns a
+    # summary dict with the row counts and timings.
+    rng = random.Random(seed)
+    users = users or max(issue_count // 20, 50)
+    locations = locations or max(issue_count // 100, 100)
+    # Unique per run so generating into a database twice adds a second city
+    # instead of failing on USERS.email
+    tag = f"{seed}-{time.time_ns()}"
+    now = datetime.now().replace(microsecond=0)
+    start = now - timedelta(days=days)
+    started = time.perf_counter()
+
+    with civic_db.connection() as conn:
+        conn.begin()
+        citizen_ids, staff_ids, category_ids, location_ids = _seed_people_and_places(conn, rng, users, staff, locations, tag)
+        conn.commit()
+        first_issue = _ids(conn, 'ISSUES', 'issue_id') + 1
+
+    # A few citizens report most issues, like in a real city
+    citizen_weights = [1 / (rank + 1) ** 0.8 for rank in range(len(citizen_ids))]
+    span = (now - start).total_seconds()
+    latest_at_location = {}
+    history_rows = 0
+    for offset in range(0, issue_count, BATCH):
+        issues, history = [], []
+        count = min(BATCH, issue_count - offset)
+        reporters = rng.choices(citizen_ids, weights=citizen_weights, k=count)
+        for n in range(count):
+            issue_id = first_issue + offset + n
+            # Evenly spread, in id order, with jitter
+            created_at = start + timedelta(seconds=int(span * (offset + n + rng.random()) / issue_count))
+            location_id = rng.choice(location_ids)
+            steps = _history(rng, created_at, now)
+            master_issue_id = None
+            if steps and steps[-1][1] == DUPLICATE:
+                master_issue_id = latest_at_location.get(location_id)
+                if master_issue_id is None:
+                    steps.pop()
+            status_id = steps[-1][1] if steps else PENDING
+            updated_at = steps[-1][2] if steps else created_at
+            description = f"{rng.choice(PROBLEMS)} {rng.choice(PLACES)}, {rng.choice(DETAILS)}"
+            issues.append((
+                issue_id, reporters[n], rng.choice(category_ids), location_id, status_id, description,
+                rng.choices(SEVERITIES, SEVERITY_WEIGHTS)[0], created_at, updated_at, master_issue_id,
+            ))
+            history.extend((issue_id, old, new, rng.choice(staff_ids), when) for old, new, when in steps)
+            latest_at_location[location_id] = issue_id
+        with civic_db.connection() as conn:
+            conn.begin()
+            conn.executemany(
+                "INSERT INTO ISSUES (issue_id, user_id, category_id, location_id, status_id, description, severity, photo_path, created_at, updated_at, master_issue_id) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, NULL, %s, %s, %s)",
+                issues,
+            )
+            conn.executemany(
+                "INSERT INTO resolution_history (issue_id, old_status_id, new_status_id, changed_by, timestamp) VALUES (%s, %s, %s, %s, %s)",
+                history,
+            )
+            conn.commit()
+        history_rows += len(history)
+        if progress:
+            progress(offset + count, issue_count)
+    seeded = time.perf_counter() - started
+
+    # Indexes, then the derived tables, as civic_admin.py would build them
+    started = time.perf_counter()
+    civic_migrations.migrate()
+    civic_store.rebuild_latest_updates()
+    civic_store.reconcile_status_counts(fix=True)
+    civic_store.rebuild_kpis()
+    civic_store.rebuild_rollups()
+    civic_search.rebuild()
+    derived = time.perf_counter() - started
+
+    return {
+        'issues': issue_count,
+        'history_rows': history_rows,
+        'citizens': len(citizen_ids),
+        'staff': len(staff_ids),
+        'locations': len(location_ids),
+        'categories': len(category_ids),
+        'days': days,
+        'seed': seed,
+        'seed_seconds': round(seeded, 1),
+        'derived_seconds': round(derived, 1),
+    }
+
+
+def scale(value):
+    # "100k", "1m" or a plain number of issues
+    value = str(value).strip().lower()
+    if value in SCALES:
+        return SCALES[value]
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected one of {', '.join(SCALES)} or a number of issues") from None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=scale, default=SCALES['10k'], help=f"{', '.join(SCALES)} or a number of issues")
+    parser.add_argument('--days', type=int, default=365, help='spread issues over this many days up to now')
+    parser.add_argument('--users', type=int, help='citizens (default: one per 20 issues)')
+    parser.add_argument('--staff', type=int, default=20)
+    parser.add_argument('--locations', type=int, help='locations (default: one per 100 issues)')
+    parser.add_argument('--sqlite', metavar='PATH', help='write to this SQLite file instead of the CIVIC_DB_* database')
+    parser.add_argument('--seed', type=int, default=22)
+    args = parser.parse_args()
+
+    if args.sqlite:
+        civic_db.use_backend(civic_db.SQLiteBackend(args.sqlite))
+
+    def progress(done, total):
+        print(f"\r{done}/{total} issues", end='', file=sys.stderr, flush=True)
+
+    summary = generate(args.scale, args.seed, args.days, args.users, args.staff, args.locations, progress)
+    print(file=sys.stderr)
+    print(f"backend: {civic_db.get_backend().name}, password for every account: {PASSWORD}")
+    for name, value in summary.items():
+        print(f"{name:>16}  {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+"""Time every data-access function and write path against a seeded database.
+
+By default builds a scratch SQLite database with benchmarks/datagen.py at
+--scale issues. --sqlite PATH or --use-env (the CIVIC_DB_* database) point
+it at a database instead, which is only generated if it has no issues yet.
+Each case then runs --repeat times after --warmup untimed runs. The read
+cases use the app's own queries with st.cache_data bypassed, and the write
+cases are the database side of a submission and a staff status change.
+
+--output writes the results as JSON. --compare reads an earlier file and
+flags every case whose median got more than --threshold times (and
+--min-delta-ms) slower; the exit code is 1 if any did, so the run can gate
+a change.
+
+    python benchmarks/run.py --scale 100k --output before.json
+    python benchmarks/run.py --scale 100k --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import civic_db  # noqa: E402
+import civic_store  # noqa: E402
+import datagen  # noqa: E402
+
+PAGE_SIZE = 25
+
+
+def percentile(values, share):
+    return sorted(values)[max(int(len(values) * share) - 1, 0)]
+
+
+def row_count(result):
+    # Rows returned, for spotting a query that silently came back empty
+    if isinstance(result, tuple):
+        result = result[0]
+    if isinstance(result, str):
+        return 1
+    try:
+        return len(result)
+    except TypeError:
+        return 1
+
+
+def git_revision():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ('-dirty' if dirty else '')
+
+
+def sample():
+    # Ids the cases draw their arguments from
+    with civic_db.connection() as conn:
+        users = conn.query(
+            "SELECT user_id, COUNT(*) as n FROM ISSUES GROUP BY user_id ORDER BY n DESC"
+        )
+        issues = conn.query("SELECT MIN(issue_id) as first, MAX(issue_id) as last FROM ISSUES")[0]
+        staff = conn.query("SELECT user_id FROM USERS WHERE role = 'staff'")
+        categories = conn.query("SELECT category_id FROM CATEGORIES")
+        locations = conn.query("SELECT location_id FROM LOCATIONS")
+    return {
+        'busiest_user': int(users[0]['user_id']),
+        # Everyone outside the busiest quarter of reporters: typical citizens
+        'users': [int(row['user_id']) for row in users[len(users) // 4:]],
+        'issue_range': (int(issues['first']), int(issues['last'])),
+        'staff': [int(row['user_id']) for row in staff],
+        'categories': [int(row['category_id']) for row in categories],
+        'locations': [int(row['location_id']) for row in locations],
+    }
+
+
+def cases(ids, rng):
+    # (name, callable) in run order; the write cases come last so every read
+    # case sees the generated data unchanged
+    import streamlit.logger
+    # civic_issue is imported without a Streamlit runtime; keep the warnings
+    # about that out of the table
+    streamlit.logger.set_log_level('error')
+    import civic_issue
+    today = date.today()
+    first_issue, last_issue = ids['issue_range']
+
+    def random_issue():
+        return rng.randint(first_issue, last_issue)
+
+    def submit():
+        return civic_store.submit_issue(
+            rng.choice(ids['users']), rng.choice(ids['categories']), rng.choice(ids['locations']),
+            f"{rng.choice(datagen.PROBLEMS)} {rng.choice(datagen.PLACES)}, {rng.choice(datagen.DETAILS)}",
+            rng.choice(datagen.SEVERITIES),
+        )
+
+    def update_status():
+        # Read-then-write like a staff member: the status on screen is the expected one
+        issue_id = random_issue()
+        with civic_db.connection() as conn:
+            seen = conn.query("SELECT status_id FROM ISSUES WHERE issue_id = %s", (issue_id,))[0]['status_id']
+        new_status_id = rng.choice([status_id for status_id in range(1, 5) if status_id != seen])
+        return civic_store.change_status(issue_id, new_status_id, rng.choice(ids['staff']), expected_status_id=seen)
+
+    return [
+        ('get_statistics[city]', lambda: civic_issue.get_status_counts.__wrapped__(civic_store.ALL_USERS)),
+        ('get_statistics[citizen]', lambda: civic_issue.get_status_counts.__wrapped__(rng.choice(ids['users']))),
+        ('home_kpis', lambda: civic_issue.get_home_kpis.__wrapped__()),
+        ('home_kpis[rebuild]', civic_store.rebuild_kpis),
+        ('get_issues_timeline[30d]', lambda: civic_issue.get_issues_timeline.__wrapped__(today - timedelta(days=30), today)),
+        ('get_issues_timeline[365d]', lambda: civic_issue.get_issues_timeline.__wrapped__(today - timedelta(days=365), today)),
+        ('get_issues_by_category[30d]', lambda: civic_issue.get_issues_by_category.__wrapped__(today - timedelta(days=30), today)),
+        ('get_issues_by_area[30d]', lambda: civic_issue.get_issues_by_area.__wrapped__(today - timedelta(days=30), today)),
+        ('get_user_issues[typical]', lambda: civic_issue.get_user_issues.__wrapped__(rng.choice(ids['users']))),
+        ('get_user_issues[busiest]', lambda: civic_issue.get_user_issues.__wrapped__(ids['busiest_user'])),
+        ('get_issue_history', lambda: civic_issue.get_issue_history.__wrapped__(random_issue())),
+        ('get_issues_history[page]', lambda: civic_issue.get_issues_history.__wrapped__(tuple(random_issue() for _ in range(PAGE_SIZE)))),
+        ('get_issues_page[first]', lambda: civic_issue.get_issues_page.__wrapped__(page_size=PAGE_SIZE)),
+        ('get_issues_page[pending,high]', lambda: civic_issue.get_issues_page.__wrapped__(status_id=1, severity='High', page_size=PAGE_SIZE)),
+        ('count_issues[pending]', lambda: civic_issue.count_issues.__wrapped__(status_id=1)),
+        ('submit_issue', submit),
+        ('update_issue_status', update_status),
+    ]
+
+
+def run_case(func, repeat, warmup):
+    for _ in range(warmup):
+        func()
+    times, rows = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+        rows = row_count(result)
+    return {
+        'runs': repeat,
+        'rows': rows,
+        'min_ms': round(min(times) * 1000, 3),
+        'p50_ms': round(statistics.median(times) * 1000, 3),
+        'p95_ms': round(percentile(times, 0.95) * 1000, 3),
+        'max_ms': round(max(times) * 1000, 3),
+    }
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    # Prints the change per case; returns the names that got more than
+    # threshold times and min_delta_ms slower
+    regressed = []
+    print(f"\ncompared with {baseline['meta'].get('revision') or '?'} ({baseline['meta'].get('issues')} issues, {baseline['meta'].get('backend')}):")
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if not before:
+            print(f"  {name:<32} new")
+            continue
+        ratio = result['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('inf')
+        flag = ''
+        if ratio > threshold and result['p50_ms'] - before['p50_ms'] > min_delta_ms:
+            flag = '  REGRESSION'
+            regressed.append(name)
+        print(f"  {name:<32} {before['p50_ms']:>10.2f} -> {result['p50_ms']:>10.2f} ms  x{ratio:.2f}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=datagen.scale, default=datagen.SCALES['10k'], help=f"{', '.join(datagen.SCALES)} or a number of issues")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--only', help='comma-separated case names (or prefixes) to run')
+    parser.add_argument('--sqlite', metavar='PATH', help='use this SQLite file, generating it if it has no issues')
+    parser.add_argument('--use-env', action='store_true', help='use the CIVIC_DB_* database, generating it if it has no issues')
+    parser.add_argument('--output', metavar='FILE', help='write the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='JSON from an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=1.25, help='median slowdown that counts as a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore slowdowns smaller than this (timer noise)')
+    parser.add_argument('--seed', type=int, default=22)
+    args = parser.parse_args()
+
+    if args.sqlite:
+        civic_db.use_backend(civic_db.SQLiteBackend(args.sqlite))
+    elif not args.use_env:
+        scratch = tempfile.mkdtemp(prefix='civic-bench-')
+        civic_db.use_backend(civic_db.SQLiteBackend(os.path.join(scratch, 'bench.sqlite3')))
+
+    with civic_db.connection() as conn:
+        existing = int(conn.query("SELECT COUNT(*) as n FROM ISSUES")[0]['n'])
+    generated = None
+    if not existing:
+        generated = datagen.generate(args.scale, args.seed)
+        existing = args.scale
+    print(f"backend: {civic_db.get_backend().name}, {existing} issues"
+          + (f" (generated in {generated['seed_seconds'] + generated['derived_seconds']:.0f}s)" if generated else " (existing)"))
+
+    rng = random.Random(args.seed)
+    selected = cases(sample(), rng)
+    if args.only:
+        wanted = [name.strip() for name in args.only.split(',') if name.strip()]
+        selected = [(name, func) for name, func in selected if any(name.startswith(prefix) for prefix in wanted)]
+
+    results = {}
+    print(f"{'case':<32} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {'rows':>9}")
+    for name, func in selected:
+        results[name] = run_case(func, args.repeat, args.warmup)
+        result = results[name]
+        print(f"{name:<32} {result['p50_ms']:>10.2f} {result['p95_ms']:>10.2f} {result['max_ms']:>10.2f} {result['rows']:>9}")
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'started_at': datetime.now().replace(microsecond=0).isoformat(),
+            'backend': civic_db.get_backend().name,
+            'issues': existing,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'generated': generated,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+            handle.write('\n')
+        print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as handle:
+            regressed = compare(results, json.load(handle), args.threshold, args.min_delta_ms)
+        if regressed:
+            print(f"{len(regressed)} case(s) slower than x{args.threshold}: {', '.join(regressed)}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+"""Maintenance commands for the civic portal database.
+
+Uses the same CIVIC_DB_* environment settings as the app:
+
+    python civic_admin.py backfill-latest-updates
+    python civic_admin.py reconcile-counters [--dry-run]
+    python civic_admin.py rebuild-kpis
+    python civic_admin.py rebuild-rollups
+    python civic_admin.py rebuild-search
+    python civic_admin.py build-assets
+    python civic_admin.py journal-stats
+    python civic_admin.py journal-drain [--retry-parked]
+    python civic_admin.py profile-report [--file reruns.jsonl]
+    python civic_admin.py migrate [--status]
+    python civic_admin.py advise-indexes
+"""
+import argparse
+import sys
+
+import civic_assets
+import civic_db
+import civic_journal
+import civic_migrations
+import civic_profiling
+import civic_search
+import civic_store
+
+
+def cmd_backfill_latest_updates(args):
+    written = civic_store.rebuild_latest_updates()
+    print(f"issue_latest_update rebuilt from resolution_history: {written} issues")
+
+
+def cmd_reconcile_counters(args):
+    drift = civic_store.reconcile_status_counts(fix=not args.dry_run)
+    for user_id, status_id, stored, actual in drift:
+        scope = "all users" if user_id == civic_store.ALL_USERS else f"user {user_id}"
+        print(f"{scope:>14}  status {status_id}: counter {stored}, actual {actual}")
+    verb = "found" if args.dry_run else "fixed"
+    print(f"issue_status_counts: {len(drift)} drifted rows {verb}")
+    return 1 if drift and args.dry_run else 0
+
+
+def cmd_rebuild_kpis(args):
+    kpis = civic_store.rebuild_kpis()
+    print("app_kpis rebuilt: " + ", ".join(f"{name}={value}" for name, value in kpis.items()))
+
+
+def cmd_rebuild_rollups(args):
+    for table, written in civic_store.rebuild_rollups().items():
+        print(f"{table} rebuilt from ISSUES: {written} rows")
+
+
+def cmd_rebuild_search(args):
+    indexed = civic_search.rebuild()
+    print(f"issue_search rebuilt from ISSUES and LOCATIONS: {indexed} issues")
+
+
+def cmd_build_assets(args):
+    try:
+        written = civic_assets.build_hero_variants()
+    except RuntimeError as err:
+        print(err, file=sys.stderr)
+        return 1
+    for name, size in written:
+        print(f"{name:>22}  {size / 1024:.0f} KB")
+
+
+def cmd_journal_stats(args):
+    for name, value in civic_journal.stats().items():
+        print(f"{name:>14}  {value}")
+
+
+def cmd_journal_drain(args):
+    # Same work as the app's background drainer, run until nothing is due.
+    # Every queued entry is tried once now; one that fails again backs off
+    # as usual, so the loop ends instead of parking it on the spot.
+    drainer = civic_journal.get_drainer()
+    if args.retry_parked:
+        print(f"submission journal: {drainer.journal.unpark()} parked reports queued again")
+    drainer.journal.retry_now()
+    while drainer.drain_once():
+        pass
+    stats = drainer.stats()
+    print(f"submission journal: {stats['drained']} reports stored, {stats['depth']} still queued, {stats['parked_now']} parked")
+    return 1 if stats['depth'] or stats['parked_now'] else 0
+
+
+def cmd_profile_report(args):
+    # Averages per rerun from the CIVIC_PROFILE=1 log, slowest page first
+    try:
+        pages = civic_profiling.summarize(args.file)
+    except OSError as err:
+        print(f"No profile to report: {err}", file=sys.stderr)
+        return 1
+    sections = civic_profiling.SECTIONS
+    print(f"{'page':<24} {'reruns':>6} {'ms':>8} {'db ms':>8} " + ' '.join(f"{name:>8}" for name in sections) + f" {'rss KB':>8}")
+    for page, totals in sorted(pages.items(), key=lambda item: -item[1]['ms']):
+        print(f"{page:<24} {totals['reruns']:>6} {totals['ms']:>8.1f} {totals['db_ms']:>8.1f} "
+              + ' '.join(f"{totals['sections_ms'].get(name, 0.0):>8.1f}" for name in sections) + f" {totals['rss_delta_kb']:>8.0f}")
+        functions = sorted(totals['functions_ms'].items(), key=lambda item: -item[1])
+        if functions:
+            print(f"{'':<24} " + ", ".join(f"{name} {value:.1f}" for name, value in functions))
+
+
+def cmd_migrate(args):
+    if args.status:
+        for migration, applied_at in civic_migrations.status():
+            print(f"{migration.version:04d}  {migration.name:<28} {applied_at or 'pending'}")
+        return 1 if civic_migrations.pending() else 0
+
+    def progress(migration, statement, skipped):
+        first_line = statement.splitlines()[0]
+        print(f"{migration.version:04d}  {'skip (exists)' if skipped else 'run':<14} {first_line}")
+
+    done = civic_migrations.migrate(progress)
+    print(f"schema_migrations: {len(done)} applied" + (f" ({', '.join(f'{m.version:04d}_{m.name}' for m in done)})" if done else ", already up to date"))
+
+
+def cmd_advise_indexes(args):
+    # Lazy: the advisor imports the app (and with it Streamlit)
+    import civic_advisor
+    advice = civic_advisor.advise(progress=lambda label: print(f"running {label}...", file=sys.stderr))
+    for item in advice:
+        if item.verdict == 'ok':
+            continue
+        timing = f"{item.avg_ms:.1f} ms" if item.avg_ms is not None else "? ms"
+        print(f"{item.verdict:<6} {item.caller}  ({timing})")
+        print(f"       {item.sql if len(item.sql) <= 160 else item.sql[:157] + '...'}")
+        if item.error:
+            print(f"       EXPLAIN failed: {item.error}")
+        for kind, alias, table in item.findings:
+            print(f"       {kind}: {alias} ({table})" if alias and alias != table else f"       {kind}: {table}")
+        for suggestion in item.suggestions:
+            print(f"       consider an index on {suggestion}")
+    counts = {verdict: sum(1 for item in advice if item.verdict == verdict) for verdict in ('CHECK', 'error', 'note', 'ok')}
+    print(f"{len(advice)} statements: " + ", ".join(f"{n} {verdict}" for verdict, n in counts.items()))
+    return 1 if counts['CHECK'] or counts['error'] else 0
+
+
+COMMANDS = {
+    'backfill-latest-updates': (cmd_backfill_latest_updates, "Rebuild issue_latest_update (last updater per issue) from resolution_history"),
+    'reconcile-counters': (cmd_reconcile_counters, "Check issue_status_counts against ISSUES and fix any drift"),
+    'rebuild-kpis': (cmd_rebuild_kpis, "Recompute the home page KPIs (resolution times, citizen count) from history"),
+    'rebuild-rollups': (cmd_rebuild_rollups, "Regenerate the analytics and map rollups (issue_daily_counts, issue_location_counts) from ISSUES"),
+    'rebuild-search': (cmd_rebuild_search, "Re-index every issue for full-text search (issue_search)"),
+    'build-assets': (cmd_build_assets, "Generate the resized/WebP hero image variants in static/ (needs Pillow)"),
+    'journal-stats': (cmd_journal_stats, "Show the submission journal's queue depth, lag and error counters"),
+    'journal-drain': (cmd_journal_drain, "Store every queued submission now (e.g. while the app is stopped)"),
+    'profile-report': (cmd_profile_report, "Summarise the CIVIC_PROFILE=1 rerun profiles per page (time per section, memory)"),
+    'migrate': (cmd_migrate, "Apply pending schema migrations from migrations/<backend>/ (--status lists them)"),
+    'advise-indexes': (cmd_advise_indexes, "EXPLAIN every query the app reads with and flag full scans and sorts"),
+}
+
+# Extra command-line options per command
+OPTIONS = {
+    'reconcile-counters': [(('--dry-run',), {'action': 'store_true', 'help': 'report drift without fixing it'})],
+    'profile-report': [(('--file',), {'help': 'reruns.jsonl to read (default: the one in CIVIC_PROFILE_DIR)'})],
+    'journal-drain': [(('--retry-parked',), {'action': 'store_true', 'help': f'queue reports parked after {civic_journal.MAX_ATTEMPTS} failed attempts again first'})],
+    'migrate': [(('--status',), {'action': 'store_true', 'help': 'list applied and pending migrations without applying any'})],
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Civic portal maintenance commands")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (_, help_text) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        for flags, kwargs in OPTIONS.get(name, []):
+            subparser.add_argument(*flags, **kwargs)
+    args = parser.parse_args(argv)
+
+    try:
+        return COMMANDS[args.command][0](args) or 0
+    except civic_db.DatabaseError as err:
+        print(f"Database error: {err}", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
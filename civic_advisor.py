@@ -0,0 +1,194 @@
+"""Index advisor: the query plan of every SELECT the app runs.
+
+``advise()`` runs the app's read paths once against the configured
+database (the cached loaders in civic_issue with st.cache_data bypassed,
+plus the reference, duplicate and nearby loaders and the sign-in lookup)
+with civic_metrics capturing each distinct statement's plan, then reads
+the plans for full table scans and sorts:
+
+    CHECK  a full scan of a table the statement filters, or a sort of the
+           whole result for a LIMITed page; an index would help
+    note   temporary tables and sorts for GROUP BY or a computed rank, the
+           driving table of a join, and whole-table reads (bulk loads)
+
+For each CHECK it suggests the columns an index would need, taken from the
+statement's equality filters and ORDER BY. The write paths are not run:
+they reach rows by primary key or idempotency key. Nothing is written.
+
+    python civic_admin.py advise-indexes
+"""
+import re
+from collections import namedtuple
+from datetime import date, timedelta
+
+import civic_db
+import civic_metrics
+
+
+# Lookup tables and rollups small enough that scanning them is never a
+# problem (issue_location_counts has a few rows per location)
+SMALL_TABLES = {'STATUS', 'CATEGORIES', 'app_kpis', 'issue_location_counts'}
+
+Advice = namedtuple('Advice', ['verdict', 'caller', 'sql', 'avg_ms', 'findings', 'suggestions', 'error'])
+
+_KEYWORDS = {'ON', 'WHERE', 'LEFT', 'RIGHT', 'INNER', 'OUTER', 'CROSS', 'JOIN', 'GROUP', 'ORDER', 'LIMIT', 'HAVING', 'USING', 'AS', 'SET', 'UNION'}
+_TABLE_REF = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_SQLITE_SCAN = re.compile(r'^SCAN (\w+)$')
+_SQLITE_SORT = re.compile(r'USE TEMP B-TREE FOR (?:\w+ (?:PART|TERM) OF )?(ORDER BY|GROUP BY|DISTINCT)')
+
+
+def _tables(sql):
+    # {alias or table name: table} for the real tables a statement reads
+    tables = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        tables[table] = table
+        if alias and alias.upper() not in _KEYWORDS:
+            tables[alias] = table
+    return tables
+
+
+def findings(sql, plan, backend_name):
+    # [(kind, alias, table)] with kind 'full scan', 'sort' or 'temporary'
+    tables, found = _tables(sql), []
+    for row in plan:
+        if backend_name == 'sqlite':
+            detail = str(row.get('detail', ''))
+            scan = _SQLITE_SCAN.match(detail)
+            if scan and scan.group(1) in tables:
+                found.append(('full scan', scan.group(1), tables[scan.group(1)]))
+            sort = _SQLITE_SORT.search(detail)
+            if sort:
+                found.append(('sort' if sort.group(1) == 'ORDER BY' else 'temporary', None, sort.group(1)))
+        else:
+            alias, extra = str(row.get('table') or ''), str(row.get('Extra') or '')
+            if row.get('type') == 'ALL' and alias in tables:
+                found.append(('full scan', alias, tables[alias]))
+            if 'Using filesort' in extra:
+                found.append(('sort', alias, 'ORDER BY'))
+            if 'Using temporary' in extra:
+                found.append(('temporary', alias, 'GROUP BY'))
+    return [finding for finding in found if finding[0] != 'full scan' or finding[2] not in SMALL_TABLES]
+
+
+def _columns(sql, alias, order=True):
+    # Columns of alias compared with a parameter or literal (= and IN first,
+    # then ranges), then those in ORDER BY. Unqualified columns count when
+    # the statement reads one table.
+    prefix = rf'\b{re.escape(alias)}\.' if len(_tables(sql)) > 1 else r'(?<![\w.])'
+    value = r"(?:%s|'[^']*'|\d+)"
+    patterns = [
+        rf'{prefix}(\w+)\s*(?:=\s*{value}|IN\s*\(\s*{value})',
+        rf'{prefix}(\w+)\s*(?:[<>]=?\s*{value}|BETWEEN\b)',
+    ]
+    if order:
+        patterns.append(rf'ORDER BY\s+{prefix}(\w+)')
+    columns = []
+    for pattern in patterns:
+        for column in re.findall(pattern, sql, re.IGNORECASE):
+            if column not in columns and column.upper() not in _KEYWORDS:
+                columns.append(column)
+    return columns
+
+
+def suggest(sql, alias, table):
+    # The index that would turn a full scan into a range scan, or None
+    columns = _columns(sql, alias)
+    return f"{table} ({', '.join(columns)})" if columns else None
+
+
+def verdict(sql, found):
+    # A full scan is worth an index when the statement filters that table;
+    # scanning the driving table of a join, or a whole table on purpose, is
+    # expected. A sort is worth one when it orders base rows for a page;
+    # sorting the groups of an aggregate, or rows by a computed rank (the
+    # outer ORDER BY is on a derived table), is expected.
+    order = re.findall(r'ORDER BY\s+(?:(\w+)\.)?\w+', sql, re.IGNORECASE)
+    paged = (re.search(r'\bLIMIT\b', sql, re.IGNORECASE) and not re.search(r'\bGROUP BY\b', sql, re.IGNORECASE)
+             and order and (not order[-1] or order[-1] in _tables(sql)))
+    for kind, alias, _ in found:
+        if (kind == 'full scan' and _columns(sql, alias, order=False)) or (kind == 'sort' and paged):
+            return 'CHECK'
+    return 'note' if found else 'ok'
+
+
+def workload():
+    # (label, callable) for every read path, with arguments taken from the data
+    import civic_dedupe
+    import civic_issue
+    import civic_nearby
+    import civic_reference
+    import civic_store
+
+    with civic_db.connection() as conn:
+        user = conn.query("SELECT user_id, email FROM USERS ORDER BY user_id LIMIT 1")
+        issue = conn.query("SELECT issue_id, user_id, category_id, created_at FROM ISSUES ORDER BY issue_id DESC LIMIT 1")
+    user_id = int(issue[0]['user_id']) if issue else (int(user[0]['user_id']) if user else 1)
+    issue_id = int(issue[0]['issue_id']) if issue else 1
+    category_id = int(issue[0]['category_id']) if issue else 1
+    after = (issue[0]['created_at'], issue_id) if issue else None
+    email = user[0]['email'] if user else 'nobody@example.com'
+    today = date.today()
+    month = (today - timedelta(days=29), today)
+
+    return [
+        ('status counts', lambda: civic_issue.get_status_counts.__wrapped__(civic_store.ALL_USERS)),
+        ('home KPIs', civic_issue.get_home_kpis.__wrapped__),
+        ('analytics', lambda: (
+            civic_issue.get_issues_by_category.__wrapped__(*month),
+            civic_issue.get_issues_timeline.__wrapped__(*month),
+            civic_issue.get_issues_by_area.__wrapped__(*month),
+        )),
+        ('live map', lambda: (civic_issue.get_map_clusters.__wrapped__(12), civic_issue.get_map_clusters.__wrapped__(12, status_id=1, severity='High'))),
+        ('citizen issues', lambda: civic_issue.get_user_issues.__wrapped__(user_id)),
+        ('issue history', lambda: (civic_issue.get_issue_history.__wrapped__(issue_id), civic_issue.get_issues_history.__wrapped__((issue_id, issue_id - 1)))),
+        ('staff list', lambda: (
+            civic_issue.get_issues_page.__wrapped__(),
+            civic_issue.get_issues_page.__wrapped__(after=after, sort='DESC'),
+            civic_issue.get_issues_page.__wrapped__(after=after, sort='ASC'),
+            civic_issue.get_issues_page.__wrapped__(status_id=1),
+            civic_issue.get_issues_page.__wrapped__(category_id=category_id),
+            civic_issue.get_issues_page.__wrapped__(severity='High'),
+            civic_issue.get_issues_page.__wrapped__(search=('pothole',)),
+            civic_issue.count_issues.__wrapped__(),
+            civic_issue.count_issues.__wrapped__(status_id=1),
+            civic_issue.count_issues.__wrapped__(category_id=category_id),
+        )),
+        ('reference data', civic_reference.load),
+        ('duplicate detector', civic_dedupe.load),
+        ('nearby index', civic_nearby.load),
+        ('sign-in lookup', lambda: civic_store.get_user_by_email(email)),
+    ]
+
+
+def advise(progress=None):
+    # [Advice], CHECK first. progress, if given, is called with each label.
+    import streamlit.logger
+    # civic_issue is imported without a Streamlit runtime
+    streamlit.logger.set_log_level('error')
+    # The plans are captured through the query instrumentation
+    civic_metrics.ENABLED = True
+    backend, calls = civic_db.get_backend(), workload()
+    with civic_metrics.capture_plans() as plans:
+        for label, func in calls:
+            if progress:
+                progress(label)
+            func()
+    timings = {row['sql']: row['avg_ms'] for row in civic_metrics.top_statements(limit=civic_metrics.MAX_STATEMENTS)}
+
+    advice = []
+    for sql, captured in plans.items():
+        if 'error' in captured:
+            advice.append(Advice('error', captured['caller'], sql, timings.get(sql), [], [], captured['error']))
+            continue
+        found = findings(sql, captured['plan'], backend.name)
+        result = verdict(sql, found)
+        suggestions = []
+        if result == 'CHECK':
+            for kind, alias, table in found:
+                suggestion = suggest(sql, alias, table) if kind == 'full scan' else None
+                if suggestion and suggestion not in suggestions:
+                    suggestions.append(suggestion)
+        advice.append(Advice(result, captured['caller'], sql, timings.get(sql), found, suggestions, None))
+    order = {'CHECK': 0, 'error': 1, 'note': 2, 'ok': 3}
+    advice.sort(key=lambda item: (order[item.verdict], -(item.avg_ms or 0)))
+    return advice
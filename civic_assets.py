@@ -0,0 +1,76 @@
+"""Static assets for the portal UI.
+
+Images are served by Streamlit's static file serving (``static/`` next to the
+app, enabled in ``.streamlit/config.toml``) at ``app/static/<name>``, so the
+browser downloads and caches them once instead of receiving them inlined in
+the page CSS on every rerun. Resized/WebP variants of the hero image are
+generated with ``python civic_admin.py build-assets`` (needs Pillow).
+"""
+import os
+
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+STATIC_URL = 'app/static'
+
+HERO_SOURCE = 'hero-civic.jpg'
+HERO_SOURCE_WIDTH = 1920
+# (file name, max width, format, save options); the CSS picks the smallest
+# one that covers the viewport and prefers WebP where the browser supports it.
+# The 1920px JPEG is the source itself (re-encoding it only made it larger).
+HERO_VARIANTS = [
+    ('hero-civic-960.webp', 960, 'WEBP', {'quality': 80, 'method': 6}),
+    ('hero-civic-960.jpg', 960, 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    ('hero-civic-1920.webp', 1920, 'WEBP', {'quality': 80, 'method': 6}),
+]
+# Breakpoint below which the 960px variants are used
+HERO_SMALL_MAX_WIDTH = 960
+
+HERO_FALLBACK_CSS = "linear-gradient(135deg, hsl(222 47% 31%), hsl(221 83% 53%))"
+
+
+def build_hero_variants(static_dir=STATIC_DIR):
+    # Writes HERO_VARIANTS next to the source image. Returns
+    # [(file name, bytes)] for what was written.
+    try:
+        from PIL import Image
+    except ImportError:
+        raise RuntimeError("Pillow is required to build image variants: pip install Pillow")
+
+    written = []
+    with Image.open(os.path.join(static_dir, HERO_SOURCE)) as source:
+        source = source.convert('RGB')
+        for name, max_width, image_format, options in HERO_VARIANTS:
+            image = source
+            if source.width > max_width:
+                image = source.resize((max_width, round(source.height * max_width / source.width)), Image.LANCZOS)
+            path = os.path.join(static_dir, name)
+            image.save(path, image_format, **options)
+            written.append((name, os.path.getsize(path)))
+    return written
+
+
+def _hero_image_set(width, static_dir):
+    candidates = [
+        (name, 'image/webp' if image_format == 'WEBP' else 'image/jpeg')
+        for name, max_width, image_format, _ in HERO_VARIANTS
+        if max_width == width and os.path.exists(os.path.join(static_dir, name))
+    ]
+    if width == HERO_SOURCE_WIDTH and os.path.exists(os.path.join(static_dir, HERO_SOURCE)):
+        candidates.append((HERO_SOURCE, 'image/jpeg'))
+    if not candidates:
+        return None
+    plain = next((name for name, mime in candidates if mime == 'image/jpeg'), candidates[0][0])
+    image_set = ", ".join(f"url('{STATIC_URL}/{name}') type('{mime}')" for name, mime in candidates)
+    # Plain url() first for browsers without image-set() type() support
+    return f"background-image: url('{STATIC_URL}/{plain}'); background-image: image-set({image_set});"
+
+
+def hero_background_css(static_dir=STATIC_DIR):
+    # Declarations for .hero-section: static URLs only, never the image
+    # bytes, so the page CSS stays a few KB and identical across reruns
+    large = _hero_image_set(HERO_SOURCE_WIDTH, static_dir)
+    if large is None:
+        return f"background-image: {HERO_FALLBACK_CSS};", ""
+    small = _hero_image_set(HERO_SMALL_MAX_WIDTH, static_dir)
+    media = f"@media (max-width: {HERO_SMALL_MAX_WIDTH}px) {{ .hero-section {{ {small} }} }}" if small else ""
+    return large, media
@@ -0,0 +1,183 @@
+"""Password hashing and sign-in.
+
+Passwords are stored as salted scrypt hashes::
+
+    scrypt$<n>$<r>$<p>$<salt b64>$<hash b64>
+
+scrypt is deliberately slow and memory-hard (n=2**14, r=8 costs ~16 MB and
+tens of milliseconds per hash), so hashing runs in a bounded thread pool
+(hashlib.scrypt releases the GIL): a burst of sign-ins uses at most
+CIVIC_AUTH_WORKERS cores and that many hash buffers, the other sessions'
+reruns keep going, and once CIVIC_AUTH_MAX_PENDING sign-ins are queued
+further ones fail fast with AuthBusy instead of piling up.
+
+Accounts created before this module stored an unsalted SHA-256 hex digest.
+Those still verify, and are re-hashed with scrypt on the first successful
+sign-in, as are hashes made with older cost settings. A re-hash that fails
+(say USERS.password_hash is still too narrow for it; migration 0003 widens
+it) is logged and the sign-in goes ahead with the old hash.
+
+Settings: CIVIC_SCRYPT_N (16384), CIVIC_SCRYPT_R (8), CIVIC_SCRYPT_P (1),
+CIVIC_AUTH_WORKERS (4), CIVIC_AUTH_MAX_PENDING (64), CIVIC_AUTH_TIMEOUT
+(10 seconds).
+"""
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import civic_db
+import civic_store
+
+
+SCRYPT_N = int(os.environ.get('CIVIC_SCRYPT_N', '16384'))
+SCRYPT_R = int(os.environ.get('CIVIC_SCRYPT_R', '8'))
+SCRYPT_P = int(os.environ.get('CIVIC_SCRYPT_P', '1'))
+WORKERS = int(os.environ.get('CIVIC_AUTH_WORKERS', '4'))
+MAX_PENDING = int(os.environ.get('CIVIC_AUTH_MAX_PENDING', '64'))
+TIMEOUT = float(os.environ.get('CIVIC_AUTH_TIMEOUT', '10'))
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+SCHEME = 'scrypt'
+
+_LEGACY_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+log = logging.getLogger(__name__)
+
+
+class AuthBusy(Exception):
+    pass
+
+
+def _b64(raw):
+    return base64.b64encode(raw).decode('ascii')
+
+
+def _scrypt(password, salt, n, r, p):
+    # maxmem leaves room for the 128*n*r buffer plus OpenSSL's overhead
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p + 1024 * 1024, dklen=KEY_BYTES)
+
+
+def make_hash(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    # Runs on the calling thread; app code goes through hash_password()
+    salt = os.urandom(SALT_BYTES)
+    return f"{SCHEME}${n}${r}${p}${_b64(salt)}${_b64(_scrypt(password, salt, n, r, p))}"
+
+
+def check_hash(password, stored):
+    # (matches, needs_rehash). Runs on the calling thread.
+    stored = stored or ''
+    if _LEGACY_SHA256.match(stored):
+        digest = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(digest, stored), True
+    # A malformed hash (bad fields, or cost parameters scrypt rejects) just
+    # does not match
+    try:
+        scheme, n, r, p, salt, expected = stored.split('$')
+        if scheme != SCHEME:
+            return False, False
+        n, r, p = int(n), int(r), int(p)
+        salt, expected = base64.b64decode(salt), base64.b64decode(expected)
+        matches = hmac.compare_digest(_scrypt(password, salt, n, r, p), expected)
+    except (ValueError, OverflowError, MemoryError):
+        return False, False
+    return matches, (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+# A valid hash to check against when the email is unknown, so a miss takes
+# as long as a wrong password and does not reveal which emails exist
+_DUMMY_HASH = None
+
+
+def _dummy_hash():
+    global _DUMMY_HASH
+    if _DUMMY_HASH is None:
+        _DUMMY_HASH = make_hash('')
+    return _DUMMY_HASH
+
+
+# --- WORKER POOL ---
+
+_pool = None
+_pool_lock = threading.Lock()
+_stats_lock = threading.Lock()
+# 'pending' counts hashes queued or running in the pool
+_stats = {'pending': 0, 'hashed': 0, 'verified': 0, 'rehashed': 0, 'rehash_failed': 0, 'rejected_busy': 0}
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='civic-auth')
+    return _pool
+
+
+def _run(func, *args):
+    # Runs func in the pool and waits for it; raises AuthBusy when the
+    # queue is full or the work does not finish within TIMEOUT
+    with _stats_lock:
+        if _stats['pending'] >= MAX_PENDING:
+            _stats['rejected_busy'] += 1
+            raise AuthBusy("Too many sign-ins right now; please try again in a moment.")
+        _stats['pending'] += 1
+    try:
+        future = _get_pool().submit(func, *args)
+    except BaseException:
+        _count('pending', -1)
+        raise
+    future.add_done_callback(lambda _: _count('pending', -1))
+    try:
+        return future.result(timeout=TIMEOUT)
+    except FutureTimeout:
+        raise AuthBusy("Sign-in is taking too long; please try again in a moment.") from None
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    result.update(workers=WORKERS, max_pending=MAX_PENDING)
+    return result
+
+
+def hash_password(password):
+    hashed = _run(make_hash, password)
+    _count('hashed')
+    return hashed
+
+
+def verify_password(password, stored):
+    result = _run(check_hash, password, stored)
+    _count('verified')
+    return result
+
+
+def authenticate(email, password, role):
+    # The user row (without the hash) when email, password and role match,
+    # else None. Raises AuthBusy or civic_db.DatabaseError.
+    user = civic_store.get_user_by_email(email)
+    stored = user['password_hash'] if user else _dummy_hash()
+    matches, needs_rehash = verify_password(password, stored)
+    if not user or not matches or user['role'] != role:
+        return None
+    if needs_rehash:
+        # Compare-and-set, so a concurrent password change wins. The password
+        # is already verified, so a failure here must not fail the sign-in.
+        try:
+            if civic_store.update_password_hash(user['user_id'], stored, hash_password(password)):
+                _count('rehashed')
+        except (civic_db.DatabaseError, AuthBusy) as err:
+            _count('rehash_failed')
+            log.warning("Could not re-hash the password of user %s: %s", user['user_id'], err)
+    return {key: value for key, value in user.items() if key != 'password_hash'}
@@ -0,0 +1,45 @@
+"""Entity-scoped cache versions for the Streamlit data functions.
+
+Cached data functions take a ``cache_version`` argument that callers fill in
+from ``version(scope)``. Writers ``bump()`` only the scopes they touched, so
+the next call misses the cache for that entity while everything else (for
+example the hour-long reference data caches) stays warm. Entries for old
+versions simply age out through the function's ttl/max_entries.
+
+Like st.cache_data itself the versions are per process.
+"""
+import threading
+
+
+# All-issue aggregates: statistics, analytics charts, the staff issue list
+ISSUES = 'issues'
+# Locations, categories and statuses
+REFERENCE = 'reference'
+
+
+def user(user_id):
+    # Everything shown on one citizen's dashboard
+    return ('user', int(user_id))
+
+
+def issue(issue_id):
+    # One issue's detail/history
+    return ('issue', int(issue_id))
+
+
+_versions = {}
+_lock = threading.Lock()
+
+
+def version(scope):
+    return _versions.get(scope, 0)
+
+
+def versions(scopes):
+    return tuple(_versions.get(scope, 0) for scope in scopes)
+
+
+def bump(*scopes):
+    with _lock:
+        for scope in scopes:
+            _versions[scope] = _versions.get(scope, 0) + 1
@@ -0,0 +1,686 @@
+"""Process-wide database access for the civic portal.
+
+Streamlit re-executes ``civic_issue.py`` on every rerun, so anything that has
+to outlive a single rerun (the storage backend, its connection pool and the
+pool metrics) lives in this imported module instead.
+
+The app always writes MySQL-flavoured SQL with ``%s`` placeholders. Each
+backend translates that into its own dialect, so the same queries run against
+a MySQL server or an embedded SQLite file.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import lru_cache
+
+import civic_metrics
+
+
+# --- CONFIGURATION (environment) ---
+#   CIVIC_DB_BACKEND            mysql (default) | sqlite
+#   CIVIC_DB_HOST / _PORT / _USER / _PASSWORD / _NAME   MySQL settings
+#   CIVIC_SQLITE_PATH           SQLite database file (":memory:" for a throwaway DB)
+#   CIVIC_DB_POOL_SIZE / _TIMEOUT / _PING_AFTER          pool tuning
+
+def _env(name, default):
+    return os.environ.get(name, default)
+
+
+DB_BACKEND = _env('CIVIC_DB_BACKEND', 'mysql').strip().lower()
+
+MYSQL_CONFIG = {
+    'host': _env('CIVIC_DB_HOST', 'localhost'),
+    'port': int(_env('CIVIC_DB_PORT', '3306')),
+    'user': _env('CIVIC_DB_USER', 'root'),
+    'password': _env('CIVIC_DB_PASSWORD', ''),
+    'database': _env('CIVIC_DB_NAME', 'final_dcdsl_project'),
+}
+
+SQLITE_PATH = _env('CIVIC_SQLITE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'civic.sqlite3'))
+
+POOL_SIZE = int(_env('CIVIC_DB_POOL_SIZE', '8'))
+# How long a caller waits for a free connection before giving up (seconds)
+POOL_TIMEOUT = float(_env('CIVIC_DB_POOL_TIMEOUT', '10'))
+# Idle connections older than this are pinged before being handed out (seconds)
+POOL_PING_AFTER = float(_env('CIVIC_DB_POOL_PING_AFTER', '30'))
+
+
+class DatabaseError(Exception):
+    pass
+
+
+class PoolTimeout(DatabaseError):
+    pass
+
+
+# --- BACKENDS ---
+
+# Tables the app maintains itself (derived data kept in step by the write
+# paths in civic_store). The DDL is valid for both MySQL and SQLite and is
+# applied once per process on the first connection.
+APP_TABLES = [
+    # Last status change per issue, so listings don't have to rank the whole
+    # resolution_history table to find it.
+    """
+    CREATE TABLE IF NOT EXISTS issue_latest_update (
+        issue_id INT NOT NULL PRIMARY KEY,
+        changed_by INT NOT NULL,
+        changed_at DATETIME NOT NULL
+    )
+    """,
+    # Issue counts per status, globally (user_id = 0) and per reporter, kept
+    # in step by submit/status-change transactions so stats are a key lookup.
+    """
+    CREATE TABLE IF NOT EXISTS issue_status_counts (
+        user_id INT NOT NULL,
+        status_id INT NOT NULL,
+        issue_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, status_id)
+    )
+    """,
+    # When each issue first reached Resolved/Closed, recorded once by the
+    # status-change transaction for the home page's average resolution time.
+    """
+    CREATE TABLE IF NOT EXISTS issue_first_resolution (
+        issue_id INT NOT NULL PRIMARY KEY,
+        resolved_at DATETIME NOT NULL,
+        resolution_seconds BIGINT NOT NULL
+    )
+    """,
+    # Running totals behind the public home page KPIs (see civic_store.KPI_*)
+    """
+    CREATE TABLE IF NOT EXISTS app_kpis (
+        name VARCHAR(40) NOT NULL PRIMARY KEY,
+        value BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    # Issues created per day by current status, category and location: the
+    # Analytics tab aggregates this instead of scanning ISSUES.
+    """
+    CREATE TABLE IF NOT EXISTS issue_daily_counts (
+        stat_date DATE NOT NULL,
+        status_id INT NOT NULL,
+        category_id INT NOT NULL,
+        location_id INT NOT NULL,
+        issue_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (stat_date, status_id, category_id, location_id)
+    )
+    """,
+    # Idempotency keys of stored submissions, so a retried batch from the
+    # submission journal cannot create the same issue twice
+    """
+    CREATE TABLE IF NOT EXISTS issue_submissions (
+        idempotency_key VARCHAR(64) PRIMARY KEY,
+        issue_id INT NOT NULL,
+        submitted_at DATETIME NOT NULL
+    )
+    """,
+    # Issues per location by current status and severity: the Live Map
+    # clusters these rows instead of individual issues
+    """
+    CREATE TABLE IF NOT EXISTS issue_location_counts (
+        location_id INT NOT NULL,
+        status_id INT NOT NULL,
+        severity VARCHAR(10) NOT NULL,
+        issue_count INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (location_id, status_id, severity)
+    )
+    """,
+    # Migrations from migrations/<backend>/ already applied (see civic_migrations)
+    """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT NOT NULL PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        applied_at DATETIME NOT NULL
+    )
+    """,
+    # Likely duplicate found when an issue was submitted (see civic_dedupe)
+    """
+    CREATE TABLE IF NOT EXISTS issue_duplicate_candidates (
+        issue_id INT PRIMARY KEY,
+        master_issue_id INT NOT NULL,
+        similarity FLOAT NOT NULL,
+        distance_m FLOAT NOT NULL,
+        detected_at DATETIME NOT NULL
+    )
+    """,
+]
+
+
+class Backend:
+    name = None
+    # Driver exception types that get re-raised as DatabaseError
+    errors = ()
+    # Pool size the backend can actually make use of (None = no limit)
+    max_connections = None
+
+    def __init__(self):
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def connect(self):
+        conn = self._connect()
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    self.ensure_schema(conn)
+                    self._schema_ready = True
+        return conn
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def ping(self, conn):
+        raise NotImplementedError
+
+    def translate(self, sql):
+        return sql
+
+    def cursor(self, conn):
+        return conn.cursor()
+
+    def begin(self, conn):
+        # Start a write transaction explicitly (needed before locking reads)
+        pass
+
+    # Prepended to a SELECT to get its query plan (see civic_metrics)
+    explain_prefix = "EXPLAIN "
+
+    def index_exists(self, conn, table, index):
+        # conn is a Connection; MySQL has no CREATE INDEX IF NOT EXISTS
+        rows = conn.query(
+            "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+            (table, index),
+        )
+        return bool(rows)
+
+    def increment_sql(self, table, key_columns, count_column):
+        # Upsert that adds to count_column, creating the row if needed
+        columns = ', '.join(list(key_columns) + [count_column])
+        placeholders = ', '.join(['%s'] * (len(key_columns) + 1))
+        return (
+            f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+            f"ON DUPLICATE KEY UPDATE {count_column} = {count_column} + VALUES({count_column})"
+        )
+
+    def ensure_schema(self, conn):
+        cursor = conn.cursor()
+        try:
+            for ddl in APP_TABLES + [self.search_ddl]:
+                cursor.execute(ddl)
+            conn.commit()
+        finally:
+            cursor.close()
+
+    # --- Full-text search (see civic_search) ---
+    # One issue_search row per issue: its description, area and address.
+
+    search_ddl = """
+    CREATE TABLE IF NOT EXISTS issue_search (
+        issue_id INT PRIMARY KEY,
+        body TEXT NOT NULL,
+        FULLTEXT KEY issue_search_body (body)
+    ) ENGINE=InnoDB
+    """
+    search_upsert_sql = "REPLACE INTO issue_search (issue_id, body) VALUES (%s, %s)"
+    # The issue id as seen through search_join; ordering by it lets the
+    # index return the newest matches first
+    search_key = "fts.issue_id"
+
+    def search_join(self, issue_column):
+        return f"JOIN issue_search fts ON fts.issue_id = {issue_column}"
+
+    # Shorter words are not in the FULLTEXT index (innodb_ft_min_token_size)
+    search_min_token = 3
+
+    def search_condition(self, terms):
+        # (SQL, params) matching documents that contain every term. Short
+        # terms can't be required through the index, so they are matched with
+        # LIKE on the same rows; a query of only short terms is a LIKE scan
+        # bounded by the rank window.
+        clauses, params = [], []
+        indexed = [term for term in terms if len(term) >= self.search_min_token]
+        if indexed:
+            clauses.append("MATCH(fts.body) AGAINST (%s IN BOOLEAN MODE)")
+            params.append(' '.join(f"+{term}*" for term in indexed))
+        for term in terms:
+            if len(term) < self.search_min_token:
+                clauses.append("fts.body LIKE %s")
+                params.append('%' + term.replace('_', '\\_') + '%')
+        return ' AND '.join(clauses), params
+
+    def search_relevance(self, terms):
+        # (SQL, params) for a score where higher is more relevant; only the
+        # indexed terms score, so short-only queries rank by recency
+        indexed = [term for term in terms if len(term) >= self.search_min_token]
+        if not indexed:
+            return "0", []
+        return "MATCH(fts.body) AGAINST (%s IN BOOLEAN MODE)", [' '.join(f"+{term}*" for term in indexed)]
+
+
+class MySQLBackend(Backend):
+    name = 'mysql'
+
+    def __init__(self, config=None):
+        super().__init__()
+        import mysql.connector
+        self._driver = mysql.connector
+        self.config = dict(config or MYSQL_CONFIG)
+        self.errors = (mysql.connector.Error,)
+
+    def _connect(self):
+        return self._driver.connect(**self.config)
+
+    def ping(self, conn):
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except self._driver.Error:
+            return False
+
+
+# MySQL functions/clauses that SQLite spells differently
+_PLACEHOLDER = re.compile(r"%s")
+_CURDATE_INTERVAL = re.compile(r"CURDATE\(\)\s*-\s*INTERVAL\s+(\d+|%s)\s+DAY", re.IGNORECASE)
+_TIMESTAMPDIFF = re.compile(r"TIMESTAMPDIFF\(\s*(SECOND|MINUTE|HOUR|DAY|WEEK|MONTH|YEAR)\s*,", re.IGNORECASE)
+_FOR_UPDATE = re.compile(r"\s+FOR\s+UPDATE\b", re.IGNORECASE)
+_INSERT_IGNORE = re.compile(r"\bINSERT\s+IGNORE\b", re.IGNORECASE)
+
+_UNIT_SECONDS = {'SECOND': 1, 'MINUTE': 60, 'HOUR': 3600, 'DAY': 86400, 'WEEK': 604800}
+
+
+def to_datetime(value):
+    # Normalises DATETIME values from either driver (and computed columns,
+    # which SQLite returns as text) to datetime
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(str(value))
+
+
+def _sqlite_timestampdiff(unit, start, end):
+    # Same truncation rules as MySQL's TIMESTAMPDIFF(unit, start, end)
+    start, end = to_datetime(start), to_datetime(end)
+    if start is None or end is None:
+        return None
+    unit = unit.upper()
+    if unit in _UNIT_SECONDS:
+        return int((end - start).total_seconds() / _UNIT_SECONDS[unit])
+    months = (end.year - start.year) * 12 + end.month - start.month
+    end_rest = (end.day, end.time())
+    start_rest = (start.day, start.time())
+    if months > 0 and end_rest < start_rest:
+        months -= 1
+    elif months < 0 and end_rest > start_rest:
+        months += 1
+    return months if unit == 'MONTH' else int(months / 12)
+
+
+def _sqlite_now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _sqlite_curdate():
+    return date.today().isoformat()
+
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+sqlite3.register_converter('DATETIME', lambda raw: datetime.fromisoformat(raw.decode()))
+sqlite3.register_converter('DATE', lambda raw: date.fromisoformat(raw.decode()))
+
+
+# Versioned SQL lives in migrations/<backend>/ (see civic_migrations); the
+# SQLite base schema is also applied on connect so a new file just works
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+with open(os.path.join(MIGRATIONS_DIR, 'sqlite', '0001_base_schema.sql'), encoding='utf-8') as _schema:
+    SQLITE_SCHEMA = _schema.read()
+
+
+class SQLiteBackend(Backend):
+    name = 'sqlite'
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path=None):
+        super().__init__()
+        if sqlite3.sqlite_version_info < (3, 25, 0):
+            # civic_store.rebuild_latest_updates relies on ROW_NUMBER() OVER (...)
+            raise DatabaseError(f"SQLite {sqlite3.sqlite_version} has no window functions; 3.25+ is required")
+        self.path = path or SQLITE_PATH
+        if self.path == ':memory:':
+            # Every connection to :memory: is a separate database, so the
+            # pool must keep exactly one.
+            self.max_connections = 1
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=30,
+            isolation_level='IMMEDIATE',
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA foreign_keys = ON")
+        if self.path != ':memory:':
+            conn.execute("PRAGMA journal_mode = WAL")
+        conn.create_function('NOW', 0, _sqlite_now)
+        conn.create_function('CURDATE', 0, _sqlite_curdate)
+        conn.create_function('TIMESTAMPDIFF', 3, _sqlite_timestampdiff)
+        return conn
+
+    def ping(self, conn):
+        try:
+            conn.execute("SELECT 1")
+            return True
+        except sqlite3.Error:
+            return False
+
+    explain_prefix = "EXPLAIN QUERY PLAN "
+
+    def index_exists(self, conn, table, index):
+        return bool(conn.query("SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s", (table, index)))
+
+    def translate(self, sql):
+        return _translate_for_sqlite(sql)
+
+    def begin(self, conn):
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+
+    def ensure_schema(self, conn):
+        conn.executescript(SQLITE_SCHEMA)
+        super().ensure_schema(conn)
+
+    # FTS5 with the Porter stemmer, keyed by rowid = issue_id. The MATCH
+    # operand and bm25() need the table name; an alias does not work there.
+    search_ddl = "CREATE VIRTUAL TABLE IF NOT EXISTS issue_search USING fts5(body, tokenize='porter unicode61')"
+    search_upsert_sql = "INSERT OR REPLACE INTO issue_search (rowid, body) VALUES (%s, %s)"
+    search_key = "issue_search.rowid"
+
+    def search_join(self, issue_column):
+        return f"JOIN issue_search ON issue_search.rowid = {issue_column}"
+
+    def search_condition(self, terms):
+        # Quoted prefix terms, implicitly ANDed
+        return "issue_search MATCH %s", [' '.join(f'"{term}"*' for term in terms)]
+
+    def search_relevance(self, terms):
+        return "-bm25(issue_search)", []
+
+    def increment_sql(self, table, key_columns, count_column):
+        columns = ', '.join(list(key_columns) + [count_column])
+        placeholders = ', '.join(['%s'] * (len(key_columns) + 1))
+        return (
+            f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {count_column} = {count_column} + excluded.{count_column}"
+        )
+
+
+@lru_cache(maxsize=512)
+def _translate_for_sqlite(sql):
+    sql = _CURDATE_INTERVAL.sub(
+        lambda m: "DATE(CURDATE(), '-' || ? || ' day')" if m.group(1) == '%s' else f"DATE(CURDATE(), '-{m.group(1)} day')",
+        sql,
+    )
+    sql = _TIMESTAMPDIFF.sub(lambda m: f"TIMESTAMPDIFF('{m.group(1).upper()}',", sql)
+    sql = _FOR_UPDATE.sub('', sql)
+    sql = _INSERT_IGNORE.sub('INSERT OR IGNORE', sql)
+    return _PLACEHOLDER.sub('?', sql)
+
+
+BACKENDS = {'mysql': MySQLBackend, 'sqlite': SQLiteBackend}
+
+
+def create_backend(name=None):
+    name = name or DB_BACKEND
+    if name not in BACKENDS:
+        raise DatabaseError(f"Unknown CIVIC_DB_BACKEND '{name}' (expected one of: {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
+
+
+# --- CONNECTION WRAPPER ---
+# Hides driver differences (placeholders, dict rows, exception types) from
+# the app; every statement goes through backend.translate().
+
+class Connection:
+    def __init__(self, backend, raw):
+        self.backend = backend
+        self.raw = raw
+
+    @contextmanager
+    def _cursor(self):
+        try:
+            cursor = self.backend.cursor(self.raw)
+        except self.backend.errors as err:
+            raise DatabaseError(str(err)) from err
+        try:
+            yield cursor
+        except self.backend.errors as err:
+            raise DatabaseError(str(err)) from err
+        finally:
+            cursor.close()
+
+    def _timed(self, sql, run, count, explain=None):
+        # Runs the statement and reports it to civic_metrics
+        if not civic_metrics.ENABLED:
+            return run()
+        started = time.perf_counter()
+        try:
+            result = run()
+        except DatabaseError as err:
+            civic_metrics.record(sql, time.perf_counter() - started, error=err)
+            raise
+        civic_metrics.record(sql, time.perf_counter() - started, count(result), explain=explain)
+        return result
+
+    def _fetch(self, sql, params):
+        with self._cursor() as cursor:
+            cursor.execute(self.backend.translate(sql), params or ())
+            if cursor.description is None:
+                return []
+            columns = [col[0] for col in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def query(self, sql, params=None):
+        return self._timed(sql, lambda: self._fetch(sql, params), len, explain=lambda: self.plan(sql, params))
+
+    def execute(self, sql, params=None):
+        # Returns (rowcount, lastrowid)
+        def run():
+            with self._cursor() as cursor:
+                cursor.execute(self.backend.translate(sql), params or ())
+                return cursor.rowcount, cursor.lastrowid
+        return self._timed(sql, run, lambda result: max(result[0], 0))
+
+    def executemany(self, sql, seq_of_params):
+        def run():
+            with self._cursor() as cursor:
+                cursor.executemany(self.backend.translate(sql), seq_of_params)
+                return cursor.rowcount
+        return self._timed(sql, run, lambda rowcount: max(rowcount, 0))
+
+    def plan(self, sql, params=None):
+        # The backend's query plan for a SELECT, as a list of row dicts
+        # (not itself recorded in civic_metrics)
+        return self._fetch(self.backend.explain_prefix + sql, params)
+
+    def increment(self, table, key_columns, count_column, deltas):
+        # deltas: {key_tuple: amount}; zero deltas are skipped
+        rows = [tuple(key) + (amount,) for key, amount in deltas.items() if amount]
+        if rows:
+            self.executemany(self.backend.increment_sql(table, key_columns, count_column), rows)
+
+    def begin(self):
+        try:
+            self.backend.begin(self.raw)
+        except self.backend.errors as err:
+            raise DatabaseError(str(err)) from err
+
+    def commit(self):
+        try:
+            self.raw.commit()
+        except self.backend.errors as err:
+            raise DatabaseError(str(err)) from err
+
+    def rollback(self):
+        try:
+            self.raw.rollback()
+        except self.backend.errors as err:
+            raise DatabaseError(str(err)) from err
+
+
+# --- CONNECTION POOL ---
+
+class ConnectionPool:
+    def __init__(self, backend, size=POOL_SIZE, timeout=POOL_TIMEOUT, ping_after=POOL_PING_AFTER):
+        self.backend = backend
+        if backend.max_connections:
+            size = min(size, backend.max_connections)
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._idle = []  # list of (connection, last_used_monotonic)
+        self._open = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'created': 0,
+            'reconnects': 0,
+            'discarded': 0,
+            'wait_seconds': 0.0,
+        }
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        with self._cond:
+            while not self._idle and self._open >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout:.1f}s (pool size {self.size})")
+                if not waited:
+                    self._stats['waits'] += 1
+                    waited = True
+                started = time.monotonic()
+                self._cond.wait(remaining)
+                self._stats['wait_seconds'] += time.monotonic() - started
+            self._stats['checkouts'] += 1
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                conn, last_used = None, None
+                self._open += 1
+
+        # Connecting and pinging happen outside the lock so a slow server
+        # doesn't block callers that could be served from the idle list.
+        try:
+            if conn is not None and time.monotonic() - last_used > self.ping_after and not self.backend.ping(conn):
+                self._close_quietly(conn)
+                conn = None
+                with self._cond:
+                    self._stats['reconnects'] += 1
+            if conn is None:
+                conn = self.backend.connect()
+                with self._cond:
+                    self._stats['created'] += 1
+            return conn
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn, discard=False):
+        if not discard:
+            try:
+                # End whatever transaction the caller left open so the next
+                # user doesn't read from a stale REPEATABLE READ snapshot.
+                conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            if discard:
+                self._open -= 1
+                self._stats['discarded'] += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(size=self.size, open=self._open, idle=len(self._idle), in_use=self._open - len(self._idle))
+        return stats
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def use_backend(backend, pool_size=None):
+    # Swap the process-wide backend (benchmarks and scripts use this to
+    # point the app at a scratch database).
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(backend, size=pool_size or POOL_SIZE)
+    return _pool
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(create_backend())
+    return _pool
+
+
+def get_backend():
+    return get_pool().backend
+
+
+@contextmanager
+def connection():
+    pool = get_pool()
+    started = time.perf_counter()
+    try:
+        raw = pool.acquire()
+    except pool.backend.errors as err:
+        raise DatabaseError(f"DB Connect Error: {err}") from err
+    finally:
+        civic_metrics.record_acquire(time.perf_counter() - started)
+    try:
+        yield Connection(pool.backend, raw)
+    finally:
+        # A connection that can't roll back is broken and gets discarded
+        pool.release(raw)
+
+
+def pool_stats():
+    return get_pool().stats()
@@ -0,0 +1,192 @@
+"""Duplicate-report detection for new submissions.
+
+A new report is compared with the *open* issues (Pending / In-Progress) of
+the same category whose location lies within CIVIC_DEDUPE_RADIUS_M. Both
+sides of the comparison come from an index, so a check costs roughly the
+number of nearby, similar issues rather than the number of open issues:
+
+* a GridIndex per category for the radius search (civic_spatial)
+* MinHash signatures of the descriptions (character 3-grams) bucketed by
+  LSH bands, so only reports that share a band with the new one are scored
+
+The best candidate above CIVIC_DEDUPE_SUGGEST similarity is recorded as a
+suggestion; in ``auto`` mode (CIVIC_DEDUPE_MODE) one above CIVIC_DEDUPE_AUTO
+is linked outright (master_issue_id + Duplicate status).
+
+The index lives in process memory, is built from the database on first use
+and kept current by civic_store's write paths; it is rebuilt every
+CIVIC_DEDUPE_TTL seconds to pick up changes made by other processes.
+"""
+import os
+import re
+import threading
+import time
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+import civic_db
+import civic_reference
+import civic_spatial
+
+
+MODE = os.environ.get('CIVIC_DEDUPE_MODE', 'suggest')  # off | suggest | auto
+RADIUS_M = float(os.environ.get('CIVIC_DEDUPE_RADIUS_M', '150'))
+SUGGEST_SIMILARITY = float(os.environ.get('CIVIC_DEDUPE_SUGGEST', '0.5'))
+AUTO_LINK_SIMILARITY = float(os.environ.get('CIVIC_DEDUPE_AUTO', '0.8'))
+INDEX_TTL = float(os.environ.get('CIVIC_DEDUPE_TTL', '300'))
+
+OPEN_STATUS_IDS = (1, 2)
+
+# 64 hash functions in 16 bands of 4 rows: two descriptions with Jaccard
+# similarity s share at least one band with probability 1 - (1 - s^4)^16,
+# i.e. ~50% at s=0.4, ~96% at s=0.6 and >99.9% at s=0.8
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+SHINGLE = 3
+
+# Fixed seed: signatures must be comparable across processes and restarts
+_rng = np.random.default_rng(20240607)
+_A = _rng.integers(1, 2 ** 32 - 1, size=NUM_HASHES, dtype=np.uint64)
+_B = _rng.integers(0, 2 ** 31, size=NUM_HASHES, dtype=np.uint64)
+_PRIME = np.uint64(4294967291)  # largest prime below 2^32; keeps A*h + B inside uint64
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+Match = namedtuple('Match', ['issue_id', 'similarity', 'distance_m'])
+
+
+def shingles(text):
+    text = _NON_WORD.sub(' ', str(text).lower()).strip()
+    if len(text) <= SHINGLE:
+        return {text}
+    return {text[i:i + SHINGLE] for i in range(len(text) - SHINGLE + 1)}
+
+
+def signature(text):
+    hashes = np.fromiter((zlib.crc32(s.encode()) for s in shingles(text)), dtype=np.uint64)
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def similarity(sig_a, sig_b):
+    # Estimated Jaccard similarity of the two shingle sets
+    return float(np.count_nonzero(sig_a == sig_b)) / NUM_HASHES
+
+
+def _band_keys(category_id, sig):
+    return [(category_id, band, sig[band * ROWS:(band + 1) * ROWS].tobytes()) for band in range(BANDS)]
+
+
+class DuplicateDetector:
+    # Thread-safe; every method takes the lock for the little work it does
+
+    def __init__(self, radius_m=RADIUS_M, min_similarity=SUGGEST_SIMILARITY):
+        self.radius_m = radius_m
+        self.min_similarity = min_similarity
+        self.built_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._issues = {}   # issue_id -> (category_id, signature)
+        self._grids = {}    # category_id -> GridIndex
+        self._buckets = {}  # (category_id, band, band bytes) -> {issue_id}
+
+    def __len__(self):
+        return len(self._issues)
+
+    def add(self, issue_id, category_id, lat, lon, description, sig=None):
+        if lat is None or lon is None:
+            return
+        sig = signature(description) if sig is None else sig
+        with self._lock:
+            self._remove(issue_id)
+            self._issues[issue_id] = (category_id, sig)
+            grid = self._grids.get(category_id)
+            if grid is None:
+                grid = self._grids[category_id] = civic_spatial.GridIndex(cell_m=max(self.radius_m, 50.0))
+            grid.add(issue_id, lat, lon)
+            for key in _band_keys(category_id, sig):
+                self._buckets.setdefault(key, set()).add(issue_id)
+
+    def remove(self, issue_ids):
+        with self._lock:
+            for issue_id in issue_ids:
+                self._remove(issue_id)
+
+    def _remove(self, issue_id):
+        entry = self._issues.pop(issue_id, None)
+        if entry is None:
+            return
+        category_id, sig = entry
+        self._grids[category_id].remove(issue_id)
+        for key in _band_keys(category_id, sig):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(issue_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def check(self, category_id, lat, lon, description, sig=None):
+        # The most similar open issue nearby, or None
+        if lat is None or lon is None:
+            return None
+        sig = signature(description) if sig is None else sig
+        with self._lock:
+            similar = set()
+            for key in _band_keys(category_id, sig):
+                similar |= self._buckets.get(key, set())
+            if not similar:
+                return None
+            grid = self._grids.get(category_id)
+            nearby = grid.within(lat, lon, self.radius_m) if grid is not None else []
+            best = None
+            for distance, issue_id in nearby:
+                if issue_id not in similar:
+                    continue
+                score = similarity(sig, self._issues[issue_id][1])
+                if score >= self.min_similarity and (best is None or (score, -distance) > (best.similarity, -best.distance_m)):
+                    best = Match(issue_id, score, round(distance, 1))
+            return best
+
+
+def load(radius_m=RADIUS_M, min_similarity=SUGGEST_SIMILARITY):
+    # A detector over every open issue in the database
+    detector = DuplicateDetector(radius_m, min_similarity)
+    placeholders = ', '.join(['%s'] * len(OPEN_STATUS_IDS))
+    with civic_db.connection() as conn:
+        rows = conn.query(
+            "SELECT i.issue_id, i.category_id, i.description, l.latitude, l.longitude "
+            "FROM ISSUES i JOIN LOCATIONS l ON i.location_id = l.location_id "
+            f"WHERE i.status_id IN ({placeholders})",
+            OPEN_STATUS_IDS,
+        )
+    for row in rows:
+        detector.add(int(row['issue_id']), int(row['category_id']), row['latitude'], row['longitude'], row['description'] or '')
+    return detector
+
+
+_detector = civic_spatial.SharedIndex(load, INDEX_TTL)
+
+
+def get_detector():
+    # The process-wide detector, (re)built when missing or older than the
+    # TTL. None when detection is switched off.
+    if MODE == 'off':
+        return None
+    return _detector.get()
+
+
+def loaded_detector():
+    # The detector if one has been built in this process, without loading
+    return _detector.loaded()
+
+
+def location_point(location_id):
+    location = civic_reference.get().locations.get(int(location_id))
+    if location is None or location.latitude is None or location.longitude is None:
+        return None, None
+    return float(location.latitude), float(location.longitude)
+
+
+def should_auto_link(match):
+    return MODE == 'auto' and match is not None and match.similarity >= AUTO_LINK_SIMILARITY
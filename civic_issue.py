@@ -1,14 +1,26 @@
 import streamlit as st
-import mysql.connector
-import hashlib
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import time
 import io
-import base64
 import os
+import sqlite3
+
+import civic_assets
+import civic_auth
+import civic_cache
+import civic_db
+import civic_journal
+import civic_map
+import civic_metrics
+import civic_nearby
+import civic_photos
+import civic_profiling
+import civic_reference
+import civic_search
+import civic_store
 
 # --- PAGE CONFIGURATION ---
 
@@ -19,37 +31,15 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# --- Function to encode image for CSS ---
-
-try:
-    # Get the directory where the script is located
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    # Construct the full path to the image file
-    hero_image_path = os.path.join(script_dir, "hero-civic.jpg")
-except NameError:
-    # Fallback if __file__ is not defined
-    hero_image_path = "hero-civic.jpg"
-
-@st.cache_data  # Cache the image data
-def get_image_base64(image_path):
-    if not os.path.exists(image_path):
-        return None
-    try:
-        with open(image_path, "rb") as img_file:
-            return base64.b64encode(img_file.read()).decode()
-    except Exception as e:
-        return None
-
-
-hero_image_base64 = get_image_base64(hero_image_path)
+# --- Page CSS ---
+# The hero image is a static file (see civic_assets) that the browser fetches
+# and caches once; the CSS only references its URL, so re-sending this block
+# on each rerun costs a few KB (Streamlit drops elements that a rerun does not
+# emit again, so it cannot be sent just once per session).
 
+@civic_profiling.profiled
 def load_react_ui_css():
-    global hero_image_base64
-    hero_background_css = (
-        f"url('data:image/jpeg;base64,{hero_image_base64}')"
-        if hero_image_base64
-        else "linear-gradient(135deg, hsl(222 47% 31%), hsl(221 83% 53%))"
-    )
+    hero_background_css, hero_small_screen_css = civic_assets.hero_background_css()
 
     st.markdown(f"""
     <style>
@@ -100,9 +90,10 @@ def load_react_ui_css():
         .hero-section {{
             position: relative; overflow: hidden;
             padding: 6rem 1rem 8rem 1rem;
-            background-image: {hero_background_css};
+            {hero_background_css}
             background-size: cover; background-position: center center;
         }}
+        {hero_small_screen_css}
         .hero-overlay {{
             position: absolute; inset: 0;
             background: linear-gradient(135deg, hsla(222,47%,31%,0.85) 0%, hsla(221,83%,53%,0.75) 50%, hsla(188,95%,43%,0.65) 100%);
@@ -265,75 +256,40 @@ def load_react_ui_css():
     # --- END DEFINITIVE FIX ---
 
 
-# --- DATABASE CONNECTION (MySQL) ---
-def get_db_connection():
-    try:
-        connection = mysql.connector.connect(
-            host='localhost',
-            user='root',
-            password='NiRvAn_*99',
-            database='final_dcdsl_project' 
-        )
-        if connection.is_connected():
-            return connection
-    except mysql.connector.Error as err:
-        st.error(f"DB Connect Error: {err}")
-        st.stop()
-    return None
+# --- DATABASE CONNECTION ---
+# Connections come from the process-wide pool in civic_db, which also picks
+# the storage backend (MySQL or embedded SQLite) from the environment.
 
 def query_db(query, params=None):
-    conn = get_db_connection()
-    if conn is None:
-        st.error("DB Connection is None, cannot query.")
-        return pd.DataFrame()
-    cursor = None
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(query, params or ())
-        result = cursor.fetchall()
-        return pd.DataFrame(result)
-    except mysql.connector.Error as err:
+        with civic_db.connection() as conn:
+            return pd.DataFrame(conn.query(query, params))
+    except civic_db.PoolTimeout as err:
+        st.error(f"DB Busy: {err}")
+        return pd.DataFrame()
+    except civic_db.DatabaseError as err:
         st.error(f"DB Query Error: {err}")
         return pd.DataFrame()
-    finally:
-        if cursor:
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
 
 
 def execute_db(query, params):
-    conn = get_db_connection()
-    if conn is None:
-        st.error("DB Connection is None, cannot execute.")
-        return False, None
-    last_id = None
-    cursor = None
     try:
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        conn.commit()
-        last_id = cursor.lastrowid
-        return True, last_id
-    except mysql.connector.Error as err:
+        with civic_db.connection() as conn:
+            _, last_id = conn.execute(query, params)
+            conn.commit()
+            return True, last_id
+    except civic_db.PoolTimeout as err:
+        st.error(f"DB Busy: {err}")
+        return False, None
+    except civic_db.DatabaseError as err:
+        # The pool rolls back any uncommitted work when the connection is returned
         st.error(f"DB Execute Error: {err}")
-        try:
-            conn.rollback()
-        except:
-            pass
         return False, None
-    finally:
-        if cursor:
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
-
-
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
 
 
 # --- AUTHENTICATION FUNCTIONS ---
+# Hashing (scrypt, in a bounded worker pool) and the legacy SHA-256 upgrade
+# live in civic_auth.
 
 
 def authenticate_user(email, password, role):
@@ -341,15 +297,15 @@ def authenticate_user(email, password, role):
     password_cleaned = password.replace(u'\xa0', '').strip()
     role_cleaned = role.strip()
 
-
-    # Hash the CLEANED password
-    password_hash = hash_password(password_cleaned)
-   
-    # Query using the CLEANED variables
-    query = "SELECT * FROM USERS WHERE email = %s AND password_hash = %s AND role = %s"
-    df = query_db(query, (email_cleaned, password_hash, role_cleaned))
-   
-    return df.iloc[0].to_dict() if not df.empty else None
+    try:
+        return civic_auth.authenticate(email_cleaned, password_cleaned, role_cleaned)
+    except civic_auth.AuthBusy as err:
+        st.error(str(err))
+    except civic_db.PoolTimeout as err:
+        st.error(f"DB Busy: {err}")
+    except civic_db.DatabaseError as err:
+        st.error(f"DB Query Error: {err}")
+    return None
 
 
 def register_user(name, phone, email, password):
@@ -374,118 +330,290 @@ def register_user(name, phone, email, password):
         return False
 
 
-    password_hash = hash_password(password_cleaned)
-    query = "INSERT INTO USERS (name, phone, email, role, password_hash) VALUES (%s, %s, %s, 'citizen', %s)"
-    success, _ = execute_db(query, (name_cleaned, phone_cleaned, email_cleaned, password_hash))
-    return success
+    try:
+        password_hash = civic_auth.hash_password(password_cleaned)
+        civic_store.register_citizen(name_cleaned, phone_cleaned, email_cleaned, password_hash)
+        return True
+    except civic_auth.AuthBusy as err:
+        st.error(str(err))
+        return False
+    except civic_db.PoolTimeout as err:
+        st.error(f"DB Busy: {err}")
+        return False
+    except civic_db.DatabaseError as err:
+        st.error(f"DB Execute Error: {err}")
+        return False
 
 
 # --- DATA RETRIEVAL FUNCTIONS ---
 
 
 def get_statistics(user_id=None):
-    stats = {'total': 0, 'Pending': 0, 'In-Progress': 0, 'Resolved': 0, 'Closed': 0, 'Duplicate': 0}
+    # Counts come from issue_status_counts, which civic_store keeps in step
+    # with every submission and status change (user_id 0 = the whole city).
     if user_id:
-        query, params = "SELECT s.status_name as status, COUNT(*) as count FROM ISSUES i JOIN STATUS s ON i.status_id = s.status_id WHERE i.user_id = %s GROUP BY s.status_name", (user_id,)
-        total_q, total_p = "SELECT COUNT(*) as total FROM ISSUES WHERE user_id = %s", (user_id,)
-    else:
-        query, params = "SELECT s.status_name as status, COUNT(*) as count FROM ISSUES i JOIN STATUS s ON i.status_id = s.status_id GROUP BY s.status_name", None
-        total_q, total_p = "SELECT COUNT(*) as total FROM ISSUES", None
-
-
-    stats_df = query_db(query, params)
-    total_df = query_db(total_q, total_p)
-    total = total_df['total'].iloc[0] if not total_df.empty else 0
-    stats['total'] = total
+        return get_status_counts(int(user_id), civic_cache.version(civic_cache.user(user_id)))
+    return get_status_counts(civic_store.ALL_USERS, civic_cache.version(civic_cache.ISSUES))
 
 
-    if not stats_df.empty:
-        for _, row in stats_df.iterrows():
-            if row['status'] in stats:
-                stats[row['status']] = row['count']
+@st.cache_data(ttl=30, max_entries=1000)
+def get_status_counts(user_id, cache_version=0):
+    stats = {'total': 0, 'Pending': 0, 'In-Progress': 0, 'Resolved': 0, 'Closed': 0, 'Duplicate': 0}
+    query = "SELECT s.status_name as status, c.issue_count as count FROM issue_status_counts c JOIN STATUS s ON c.status_id = s.status_id WHERE c.user_id = %s"
+    counts_df = query_db(query, (user_id,))
+    if not counts_df.empty:
+        for status, count in zip(counts_df['status'], counts_df['count']):
+            if status in stats:
+                stats[status] = int(count)
+        stats['total'] = int(counts_df['count'].sum())
     return stats
 
 
-@st.cache_data(ttl=600)
-def get_issues_by_category():
-    return query_db("SELECT c.Name as category, COUNT(i.issue_id) as count FROM CATEGORIES c LEFT JOIN ISSUES i ON c.category_id = i.category_id GROUP BY c.Name ORDER BY count DESC")
+# Home page KPIs are a shared snapshot: every anonymous visitor in the
+# process reads the same copy, refreshed at most once per HOME_KPI_TTL seconds
+# from the running totals civic_store maintains (never from resolution_history).
+HOME_KPI_TTL = int(os.environ.get('CIVIC_HOME_KPI_TTL', '60'))
+
 
+@st.cache_data(ttl=HOME_KPI_TTL)
+def get_home_kpis():
+    kpis = {civic_store.KPI_CITIZENS: 0, civic_store.KPI_RESOLVED_ISSUES: 0, civic_store.KPI_RESOLUTION_SECONDS: 0}
+    kpi_df = query_db("SELECT name, value FROM app_kpis")
+    for name, value in zip(kpi_df.get('name', []), kpi_df.get('value', [])):
+        kpis[name] = int(value)
+    return kpis
 
-@st.cache_data(ttl=600)
-def get_issues_timeline():
-    return query_db("SELECT DATE(created_at) as date, s.status_name as status, COUNT(*) as count FROM ISSUES i JOIN STATUS s ON i.status_id = s.status_id WHERE created_at >= CURDATE() - INTERVAL 30 DAY GROUP BY DATE(created_at), s.status_name ORDER BY date")
 
+# Cached functions below take a cache_version from civic_cache; writers bump
+# only the scopes they touched instead of clearing every cache in the process.
 
-@st.cache_data(ttl=600)
-def get_issues_by_area():
-    return query_db("SELECT l.area, COUNT(i.issue_id) as count FROM LOCATIONS l JOIN ISSUES i ON l.location_id = i.location_id GROUP BY l.area ORDER BY count DESC LIMIT 10")
+# The analytics charts aggregate issue_daily_counts (one row per day, status,
+# category and location) over the selected window, so their cost depends on
+# the number of days shown rather than the size of ISSUES.
+ANALYTICS_WINDOWS = {
+    'Last 7 days': 7,
+    'Last 30 days': 30,
+    'Last 90 days': 90,
+    'Last 365 days': 365,
+    'Custom range': None,
+}
 
 
-@st.cache_data(ttl=3600)
-def get_all_locations():
-    return query_db("SELECT location_id, area, address, latitude, longitude FROM LOCATIONS ORDER BY area")
+@st.cache_data(ttl=600, max_entries=200)
+def get_issues_by_category(start_date, end_date, cache_version=0):
+    query = """
+    SELECT c.Name as category, COALESCE(SUM(d.issue_count), 0) as count
+    FROM CATEGORIES c
+    LEFT JOIN issue_daily_counts d ON c.category_id = d.category_id AND d.stat_date BETWEEN %s AND %s
+    GROUP BY c.Name
+    ORDER BY count DESC
+    """
+    return query_db(query, (start_date, end_date))
 
 
-@st.cache_data(ttl=3600)
-def get_all_categories():
-    return query_db("SELECT category_id, Name FROM CATEGORIES ORDER BY Name")
+@st.cache_data(ttl=600, max_entries=200)
+def get_issues_timeline(start_date, end_date, cache_version=0):
+    query = """
+    SELECT d.stat_date as date, s.status_name as status, SUM(d.issue_count) as count
+    FROM issue_daily_counts d
+    JOIN STATUS s ON d.status_id = s.status_id
+    WHERE d.stat_date BETWEEN %s AND %s
+    GROUP BY d.stat_date, s.status_name
+    HAVING SUM(d.issue_count) > 0
+    ORDER BY date
+    """
+    return query_db(query, (start_date, end_date))
 
 
-@st.cache_data(ttl=3600)
-def get_all_status():
-    return query_db("SELECT status_id, status_name FROM STATUS")
+@st.cache_data(ttl=600, max_entries=200)
+def get_issues_by_area(start_date, end_date, cache_version=0):
+    query = """
+    SELECT l.area, SUM(d.issue_count) as count
+    FROM issue_daily_counts d
+    JOIN LOCATIONS l ON d.location_id = l.location_id
+    WHERE d.stat_date BETWEEN %s AND %s
+    GROUP BY l.area
+    HAVING SUM(d.issue_count) > 0
+    ORDER BY count DESC
+    LIMIT 10
+    """
+    return query_db(query, (start_date, end_date))
+
+
+@st.cache_data(ttl=600, max_entries=200)
+def get_map_clusters(zoom, status_id=None, severity=None, cache_version=0):
+    # Reads the per-location rollup (one row per location, status and
+    # severity, not per issue) and clusters it for the zoom level, so both
+    # the query and the result stay small however many issues there are.
+    # Returns (clusters DataFrame, zoom actually used).
+    clauses, params = ["m.issue_count > 0"], []
+    if status_id is not None:
+        clauses.append("m.status_id = %s")
+        params.append(int(status_id))
+    if severity is not None:
+        clauses.append("m.severity = %s")
+        params.append(severity)
+    query = f"""
+    SELECT l.latitude, l.longitude, s.status_name as status, m.severity, m.issue_count
+    FROM issue_location_counts m
+    JOIN LOCATIONS l ON m.location_id = l.location_id
+    JOIN STATUS s ON m.status_id = s.status_id
+    WHERE {' AND '.join(clauses)}
+    """
+    df = query_db(query, tuple(params))
+    if df.empty:
+        return pd.DataFrame(), int(zoom)
+    clusters, used_zoom = civic_map.cluster(df[['latitude', 'longitude', 'status', 'severity', 'issue_count']].itertuples(index=False, name=None), zoom)
+    rows = [{
+        'latitude': c.latitude,
+        'longitude': c.longitude,
+        'issues': c.issue_count,
+        'locations': c.location_count,
+        'status': civic_map.dominant(c.status_counts),
+        'severity': civic_map.dominant(c.severity_counts),
+        'breakdown': "<br>".join(f"{name}: {count}" for name, count in sorted(c.status_counts.items(), key=lambda item: -item[1])),
+    } for c in clusters]
+    return pd.DataFrame(rows), used_zoom
+
+
+def get_reference_data():
+    # Locations, categories and statuses are shared by all sessions through
+    # civic_reference instead of being copied into each session's state
+    try:
+        return civic_reference.get()
+    except civic_db.PoolTimeout as err:
+        st.error(f"DB Busy: {err}")
+    except civic_db.DatabaseError as err:
+        st.error(f"DB Query Error: {err}")
+    return civic_reference.EMPTY
 
 
-@st.cache_data(ttl=30)
-def get_user_issues(user_id):
+@st.cache_data(ttl=30, max_entries=1000)
+def get_user_issues(user_id, cache_version=0):
     query = "SELECT i.issue_id, c.Name as category, i.description, l.area, i.severity, s.status_name as status, i.created_at FROM ISSUES i JOIN CATEGORIES c ON i.category_id = c.category_id JOIN LOCATIONS l ON i.location_id = l.location_id JOIN STATUS s ON i.status_id = s.status_id WHERE i.user_id = %s ORDER BY i.created_at DESC"
     return query_db(query, (user_id,))
 
 
-@st.cache_data(ttl=30)
-def get_all_issues_detailed():
-    # This query uses a Window Function to find the *last* person
-    # who changed each issue, based on your history table.
-    query = """
-    WITH LatestHistory AS (
-        SELECT
-            rh.issue_id,
-            rh.changed_by,
-            u_updater.name as updated_by_name,
-            -- Use ROW_NUMBER to find the single latest entry per issue
-            ROW_NUMBER() OVER(PARTITION BY rh.issue_id ORDER BY rh.timestamp DESC) as rn
-        FROM resolution_history rh
-        LEFT JOIN USERS u_updater ON rh.changed_by = u_updater.user_id
-    )
+# Sort orders for the staff issue list: (label, SQL direction)
+ISSUE_SORT_ORDERS = {"Newest first": "DESC", "Oldest first": "ASC"}
+
+
+def build_issue_filters(status_id=None, severity=None, category_id=None):
+    # Filters are pushed into SQL as parameterized WHERE clauses
+    clauses, params = [], []
+    if status_id is not None:
+        clauses.append("i.status_id = %s")
+        params.append(int(status_id))
+    if severity is not None:
+        clauses.append("i.severity = %s")
+        params.append(severity)
+    if category_id is not None:
+        clauses.append("i.category_id = %s")
+        params.append(int(category_id))
+    return clauses, params
+
+
+def build_issue_search(search):
+    # search is a tuple of civic_search.terms(); returns the JOIN and the
+    # filter (clauses, params) that restrict ISSUES i to matching issues.
+    # The SQL comes from the backend (MySQL FULLTEXT or SQLite FTS5).
+    if not search:
+        return "", [], []
+    backend = civic_db.get_backend()
+    condition, params = backend.search_condition(list(search))
+    return backend.search_join("i.issue_id"), [condition], params
+
+
+@st.cache_data(ttl=30, max_entries=200)
+def count_issues(status_id=None, severity=None, category_id=None, cache_version=0):
+    clauses, params = build_issue_filters(status_id, severity, category_id)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    df = query_db(f"SELECT COUNT(*) as total FROM ISSUES i {where}", tuple(params))
+    return int(df['total'].iloc[0]) if not df.empty else 0
+
+
+@st.cache_data(ttl=30, max_entries=200)
+def get_issues_page(status_id=None, severity=None, category_id=None, search=(), sort="DESC", after=None, page_size=25, offset=0, cache_version=0):
+    # Keyset pagination on (created_at, issue_id): 'after' is the key of the
+    # last row on the previous page, so every page is an index range scan of
+    # page_size + 1 rows no matter how deep into the list we are. The extra
+    # row only tells the caller whether a next page exists.
+    #
+    # With search terms the list is ranked by relevance instead, paged with
+    # 'offset' (every match has to be scored to rank them anyway). The
+    # newest civic_search.RANK_WINDOW matches are ranked in a subquery that
+    # also counts them (search_matches); the joins run for one page only.
+    sort = "ASC" if sort == "ASC" else "DESC"
+    join, clauses, params = build_issue_search(search)
+    filter_clauses, filter_params = build_issue_filters(status_id, severity, category_id)
+    clauses, params = clauses + filter_clauses, params + filter_params
+    if search:
+        backend = civic_db.get_backend()
+        relevance, relevance_params = backend.search_relevance(list(search))
+        where = f"WHERE {' AND '.join(clauses)}"
+        source = f"""(
+        SELECT matched.issue_id, matched.relevance, COUNT(*) OVER () as search_matches
+        FROM (
+            SELECT i.issue_id, {relevance} as relevance
+            FROM ISSUES i {join}
+            {where}
+            ORDER BY {backend.search_key} DESC
+            LIMIT %s
+        ) matched
+        ORDER BY matched.relevance DESC, matched.issue_id DESC
+        LIMIT %s OFFSET %s
+    ) ranked
+    JOIN ISSUES i ON i.issue_id = ranked.issue_id"""
+        params = relevance_params + params + [civic_search.RANK_WINDOW, int(page_size) + 1, int(offset)]
+        where, order = "", "ranked.relevance DESC, i.issue_id DESC"
+    else:
+        if after is not None:
+            after_created_at, after_issue_id = after
+            cmp = ">" if sort == "ASC" else "<"
+            clauses.append(f"(i.created_at {cmp} %s OR (i.created_at = %s AND i.issue_id {cmp} %s))")
+            params.extend([after_created_at, after_created_at, int(after_issue_id)])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(int(page_size) + 1)
+        source, order = "ISSUES i", f"i.created_at {sort}, i.issue_id {sort}"
+
+    query = f"""
     SELECT
         i.issue_id,
         u.name as reporter,
-        lh.updated_by_name as updated_by, -- This is the staff updater's name
+        u_updater.name as updated_by,
+        lu.changed_at as status_changed_at,
         c.Name as category,
         i.description,
         l.area,
         l.address,
-        l.latitude,  -- <-- From locations table 'l'
-        l.longitude, -- <-- From locations table 'l'
+        l.latitude,
+        l.longitude,
         i.severity,
         s.status_name as status,
         i.created_at,
         i.updated_at,
-        i.photo_path
-    FROM ISSUES i
+        i.photo_path,
+        i.master_issue_id,
+        dc.master_issue_id as suggested_master_id,
+        dc.similarity as duplicate_similarity,
+        dc.distance_m as duplicate_distance_m{', ranked.search_matches' if search else ''}
+    FROM {source}
     LEFT JOIN USERS u ON i.user_id = u.user_id
     LEFT JOIN CATEGORIES c ON i.category_id = c.category_id
     LEFT JOIN LOCATIONS l ON i.location_id = l.location_id
     LEFT JOIN STATUS s ON i.status_id = s.status_id
-    -- Join with LatestHistory, but only take the latest one (rn = 1)
-    LEFT JOIN LatestHistory lh ON i.issue_id = lh.issue_id AND lh.rn = 1
-    ORDER BY i.issue_id ASC
+    LEFT JOIN issue_latest_update lu ON i.issue_id = lu.issue_id
+    LEFT JOIN USERS u_updater ON lu.changed_by = u_updater.user_id
+    LEFT JOIN issue_duplicate_candidates dc ON i.issue_id = dc.issue_id
+    {where}
+    ORDER BY {order}
+    {'' if search else 'LIMIT %s'}
     """
-    return query_db(query)
+    return query_db(query, tuple(params))
 
 
-@st.cache_data(ttl=30)
-def get_issue_history(issue_id):
+@st.cache_data(ttl=30, max_entries=1000)
+def get_issue_history(issue_id, cache_version=0):
     query = """
     SELECT
         rh.timestamp,
@@ -502,92 +630,177 @@ def get_issue_history(issue_id):
     return query_db(query, (issue_id,))
 
 
-def submit_issue(user_id, category_id, location_id, description, severity, photo_path=None):
-    query = """
-    INSERT INTO ISSUES
-    (user_id, category_id, location_id, status_id, description, severity, photo_path, created_at, updated_at, master_issue_id)
-    VALUES (%s, %s, %s, 1, %s, %s, %s, NOW(), NOW(), NULL)
+@st.cache_data(ttl=30, max_entries=200)
+def get_issues_history(issue_ids, cache_version=()):
+    # History for every issue on a page in one round trip; the caller groups
+    # it by issue_id. Takes a tuple so the cache key is stable, and one
+    # cache version per issue so an update to any of them refetches the page.
+    if not issue_ids:
+        return pd.DataFrame()
+    placeholders = ", ".join(["%s"] * len(issue_ids))
+    query = f"""
+    SELECT
+        rh.issue_id,
+        rh.timestamp,
+        u.name as updater_name,
+        s_old.status_name as old_status,
+        s_new.status_name as new_status
+    FROM resolution_history rh
+    JOIN USERS u ON rh.changed_by = u.user_id
+    JOIN STATUS s_old ON rh.old_status_id = s_old.status_id
+    JOIN STATUS s_new ON rh.new_status_id = s_new.status_id
+    WHERE rh.issue_id IN ({placeholders})
+    ORDER BY rh.issue_id, rh.timestamp DESC
     """
-    success, last_id = execute_db(query, (user_id, category_id, location_id, description, severity, photo_path))
-    return success, last_id
+    return query_db(query, tuple(int(issue_id) for issue_id in issue_ids))
 
 
-def update_issue_status(issue_id, new_status_id, staff_user_id):
-    # This prevents the "numpy.int64 cannot be converted" error.
+def submit_issue(user_id, category_id, location_id, description, severity, photo_path=None, idempotency_key=None):
+    # Returns (success, id). The report normally goes to the local submission
+    # journal and the id is provisional ("P-<n>") until the background
+    # drainer has stored it; if the journal itself is unavailable we fall
+    # back to writing to the database directly.
     try:
-        py_issue_id = int(issue_id)
-        py_new_status_id = int(new_status_id)
-        py_staff_user_id = int(staff_user_id)
-    except ValueError as e:
-        st.error(f"Invalid ID provided: {e}")
-        return False
+        return True, civic_journal.submit(user_id, category_id, location_id, description, severity, photo_path, idempotency_key)
+    except (sqlite3.Error, OSError):
+        pass
+    try:
+        issue_id = civic_store.submit_issue(user_id, category_id, location_id, description, severity, photo_path, idempotency_key)
+        return True, issue_id
+    except civic_db.PoolTimeout as err:
+        st.error(f"DB Busy: {err}")
+        return False, None
+    except civic_db.DatabaseError as err:
+        st.error(f"DB Execute Error: {err}")
+        return False, None
 
 
-    # 1. Get the old status_id first
-    # We use the Python-native int (py_issue_id) in the query
-    old_status_df = query_db("SELECT status_id FROM ISSUES WHERE issue_id = %s", (py_issue_id,))
-    if old_status_df.empty:
-        st.error("Issue not found.")
-        return False
-   
-    py_old_status_id = int(old_status_df['status_id'].iloc[0])
+def show_issue_photo(photo_path):
+    # Staff views: a lazily loaded thumbnail linking to the EXIF-free full
+    # size image, once the background workers have produced them
+    if not civic_photos.is_photo_key(photo_path):
+        st.caption(f"Photo: {photo_path}")  # recorded before photos were stored
+        return
+    try:
+        variants = civic_photos.thumbnail(photo_path)
+    except (OSError, civic_photos.PhotoError) as err:
+        st.caption(f"Photo unavailable: {err}")
+        return
+    if variants is None:
+        st.caption("📷 Photo is being processed…")
+    elif variants[0]:
+        thumb_url, clean_url = variants
+        st.markdown(f"<a href='{clean_url}' target='_blank'><img src='{thumb_url}' loading='lazy' alt='Issue photo' style='max-width: 320px; border-radius: var(--radius);'></a>", unsafe_allow_html=True)
+    else:
+        st.image(civic_photos.get_store().read(photo_path, civic_photos.THUMB), caption="Issue photo")
+
+
+def show_duplicate_info(issue, key_prefix):
+    # Linked master issue, or the detector's suggestion with a one-click link
+    if pd.notna(issue['master_issue_id']):
+        st.markdown(f"🔗 **Duplicate of #{int(issue['master_issue_id'])}**")
+        return
+    if pd.isna(issue['suggested_master_id']):
+        return
+    master_id = int(issue['suggested_master_id'])
+    col_info, col_link = st.columns([3, 1])
+    col_info.markdown(f"⚠️ **Possible duplicate of #{master_id}** ({issue['duplicate_similarity']:.0%} similar, {issue['duplicate_distance_m']:.0f} m away)")
+    if col_link.button(f"Link to #{master_id}", key=f"{key_prefix}_dup_{issue['issue_id']}", use_container_width=True):
+        try:
+            result = civic_store.link_duplicate(int(issue['issue_id']), master_id, st.session_state.user_id, expected_status_id=get_reference_data().status_ids_by_name.get(issue['status']))
+        except civic_db.DatabaseError as err:
+            st.error(f"DB Execute Error: {err}")
+            return
+        if result.outcome == civic_store.CONFLICT:
+            st.warning(f"Issue #{issue['issue_id']} was changed by someone else while you were viewing it.")
+            civic_cache.bump(civic_cache.ISSUES, civic_cache.issue(issue['issue_id']))
+        else:
+            st.rerun()
 
 
-    # 2. Check if status is actually changing
-    if py_old_status_id == py_new_status_id:
-        return True # Nothing to do
+NEARBY_LIMIT = 10
 
 
-    # 3. Use a NEW, SEPARATE connection for the transaction
-    conn = None
-    cursor = None
+def get_nearby_issues(lat, lon, **filters):
+    # Open issues around a point from the in-memory index (civic_nearby);
+    # filters: status_id, category_id, severity, exclude_issue_id
+    if lat is None or lon is None or pd.isna(lat) or pd.isna(lon):
+        return []
     try:
-        # Create a fresh connection just for this transaction
-        conn = mysql.connector.connect(
-            host='localhost',
-            user='root',
-            password='NiRvAn_*99',
-            database='final_dcdsl_project' 
+        return civic_nearby.nearby_issues(float(lat), float(lon), civic_nearby.RADIUS_M, filters, NEARBY_LIMIT)
+    except civic_db.PoolTimeout as err:
+        st.error(f"DB Busy: {err}")
+    except civic_db.DatabaseError as err:
+        st.error(f"DB Query Error: {err}")
+    return []
+
+
+def show_nearby_issues(nearby):
+    reference = get_reference_data()
+    for item in nearby:
+        category = reference.categories.get(item.category_id)
+        status = reference.statuses.get(item.status_id)
+        st.markdown(
+            f"- **#{item.issue_id}** • {category.name if category else 'Unknown'} ({item.severity}) • "
+            f"{status.name if status else 'Unknown'} • {item.distance_m:.0f} m away  \n  {item.description}"
         )
-        if not conn.is_connected():
-            st.error("Database connection failed for transaction.")
-            return False
 
 
-        cursor = conn.cursor()
-       
-        # First, update the main issue table
-        # We use the Python-native int variables here
-        query_update = "UPDATE ISSUES SET status_id = %s, updated_at = NOW() WHERE issue_id = %s"
-        cursor.execute(query_update, (py_new_status_id, py_issue_id))
-       
-        # Second, insert into the history table
-        query_log = """
-        INSERT INTO resolution_history
-        (issue_id, old_status_id, new_status_id, changed_by, timestamp)
-        VALUES (%s, %s, %s, %s, NOW())
-        """
-        # We use the Python-native int variables here
-        cursor.execute(query_log, (py_issue_id, py_old_status_id, py_new_status_id, py_staff_user_id))
-       
-        # If both are successful, commit
-        conn.commit()
-        return True
-       
-    except mysql.connector.Error as err:
+def get_pending_submissions(user_id):
+    try:
+        return civic_journal.pending(user_id)
+    except (sqlite3.Error, OSError):
+        return []
+
+
+def get_submission_queue_stats():
+    try:
+        return civic_journal.stats()
+    except (sqlite3.Error, OSError):
+        return None
+
+
+def update_issue_status(issue_id, new_status_id, staff_user_id, expected_status_id=None):
+    # Returns one of civic_store.UPDATED / UNCHANGED / CONFLICT / NOT_FOUND,
+    # or None if the database call itself failed.
+    # Passing expected_status_id (the status the staff member was looking at)
+    # turns a concurrent change by someone else into a CONFLICT instead of
+    # silently overwriting it.
+    try:
+        # This prevents the "numpy.int64 cannot be converted" error.
+        py_expected_status_id = int(expected_status_id) if expected_status_id is not None else None
+        result = civic_store.change_status(issue_id, new_status_id, staff_user_id, py_expected_status_id)
+    except ValueError as e:
+        st.error(f"Invalid ID provided: {e}")
+        return None
+    except civic_db.PoolTimeout as err:
+        st.error(f"DB Busy: {err}")
+        return None
+    except civic_db.DatabaseError as err:
+        # Anything not committed is rolled back when the connection goes back to the pool
         st.error(f"DB Transaction Error: {err}")
-        if conn:
-            try:
-                conn.rollback() # Rollback changes on error
-            except:
-                pass
-        return False
-    finally:
-        # Clean up the cursor and the NEW connection
-        if cursor:
-            cursor.close()
-        if conn and conn.is_connected():
-            conn.close()
+        return None
+
+    if result.outcome == civic_store.NOT_FOUND:
+        st.error("Issue not found.")
+    return result.outcome
+
+
+def bulk_update_issue_status(issue_ids, new_status_id, staff_user_id, expected_status_ids=None):
+    # Returns {issue_id: outcome} for every requested issue, or None if the
+    # batch failed (in which case nothing was written).
+    try:
+        results = civic_store.change_status_bulk(issue_ids, new_status_id, staff_user_id, expected_status_ids)
+    except ValueError as e:
+        st.error(f"Invalid ID provided: {e}")
+        return None
+    except civic_db.PoolTimeout as err:
+        st.error(f"DB Busy: {err}")
+        return None
+    except civic_db.DatabaseError as err:
+        st.error(f"DB Transaction Error: {err}")
+        return None
+    return {issue_id: result.outcome for issue_id, result in results.items()}
 
 # --- PLOTTING FUNCTIONS ---
 
@@ -608,16 +821,34 @@ def create_category_chart(df):
     return fig
 
 
-def create_timeline_chart(df):
-    color_map = {
-        'Pending': 'hsl(28, 100%, 53%)',
-        'In-Progress': 'hsl(221, 83%, 53%)',
-        'Resolved': 'hsl(142, 71%, 45%)',
-        'Closed': 'hsl(215, 16%, 47%)',
-        'Duplicate': 'hsl(0, 84%, 60%)'
-    }
-    fig = px.bar(df, x='date', y='count', color='status', color_discrete_map=color_map, title='Issues Over Time (Last 30 Days)')
-    fig.update_layout(height=400, barmode='stack', paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(family='Inter', size=12, color='hsl(222, 47%, 11%)'), title=dict(text='Issues Timeline (Last 30 Days)', font=dict(size=18)), xaxis=dict(title='Date', gridcolor='hsl(214, 32%, 91%)'), yaxis=dict(title='Count', gridcolor='hsl(214, 32%, 91%)'), legend=dict(title='Status', orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5), margin=dict(l=20, r=20, t=60, b=80))
+STATUS_COLORS = {
+    'Pending': 'hsl(28, 100%, 53%)',
+    'In-Progress': 'hsl(221, 83%, 53%)',
+    'Resolved': 'hsl(142, 71%, 45%)',
+    'Closed': 'hsl(215, 16%, 47%)',
+    'Duplicate': 'hsl(0, 84%, 60%)'
+}
+SEVERITY_COLORS = {'Low': 'hsl(142, 71%, 45%)', 'Medium': 'hsl(38, 92%, 50%)', 'High': 'hsl(0, 84%, 60%)'}
+
+
+def create_timeline_chart(df, window_label='Last 30 days'):
+    fig = px.bar(df, x='date', y='count', color='status', color_discrete_map=STATUS_COLORS, title=f'Issues Over Time ({window_label})')
+    fig.update_layout(height=400, barmode='stack', paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', font=dict(family='Inter', size=12, color='hsl(222, 47%, 11%)'), title=dict(text=f'Issues Timeline ({window_label})', font=dict(size=18)), xaxis=dict(title='Date', gridcolor='hsl(214, 32%, 91%)'), yaxis=dict(title='Count', gridcolor='hsl(214, 32%, 91%)'), legend=dict(title='Status', orientation="h", yanchor="bottom", y=-0.3, xanchor="center", x=0.5), margin=dict(l=20, r=20, t=60, b=80))
+    return fig
+
+
+def create_cluster_map(df, zoom, color_by='status'):
+    # One marker per cluster, sized by its issue count and colored by the
+    # cluster's most common status or severity
+    weights = df['issues'] / df['issues'].sum()
+    center = dict(lat=float((df['latitude'] * weights).sum()), lon=float((df['longitude'] * weights).sum()))
+    fig = px.scatter_map(
+        df, lat='latitude', lon='longitude', size='issues', size_max=40, color=color_by,
+        color_discrete_map=STATUS_COLORS if color_by == 'status' else SEVERITY_COLORS,
+        custom_data=['issues', 'locations', 'breakdown'], zoom=zoom, center=center, map_style='carto-positron',
+    )
+    fig.update_traces(hovertemplate='<b>%{customdata[0]} issues</b> at %{customdata[1]} location(s)<br>%{customdata[2]}<extra></extra>')
+    fig.update_layout(height=600, margin=dict(l=0, r=0, t=0, b=0), font=dict(family='Inter', size=12, color='hsl(222, 47%, 11%)'), legend=dict(title=color_by.capitalize(), orientation="h", yanchor="bottom", y=0.01, xanchor="left", x=0.01, bgcolor='rgba(255,255,255,0.8)'))
     return fig
 
 
@@ -630,18 +861,13 @@ def create_area_chart(df):
 # --- SESSION STATE INITIALIZATION ---
 
 def init_session_state():
-    defaults = {'logged_in': False, 'user_id': None, 'user_name': None, 'user_role': None, 'current_page': 'home', 'locations_df': pd.DataFrame(), 'categories_df': pd.DataFrame(), 'status_df': pd.DataFrame()}
+    defaults = {'logged_in': False, 'user_id': None, 'user_name': None, 'user_role': None, 'current_page': 'home'}
     for key, value in defaults.items():
         st.session_state.setdefault(key, value)
-    if st.session_state.locations_df.empty:
-        st.session_state.locations_df = get_all_locations()
-    if st.session_state.categories_df.empty:
-        st.session_state.categories_df = get_all_categories()
-    if st.session_state.status_df.empty:
-        st.session_state.status_df = get_all_status()
 
 # --- UI PAGES ---
 
+@civic_profiling.profiled
 def home_page():
     st.markdown("<style>[data-testid='stSidebar'] {display: none;}</style>", unsafe_allow_html=True)
     st.markdown(f"""
@@ -678,48 +904,17 @@ def home_page():
     resolved_issues = stats_dict.get('Resolved', 0) + stats_dict.get('Closed', 0)
 
 
-    # --- DYNAMIC AVG RESOLUTION CALCULATION (FIXED) ---
-    # This query uses resolution_history for 100% accuracy
+    # --- AVG RESOLUTION & CITIZENS (precomputed snapshot) ---
+    kpis = get_home_kpis()
     avg_res_str = "N/A"
-   
-    # We use status_id 3 (Resolved) and 4 (Closed)
-    avg_query = """
-    WITH ResolutionTime AS (
-        SELECT
-            i.issue_id,
-            i.created_at,
-            MIN(rh.timestamp) as resolution_timestamp
-        FROM ISSUES i
-        JOIN resolution_history rh ON i.issue_id = rh.issue_id
-        WHERE rh.new_status_id IN (3, 4) -- 3: Resolved, 4: Closed
-        GROUP BY i.issue_id, i.created_at
-    )
-    SELECT
-        AVG(TIMESTAMPDIFF(DAY, created_at, resolution_timestamp)) as avg_days,
-        AVG(TIMESTAMPDIFF(HOUR, created_at, resolution_timestamp)) as avg_hours
-    FROM ResolutionTime
-    """
-    avg_res_df = query_db(avg_query)
-
-
-    if not avg_res_df.empty and avg_res_df['avg_days'].iloc[0] is not None:
-        avg_days = avg_res_df['avg_days'].iloc[0]
-        avg_hours = avg_res_df['avg_hours'].iloc[0]
-
-
-        if avg_days is not None:
-            if avg_days < 1.0 and avg_hours is not None:
-                avg_res_str = f"{avg_hours:.1f} hours"
-            else:
-                avg_res_str = f"{avg_days:.1f} days"
-    # --- END DYNAMIC AVG RESOLUTION ---
-
-
-    # Citizens Count
-    total_citizens = 0
-    citizens_df = query_db("SELECT COUNT(*) as count FROM USERS WHERE role = 'citizen'")
-    if not citizens_df.empty:
-        total_citizens = citizens_df['count'].iloc[0]
+    resolved_count = kpis[civic_store.KPI_RESOLVED_ISSUES]
+    if resolved_count:
+        avg_hours = kpis[civic_store.KPI_RESOLUTION_SECONDS] / resolved_count / 3600
+        if avg_hours < 24:
+            avg_res_str = f"{avg_hours:.1f} hours"
+        else:
+            avg_res_str = f"{avg_hours / 24:.1f} days"
+    total_citizens = kpis[civic_store.KPI_CITIZENS]
 
 
     active_issues_str = f"{active_issues:,}"
@@ -801,6 +996,7 @@ def home_page():
 
 
 
+@civic_profiling.profiled
 def auth_page():
     st.markdown("<style>[data-testid='stSidebar'] {display: none;}</style>", unsafe_allow_html=True)
 
@@ -854,19 +1050,12 @@ def auth_page():
 
 
                         if user:
-                            # --- CLEAR CACHE ON LOGIN ---
-                            st.cache_data.clear()
-                            # ---------------------------
-
-
                             st.session_state.logged_in = True
                             st.session_state.user_id = user['user_id']
                             st.session_state.user_name = user['name']
                             st.session_state.user_role = user['role']
            
-                            # Redirect upon successful login
-                            st.success(f"Welcome, {user['name']}!")
-                            time.sleep(1)
+                            # Redirect upon successful login (the dashboard greets them)
                             st.session_state.current_page = 'dashboard'
                             st.rerun()
                         else:
@@ -918,6 +1107,7 @@ def auth_page():
 
 
 
+@civic_profiling.profiled
 def dashboard_page():
     st.markdown("<style>[data-testid='stSidebar'] {display: block;}</style><div class='container' style='padding-top: 1rem;'>", unsafe_allow_html=True)
     if st.session_state.user_role == 'citizen':
@@ -927,6 +1117,7 @@ def dashboard_page():
     st.markdown("</div>", unsafe_allow_html=True)
 
 
+@civic_profiling.profiled
 def citizen_dashboard():
     st.markdown(f"<div class='dashboard-header'><h1>PMC Civic Portal</h1><p>Welcome back, {st.session_state.user_name}</p></div>", unsafe_allow_html=True)
    
@@ -934,6 +1125,9 @@ def citizen_dashboard():
         st.session_state.current_page = 'submit_issue'
         st.rerun()
    
+    notice = st.session_state.pop('submit_notice', None)
+    if notice:
+        st.success(notice)
     st.markdown("<br>", unsafe_allow_html=True)
    
     stats = get_statistics(st.session_state.user_id)
@@ -952,7 +1146,11 @@ def citizen_dashboard():
     st.markdown("---")
     st.markdown("<h2 style='font-size: 1.75rem; font-weight: 700;'>Recent Issues</h2>", unsafe_allow_html=True)
    
-    issues_df = get_user_issues(st.session_state.user_id)
+    # Reports still in the submission journal are not in ISSUES yet
+    for entry_id, submitted_at, description in get_pending_submissions(st.session_state.user_id):
+        st.caption(f"⏳ {civic_journal.PROVISIONAL_PREFIX}{entry_id} • submitted {datetime.fromtimestamp(submitted_at):%Y-%m-%d %H:%M}, being saved: {description[:80]}")
+
+    issues_df = get_user_issues(st.session_state.user_id, civic_cache.version(civic_cache.user(st.session_state.user_id)))
    
     if not issues_df.empty:
         for _, issue in issues_df.iterrows():
@@ -964,10 +1162,102 @@ def citizen_dashboard():
         st.info("No issues reported yet.")
 
 
+ISSUE_VIEWS = ["Grid", "Cards"]
+
+ISSUE_GRID_COLUMNS = {
+    'issue_id': 'ID',
+    'category': 'Category',
+    'severity': 'Severity',
+    'area': 'Area',
+    'status': 'Status',
+    'reporter': 'Reporter',
+    'updated_by': 'Last Update By',
+    'created_at': 'Reported',
+    'duplicate_of': 'Duplicate Of',
+}
+
+
+def issue_grid(page_df, status_list, status_map, grid_key):
+    # The staff issue list as one data editor: the grid only draws the rows
+    # in view, so a page of thousands of issues is a single element instead
+    # of an expander and two widgets per issue. Status is edited in place and
+    # saved in one batch; ticking "Details" opens the detail panel below.
+    page_df = page_df.assign(duplicate_of=page_df['master_issue_id'].map(lambda master: f"#{int(master)}", na_action='ignore').fillna(
+        page_df['suggested_master_id'].map(lambda master: f"#{int(master)}?", na_action='ignore')))
+    grid_df = page_df[list(ISSUE_GRID_COLUMNS)].copy()
+    grid_df['details'] = False
+    edited_df = st.data_editor(
+        grid_df,
+        key=grid_key,
+        hide_index=True,
+        use_container_width=True,
+        height=min(38 + 35 * len(grid_df), 600),
+        disabled=[column for column in grid_df.columns if column not in ('status', 'details')],
+        column_config={
+            **{column: st.column_config.Column(label) for column, label in ISSUE_GRID_COLUMNS.items()},
+            'issue_id': st.column_config.NumberColumn("ID", format="#%d"),
+            'status': st.column_config.SelectboxColumn("Status", options=status_list, required=True),
+            'created_at': st.column_config.DatetimeColumn("Reported", format="YYYY-MM-DD HH:mm"),
+            'details': st.column_config.CheckboxColumn("Details", help="Show this issue's details and history below"),
+        },
+    )
+
+    changed = edited_df[edited_df['status'] != page_df['status']]
+    if st.button(f"Save {len(changed)} status changes", key="grid_save", type="primary", disabled=changed.empty):
+        seen_status = dict(zip(page_df['issue_id'], page_df['status']))
+        outcomes, new_statuses = {}, []
+        # One batch per target status; each keeps the stale-read check
+        for new_status, group in changed.groupby('status'):
+            issue_ids = group['issue_id'].tolist()
+            expected = {issue_id: status_map.get(seen_status[issue_id]) for issue_id in issue_ids}
+            group_outcomes = bulk_update_issue_status(issue_ids, status_map[new_status], st.session_state.user_id, expected)
+            if group_outcomes is None:
+                break
+            outcomes.update(group_outcomes)
+            new_statuses.append(new_status)
+        if outcomes:
+            st.session_state.bulk_update_result = {'status': ", ".join(new_statuses), 'outcomes': outcomes}
+            st.rerun()
+
+    selected = edited_df[edited_df['details']]
+    if selected.empty:
+        st.caption("Tick *Details* on a row to see its description, photo and update history.")
+        return
+    issue = page_df[page_df['issue_id'] == selected['issue_id'].iloc[-1]].iloc[0]
+    issue_id = int(issue['issue_id'])
+    status_class = f"status-{str(issue['status']).lower().replace(' ', '-')}"
+    updater_name = issue['updated_by'] if pd.notna(issue['updated_by']) else "N/A"
+    with st.container(border=True):
+        st.markdown(f"#### #{issue_id} • {issue['category']} ({issue['severity']}) - {issue['area']}")
+        st.markdown(f"**Description:** {issue['description']}  \n**Reporter:** {issue['reporter']} | **Last Update By:** {updater_name} | **Address:** {issue['address']}")
+        st.markdown(f"**Reported:** {issue['created_at'].strftime('%Y-%m-%d %H:%M')} | **Status:** <span class='status-badge {status_class}'>{issue['status']}</span>", unsafe_allow_html=True)
+        show_duplicate_info(issue, "grid")
+        if pd.notna(issue['photo_path']):
+            show_issue_photo(issue['photo_path'])
+        nearby = get_nearby_issues(issue['latitude'], issue['longitude'], exclude_issue_id=issue_id)
+        if nearby:
+            with st.expander(f"Open issues within {civic_nearby.RADIUS_M:.0f} m ({len(nearby)}{'+' if len(nearby) == NEARBY_LIMIT else ''})"):
+                show_nearby_issues(nearby)
+        history_df = get_issue_history(issue_id, civic_cache.version(civic_cache.issue(issue_id)))
+        if history_df.empty:
+            st.write("No update history for this issue yet.")
+        else:
+            for _, row in history_df.iterrows():
+                st.markdown(f"**{row['timestamp'].strftime('%Y-%m-%d %H:%M')}**: **{row['updater_name']}** changed status from *{row['old_status']}* to **{row['new_status']}**.")
+        if len(selected) > 1:
+            st.caption(f"{len(selected)} rows ticked; showing the last one.")
+
+
+@civic_profiling.profiled
 def staff_dashboard():
     st.markdown(f"<div class='dashboard-header'><h1>Staff Dashboard</h1><p>Welcome, {st.session_state.user_name}</p></div>", unsafe_allow_html=True)
    
     stats = get_statistics()
+    queue = get_submission_queue_stats()
+    if queue and queue['depth']:
+        st.caption(f"⏳ {queue['depth']} new reports waiting to be saved (oldest {queue['lag_seconds']:.0f}s ago)" + (f"; last error: {queue['last_error']}" if queue['errors'] else ""))
+    if queue and queue['parked_now']:
+        st.warning(f"{queue['parked_now']} reports could not be saved after {queue['attempt_limit']} attempts and are parked in the submission journal; see `civic_admin.py journal-drain --retry-parked`.")
     cols = st.columns(5)
     cols[0].metric("Total", stats['total'])
     cols[1].metric("Pending", stats['Pending'])
@@ -977,42 +1267,131 @@ def staff_dashboard():
    
     st.markdown("<br>", unsafe_allow_html=True)
    
-    tab_manage, tab_analytics = st.tabs(["📋 Issue Management", "📊 Analytics"])
+    tab_names = ["📋 Issue Management", "📊 Analytics"] + (["🩺 Diagnostics"] if civic_metrics.DIAGNOSTICS else [])
+    tab_manage, tab_analytics, *tab_diagnostics = st.tabs(tab_names)
+    for tab in tab_diagnostics:
+        with tab:
+            diagnostics_panel()
    
     with tab_manage:
         st.subheader("Manage Issues")
-        all_issues = get_all_issues_detailed()
-        status_df = st.session_state.status_df
-        status_map = {row['status_name']: row['status_id'] for _, row in status_df.iterrows()}
+        reference = get_reference_data()
+        status_map = reference.status_ids_by_name
         status_list = list(status_map.keys())
-       
-        if all_issues.empty:
-            st.info("No issues found.")
-            # We add a 'return' here to prevent the code below from running on an empty DF
-            return
-       
-        col1, col2, col3 = st.columns(3)
+        category_id_map = reference.category_ids_by_name
+
+        view = st.radio("View", ISSUE_VIEWS, horizontal=True, key="f_view", help="Grid renders only the rows on screen, so it stays fast with large pages; Cards shows every issue with its full details.")
+        search_text = st.text_input("Search", key="f_search", placeholder="e.g. streetlight near school", help="Matches the description, area and address; every word must appear. Results are ranked by relevance and can be combined with the filters below.")
+        search = tuple(civic_search.terms(search_text))
+        col1, col2, col3, col4, col5 = st.columns([3, 3, 3, 2, 2])
         with col1:
             status_filter = st.selectbox("Filter Status", ["All"] + status_list, key="f_status")
         with col2:
             severity_filter = st.selectbox("Filter Severity", ["All", "High", "Medium", "Low"], key="f_sev")
         with col3:
-            category_filter = st.selectbox("Filter Category", ["All"] + list(st.session_state.categories_df['Name'].unique()), key="f_cat")
-       
-        filtered_df = all_issues.copy()
-        if status_filter != "All":
-            filtered_df = filtered_df[filtered_df['status'] == status_filter]
-        if severity_filter != "All":
-            filtered_df = filtered_df[filtered_df['severity'] == severity_filter]
-        if category_filter != "All":
-            filtered_df = filtered_df[filtered_df['category'] == category_filter]
-       
-        st.caption(f"Showing {len(filtered_df)} issues")
+            category_filter = st.selectbox("Filter Category", ["All"] + list(category_id_map.keys()), key="f_cat")
+        with col4:
+            sort_label = st.selectbox("Sort", list(ISSUE_SORT_ORDERS.keys()), key="f_sort", disabled=bool(search), help="Search results are sorted by relevance" if search else None)
+        with col5:
+            if view == "Grid":
+                page_size = st.selectbox("Per page", [100, 500, 1000, 5000], index=1, key="f_grid_page_size")
+            else:
+                page_size = st.selectbox("Per page", [10, 25, 50, 100], index=1, key="f_page_size")
+
+        filters = {
+            'status_id': status_map[status_filter] if status_filter != "All" else None,
+            'severity': severity_filter if severity_filter != "All" else None,
+            'category_id': category_id_map[category_filter] if category_filter != "All" else None,
+            'search': search,
+        }
+        sort = ISSUE_SORT_ORDERS[sort_label]
+
+        # Keys of the last row of every page we've walked past; changing any
+        # filter starts again from the first page.
+        list_signature = (tuple(filters.values()), sort, page_size, view)
+        if st.session_state.get('issue_list_signature') != list_signature:
+            st.session_state.issue_list_signature = list_signature
+            st.session_state.issue_page_keys = []
+        page_keys = st.session_state.issue_page_keys
+
+        issues_version = civic_cache.version(civic_cache.ISSUES)
+        if search:
+            # Ranked results are paged by position; page_keys still counts
+            # the pages. The page query also returns the number of matches.
+            fetched_df = get_issues_page(**filters, page_size=page_size, offset=len(page_keys) * page_size, cache_version=issues_version)
+            total_matching = int(fetched_df['search_matches'].iloc[0]) if not fetched_df.empty else 0
+            if total_matching >= civic_search.RANK_WINDOW:
+                st.caption(f"Over {civic_search.RANK_WINDOW} matches: showing the most relevant of the newest {civic_search.RANK_WINDOW}. Add words or filters to narrow the search.")
+        else:
+            total_matching = count_issues(status_id=filters['status_id'], severity=filters['severity'], category_id=filters['category_id'], cache_version=issues_version)
+            fetched_df = get_issues_page(**filters, sort=sort, after=page_keys[-1] if page_keys else None, page_size=page_size, cache_version=issues_version)
+        has_next = len(fetched_df) > page_size
+        page_df = fetched_df.head(page_size)
+
+        first_row = len(page_keys) * page_size + 1
+        if page_df.empty:
+            st.caption(f"Showing 0 of {total_matching} issues")
+        else:
+            st.caption(f"Showing issues {first_row}–{first_row + len(page_df) - 1} of {total_matching}")
+
+        col_prev, col_page, col_next = st.columns([1, 4, 1])
+        with col_prev:
+            if st.button("← Previous", key="page_prev", use_container_width=True, disabled=not page_keys):
+                page_keys.pop()
+                st.rerun()
+        with col_page:
+            st.markdown(f"<p style='text-align: center; margin-top: 0.5rem;'>Page {len(page_keys) + 1}</p>", unsafe_allow_html=True)
+        with col_next:
+            if st.button("Next →", key="page_next", use_container_width=True, disabled=not has_next):
+                last = page_df.iloc[-1]
+                page_keys.append((last['created_at'].to_pydatetime(), int(last['issue_id'])))
+                st.rerun()
+
+        # --- BULK STATUS UPDATE ---
+        # Results are kept in session state so they survive the rerun that
+        # refreshes the list after the batch is written.
+        bulk_result = st.session_state.pop('bulk_update_result', None)
+        if bulk_result:
+            outcome_labels = {civic_store.UPDATED: "updated", civic_store.UNCHANGED: "already had that status", civic_store.CONFLICT: "changed by someone else, skipped", civic_store.NOT_FOUND: "not found"}
+            updated_count = sum(1 for outcome in bulk_result['outcomes'].values() if outcome == civic_store.UPDATED)
+            st.success(f"Bulk update to *{bulk_result['status']}*: {updated_count} of {len(bulk_result['outcomes'])} issues updated.")
+            skipped = {issue_id: outcome for issue_id, outcome in bulk_result['outcomes'].items() if outcome != civic_store.UPDATED}
+            if skipped:
+                st.dataframe(pd.DataFrame([{"Issue": f"#{issue_id}", "Result": outcome_labels.get(outcome, outcome)} for issue_id, outcome in skipped.items()]), hide_index=True, use_container_width=True)
+
+        if not page_df.empty and view == "Cards":
+            with st.expander("Bulk update status (this page)"):
+                issue_labels = {row['issue_id']: f"#{row['issue_id']} • {row['category']} ({row['severity']}) - {row['area']} [{row['status']}]" for _, row in page_df.iterrows()}
+                bulk_ids = st.multiselect("Issues", list(issue_labels.keys()), format_func=issue_labels.get, key="bulk_ids", placeholder="Choose issues from this page")
+                col_bulk_status, col_bulk_btn = st.columns([2, 1])
+                with col_bulk_status:
+                    bulk_status = st.selectbox("Set Status", status_list, key="bulk_status")
+                with col_bulk_btn:
+                    st.markdown("<div style='height: 2.4rem;'></div>", unsafe_allow_html=True)
+                    apply_bulk = st.button(f"Apply to {len(bulk_ids)} issues", key="bulk_apply", use_container_width=True, disabled=not bulk_ids)
+                if apply_bulk:
+                    seen_status = dict(zip(page_df['issue_id'], page_df['status']))
+                    expected = {issue_id: status_map.get(seen_status.get(issue_id)) for issue_id in bulk_ids}
+                    outcomes = bulk_update_issue_status(bulk_ids, status_map[bulk_status], st.session_state.user_id, expected)
+                    if outcomes is not None:
+                        st.session_state.bulk_update_result = {'status': bulk_status, 'outcomes': outcomes}
+                        del st.session_state['bulk_ids']
+                        st.rerun() # The write path already bumped the cache versions of the touched issues
        
-        if filtered_df.empty:
-            st.info("No issues found for the selected filters.")
+        if page_df.empty:
+            st.info("No issues found for this search and filters." if search else "No issues found for the selected filters.")
+        elif view == "Grid":
+            # A new editor per page/data version, so pending edits never
+            # apply to rows that have since moved
+            grid_key = f"issue_grid_{abs(hash((list_signature, tuple(page_keys), issues_version)))}"
+            issue_grid(page_df, status_list, status_map, grid_key)
         else:
-            for _, issue in filtered_df.iterrows():
+            # One history query for the whole page instead of one per expander
+            page_issue_ids = tuple(page_df['issue_id'].tolist())
+            page_history = get_issues_history(page_issue_ids, civic_cache.versions([civic_cache.issue(issue_id) for issue_id in page_issue_ids]))
+            history_by_issue = {issue_id: rows for issue_id, rows in page_history.groupby('issue_id')} if not page_history.empty else {}
+            empty_history = pd.DataFrame()
+            for _, issue in page_df.iterrows():
                 status_class = f"status-{str(issue['status']).lower().replace(' ', '-')}"
                 with st.expander(f"#{issue['issue_id']} • {issue['category']} ({issue['severity']}) - {issue['area']}"):
                    
@@ -1025,12 +1404,16 @@ def staff_dashboard():
                     st.markdown(f"**Description:** {issue['description']}  \n**Reporter:** {issue['reporter']} | **Last Update By:** {updater_name} | **Address:** {issue['address']}")
                     st.markdown(f"**Reported:** {issue['created_at'].strftime('%Y-%m-%d %H:%M')} | **Status:** <span class='status-badge {status_class}'>{issue['status']}</span>", unsafe_allow_html=True)
                    
+                    show_duplicate_info(issue, "card")
                     if 'photo_path' in issue and pd.notna(issue['photo_path']):
-                        st.caption(f"Photo: {issue['photo_path']}")
+                        show_issue_photo(issue['photo_path'])
+                    nearby = get_nearby_issues(issue['latitude'], issue['longitude'], exclude_issue_id=int(issue['issue_id']))
+                    if nearby:
+                        st.caption(f"Open issues within {civic_nearby.RADIUS_M:.0f} m: " + ", ".join(f"#{item.issue_id} ({item.distance_m:.0f} m)" for item in nearby))
                    
                     # --- NEW: VISUAL UI FOR HISTORY ---
                     with st.expander("Show Update History"):
-                        history_df = get_issue_history(issue['issue_id'])
+                        history_df = history_by_issue.get(issue['issue_id'], empty_history)
                         if history_df.empty:
                             st.write("No update history for this issue yet.")
                         else:
@@ -1053,51 +1436,136 @@ def staff_dashboard():
                         if st.button("Update", key=f"btn_{issue['issue_id']}", use_container_width=True):
                             new_stat_id = status_map[new_stat_name]
                            
-                            # Pass the logged-in staff member's ID
-                            if update_issue_status(issue['issue_id'], new_stat_id, st.session_state.user_id):
+                            # Pass the logged-in staff member's ID and the status they were looking at
+                            outcome = update_issue_status(issue['issue_id'], new_stat_id, st.session_state.user_id, expected_status_id=status_map.get(issue['status']))
+                            if outcome in (civic_store.UPDATED, civic_store.UNCHANGED):
                                 st.success(f"Issue #{issue['issue_id']} updated and logged!")
-                                st.cache_data.clear() # Clear cache to refresh data
                                 time.sleep(1)
                                 st.rerun()
+                            elif outcome == civic_store.CONFLICT:
+                                st.warning(f"Issue #{issue['issue_id']} was changed by someone else while you were viewing it. The list will show its current status on the next refresh.")
+                                # Our cached copy of this issue is stale (it may have been changed from another process)
+                                civic_cache.bump(civic_cache.ISSUES, civic_cache.issue(issue['issue_id']))
                             else:
                                 st.error("Update failed. Check DB logs.")
                            
     with tab_analytics:
         st.subheader("Analytics Overview")
+        today = datetime.now().date()
+        window_label = st.selectbox("Time window", list(ANALYTICS_WINDOWS), index=1, key="analytics_window")
+        window_days = ANALYTICS_WINDOWS[window_label]
+        if window_days is None:
+            picked = st.date_input("Date range", value=(today - timedelta(days=29), today), max_value=today, key="analytics_range")
+            if not isinstance(picked, (tuple, list)) or len(picked) != 2:
+                st.info("Pick a start and an end date.")
+                return
+            start_date, end_date = picked
+            window_label = f"{start_date:%d %b %Y} – {end_date:%d %b %Y}"
+        else:
+            start_date, end_date = today - timedelta(days=window_days - 1), today
+        area_df = get_issues_by_area(start_date, end_date, issues_version)
+        category_df = get_issues_by_category(start_date, end_date, issues_version)
+        timeline_df = get_issues_timeline(start_date, end_date, issues_version)
         col1, col2 = st.columns(2)
         with col1:
             st.plotly_chart(create_status_chart(stats), use_container_width=True)
-            st.plotly_chart(create_area_chart(get_issues_by_area()), use_container_width=True)
+            if area_df.empty:
+                st.info(f"No issues reported in this window ({window_label.lower()}).")
+            else:
+                st.plotly_chart(create_area_chart(area_df), use_container_width=True)
         with col2:
-            st.plotly_chart(create_category_chart(get_issues_by_category()), use_container_width=True)
-            st.plotly_chart(create_timeline_chart(get_issues_timeline()), use_container_width=True)
-
+            if not category_df.empty:
+                st.plotly_chart(create_category_chart(category_df), use_container_width=True)
+            if not timeline_df.empty:
+                st.plotly_chart(create_timeline_chart(timeline_df, window_label), use_container_width=True)
+
+
+def diagnostics_panel():
+    # Opt-in (CIVIC_DIAGNOSTICS=1): where this process spends its database time
+    totals = civic_metrics.stats()
+    st.caption(
+        f"Since {datetime.fromtimestamp(totals['since']):%Y-%m-%d %H:%M}: {totals['queries']} queries, "
+        f"{totals['seconds']:.1f}s in the database, {totals['errors']} errors, {totals['acquires']} connection checkouts "
+        f"({totals['acquire_seconds']:.1f}s waiting). {totals['slow']} queries over {civic_metrics.SLOW_QUERY_MS:.0f} ms"
+        + (f" logged to {civic_metrics.SLOW_QUERY_LOG}" if civic_metrics.SLOW_QUERY_MS else " (slow-query log off)") + "."
+    )
+    if st.button("Reset counters", key="diagnostics_reset"):
+        civic_metrics.reset()
+        st.rerun()
 
+    last = st.session_state.get('last_rerun_metrics')
+    if last:
+        st.markdown(f"**Previous rerun** ({last['page']})")
+        cols = st.columns(4)
+        cols[0].metric("Total", f"{last['seconds'] * 1000:.0f} ms")
+        cols[1].metric("Database", f"{last['db_seconds'] * 1000:.0f} ms")
+        cols[2].metric("Queries", last['queries'])
+        cols[3].metric("Waiting for a connection", f"{last['acquire_seconds'] * 1000:.0f} ms")
+        if last['top']:
+            st.dataframe(pd.DataFrame([{
+                'Query': row['sql'], 'Calls': row['calls'], 'Total ms': round(row['seconds'] * 1000, 1), 'Called from': row['caller'],
+            } for row in last['top']]), use_container_width=True, hide_index=True)
+
+    pages = civic_metrics.page_stats()
+    if pages:
+        st.markdown("**Per page** (averages per rerun)")
+        st.dataframe(pd.DataFrame([{
+            'Page': page, 'Reruns': totals['reruns'], 'Avg ms': round(totals['avg_ms'], 1), 'Max ms': round(totals['max_seconds'] * 1000, 1),
+            'Avg DB ms': round(totals['avg_db_ms'], 1), 'Avg queries': round(totals['avg_queries'], 1), 'Avg wait ms': round(totals['avg_acquire_ms'], 1),
+        } for page, totals in sorted(pages.items(), key=lambda item: -item[1]['db_seconds'])]), use_container_width=True, hide_index=True)
+
+    top = civic_metrics.top_statements(limit=25)
+    if top:
+        st.markdown("**Top queries by total time**")
+        st.dataframe(pd.DataFrame([{
+            'Query': row['sql'], 'Calls': row['calls'], 'Total ms': round(row['seconds'] * 1000, 1), 'Avg ms': round(row['avg_ms'], 2),
+            'Max ms': round(row['max_ms'], 1), 'Rows/call': round(row['rows'] / row['calls'], 1), 'Errors': row['errors'],
+            'Called from': ", ".join(row['callers'][:3]),
+        } for row in top]), use_container_width=True, hide_index=True)
+
+    sections = [("Connection pool", civic_db.pool_stats()), ("Password hashing", civic_auth.stats())]
+    queue = get_submission_queue_stats()
+    if queue:
+        sections.append(("Submission journal", queue))
+    cols = st.columns(len(sections))
+    for col, (title, values) in zip(cols, sections):
+        with col:
+            st.markdown(f"**{title}**")
+            st.dataframe(pd.DataFrame([{'': name, 'Value': str(value)} for name, value in values.items()]), use_container_width=True, hide_index=True)
+
+
+@civic_profiling.profiled
 def submit_issue_page():
     st.markdown("<style>[data-testid='stSidebar'] {display: block;}</style><div class='container' style='padding-top: 1rem;'>", unsafe_allow_html=True)
     st.title("Report New Issue")
     st.markdown("Fill in the details below.")
     st.markdown("---")
    
-    locations, categories = st.session_state.locations_df, st.session_state.categories_df
-    if locations.empty or categories.empty:
+    reference = get_reference_data()
+    if not reference.locations or not reference.categories:
         st.error("Failed to load data.")
         return
    
-    location_map = {f"{row['area']} ({row['address']})": row['location_id'] for _, row in locations.iterrows()}
-    category_map = {row['Name']: row['category_id'] for _, row in categories.iterrows()}
+    location_map = reference.location_ids_by_label
+    category_map = reference.category_ids_by_name
    
-    uploaded_file = st.file_uploader("Upload Photo (Optional)", type=["jpg", "jpeg", "png"])
-           
+    uploaded_file = st.file_uploader("Upload Photo (Optional)", type=["jpg", "jpeg", "png"], help=f"JPEG or PNG, up to {civic_photos.MAX_BYTES / (1024 * 1024):.3g} MB")
+
+    # Outside the form so the list of nearby reports follows the selection
+    loc_keys = list(location_map.keys())
+    location_key = st.selectbox("Location *", loc_keys, index=0, key="submit_location")
+    location = reference.locations.get(location_map[location_key])
+    nearby = get_nearby_issues(location.latitude, location.longitude) if location else []
+    if nearby:
+        with st.expander(f"⚠️ {len(nearby)}{'+' if len(nearby) == NEARBY_LIMIT else ''} open issues already reported within {civic_nearby.RADIUS_M:.0f} m - check yours is not among them"):
+            show_nearby_issues(nearby)
+
     st.markdown("<div class='card shadow-md' style='max-width: 700px; margin: 1rem auto;'>", unsafe_allow_html=True)
     with st.form("submit_form"):
         st.subheader("Issue Details")
        
         category_name = st.selectbox("Category *", category_map.keys())
        
-        loc_keys = list(location_map.keys())
-        location_key = st.selectbox("Location *", loc_keys, index=0)
-       
         description = st.text_area("Description *", height=150, placeholder="Provide details...")
         severity = st.selectbox("Severity *", ["Low", "Medium", "High"])
         st.markdown("<br>", unsafe_allow_html=True)
@@ -1108,33 +1576,110 @@ def submit_issue_page():
             if not all([description, location_key, category_name]):
                 st.error("Please fill required fields")
             else:
-                with st.spinner("Submitting..."):
-                    loc_id, cat_id = location_map[location_key], category_map[category_name]
-                    photo_path = f"/uploads/{uploaded_file.name}" if uploaded_file else None  # Placeholder
-                    success, issue_id = submit_issue(st.session_state.user_id, cat_id, loc_id, description, severity, photo_path)
-                   
-                    if success:
-                        st.success(f"Issue #{issue_id} submitted!")
-                        st.cache_data.clear()
-                        time.sleep(1.5)
-                        st.session_state.current_page = 'dashboard'
-                        st.rerun()
+                loc_id, cat_id = location_map[location_key], category_map[category_name]
+                photo_path = None
+                if uploaded_file:
+                    try:
+                        photo_path = civic_photos.save_upload(uploaded_file)
+                    except civic_photos.PhotoError as err:
+                        st.error(f"Photo not accepted: {err}")
+                        st.stop()
+                    except OSError as err:
+                        st.error(f"Could not store the photo: {err}")
+                        st.stop()
+                # One key per filled-in form, so a double click is one report
+                submit_key = st.session_state.setdefault('submit_key', civic_journal.new_idempotency_key())
+                success, issue_id = submit_issue(st.session_state.user_id, cat_id, loc_id, description, severity, photo_path, submit_key)
+               
+                if success:
+                    del st.session_state['submit_key']
+                    if str(issue_id).startswith(civic_journal.PROVISIONAL_PREFIX):
+                        st.session_state.submit_notice = f"Issue {issue_id} submitted! It will appear in your list with its issue number in a moment."
                     else:
-                        st.error("Submission failed.")
+                        st.session_state.submit_notice = f"Issue #{issue_id} submitted!"
+                    st.session_state.current_page = 'dashboard'
+                    st.rerun()
+                else:
+                    st.error("Submission failed.")
                        
     st.markdown("</div></div>", unsafe_allow_html=True)
 
+@civic_profiling.profiled
+def live_map_page():
+    st.markdown("<style>[data-testid='stSidebar'] {display: block;}</style><div class='container' style='padding-top: 1rem;'>", unsafe_allow_html=True)
+    st.title("Live Map")
+    if not st.session_state.logged_in:
+        st.warning("Please log in to view the map.")
+        return
+
+    reference = get_reference_data()
+    status_ids = reference.status_ids_by_name
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        status_filter = st.selectbox("Status", ["All"] + list(status_ids.keys()), key="map_status")
+    with col2:
+        severity_filter = st.selectbox("Severity", ["All", "Low", "Medium", "High"], key="map_severity")
+    with col3:
+        color_by = st.radio("Color by", ["Status", "Severity"], horizontal=True, key="map_color")
+    with col4:
+        zoom = st.slider("Detail", civic_map.MIN_ZOOM, civic_map.MAX_ZOOM, civic_map.DEFAULT_ZOOM, key="map_zoom", help="Higher detail splits the city into smaller clusters and zooms the map in.")
+
+    clusters, used_zoom = get_map_clusters(
+        zoom,
+        status_ids.get(status_filter),
+        None if severity_filter == "All" else severity_filter,
+        cache_version=civic_cache.version(civic_cache.ISSUES),
+    )
+    if clusters.empty:
+        st.info("No issues to show for these filters.")
+        st.markdown("</div>", unsafe_allow_html=True)
+        return
+    st.caption(f"{int(clusters['issues'].sum())} issues in {len(clusters)} clusters")
+    if used_zoom < zoom:
+        st.caption(f"Too many clusters at this detail level; showing detail {used_zoom} instead.")
+    st.plotly_chart(create_cluster_map(clusters, used_zoom, color_by.lower()), use_container_width=True)
+    st.markdown("</div>", unsafe_allow_html=True)
+
+
 # --- MAIN ROUTER ---
 
 
 def main():
+    # Every query a rerun runs is attributed to the page it started on (see
+    # civic_metrics); the staff Diagnostics tab shows the previous rerun's.
+    # With CIVIC_PROFILE=1 the whole rerun is also profiled (civic_profiling).
+    page = st.session_state.get('current_page', 'home')
+    if st.session_state.get('logged_in'):
+        page = f"{page} ({st.session_state.get('user_role')})"
+    rerun = None
+    try:
+        with civic_metrics.rerun(page) as rerun, civic_profiling.rerun(page, rerun):
+            render_app()
+    finally:
+        if rerun is not None:
+            st.session_state.last_rerun_metrics = rerun.summary()
+
+
+def render_app():
    
     # Loads all custom CSS, including the fix for invisible text and radio buttons
     load_react_ui_css()
    
-    # Initialize session variables and load cached data (locations, categories)
+    # Initialize session variables (reference data is shared, see civic_reference)
     init_session_state()
 
+    # Fill derived tables an older database doesn't have yet (once per process)
+    try:
+        civic_store.backfill_derived()
+    except civic_db.DatabaseError as err:
+        st.warning(f"Could not fill the statistics tables, counts may be off: {err}")
+
+    # Background writer for the submission journal (no-op once running)
+    try:
+        civic_journal.start()
+    except (sqlite3.Error, OSError) as err:
+        st.warning(f"Submission journal unavailable, reports are saved directly: {err}")
+
 
     # Sidebar Navigation (only shows if logged in)
     if st.session_state.logged_in:
@@ -1152,7 +1697,9 @@ def main():
                     st.session_state.current_page = 'submit_issue'
                     st.rerun()
            
-            # --- "Live Map" button REMOVED ---
+            if st.button("Live Map", use_container_width=True):
+                st.session_state.current_page = 'live_map'
+                st.rerun()
            
             st.markdown("<hr style='border-color: rgba(255,255,255,0.2);'><br>", unsafe_allow_html=True)
            
@@ -1165,13 +1712,11 @@ def main():
                 init_session_state()
                 st.session_state.logged_in = False
                 st.session_state.current_page = 'home'
-               
-                st.cache_data.clear()
                 st.rerun()
 
 
     # Page Routing
-    pages = {'home': home_page, 'auth': auth_page, 'dashboard': dashboard_page, 'submit_issue': submit_issue_page}
+    pages = {'home': home_page, 'auth': auth_page, 'dashboard': dashboard_page, 'submit_issue': submit_issue_page, 'live_map': live_map_page}
     page_function = pages.get(st.session_state.get('current_page', 'home'), home_page)
     page_function()
 
@@ -0,0 +1,348 @@
+"""Write-behind journal for issue submissions.
+
+``submit()`` appends the report to a local SQLite file (fsynced, WAL) and
+returns a provisional id such as ``P-42`` straight away, so a citizen is
+never kept waiting on, or turned away by, a slow or restarting database.
+A daemon thread drains the journal into ISSUES in batches through
+civic_store.submit_issues, retrying with exponential backoff. Every entry
+carries an idempotency key that is stored with the issue, so a batch that
+is retried after its commit actually went through is not inserted twice.
+
+Entries stay in the journal after they are drained, mapped to their real
+issue_id, for CIVIC_JOURNAL_RETENTION seconds so provisional ids can still
+be resolved. An entry that fails CIVIC_JOURNAL_MAX_ATTEMPTS times (a
+payload the database keeps rejecting) is parked: it stays in the file but
+is no longer retried, so it cannot hold back the entries behind it, until
+``civic_admin.py journal-drain --retry-parked`` puts it back in the queue.
+Settings: CIVIC_JOURNAL_PATH, CIVIC_JOURNAL_BATCH (50), CIVIC_JOURNAL_POLL
+(1 second), CIVIC_JOURNAL_MAX_BACKOFF (60 seconds), CIVIC_JOURNAL_MAX_ATTEMPTS
+(10), CIVIC_JOURNAL_RETENTION (86400 seconds).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import civic_db
+import civic_store
+
+
+JOURNAL_PATH = os.environ.get('CIVIC_JOURNAL_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'civic-journal.sqlite3')
+BATCH_SIZE = int(os.environ.get('CIVIC_JOURNAL_BATCH', '50'))
+POLL_SECONDS = float(os.environ.get('CIVIC_JOURNAL_POLL', '1'))
+MAX_BACKOFF = float(os.environ.get('CIVIC_JOURNAL_MAX_BACKOFF', '60'))
+MAX_ATTEMPTS = int(os.environ.get('CIVIC_JOURNAL_MAX_ATTEMPTS', '10'))
+RETENTION_SECONDS = float(os.environ.get('CIVIC_JOURNAL_RETENTION', '86400'))
+
+PROVISIONAL_PREFIX = 'P-'
+
+JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    user_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    issue_id INTEGER,
+    drained_at REAL,
+    parked_at REAL
+);
+CREATE INDEX IF NOT EXISTS journal_pending ON journal (issue_id, entry_id);
+"""
+
+
+class Journal:
+    # The on-disk queue. One connection shared under a lock; every write is
+    # a short transaction.
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # An acknowledged submission must survive a crash or power loss
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(JOURNAL_SCHEMA)
+        # Journal files from before parking existed
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(journal)")}
+        if 'parked_at' not in columns:
+            self._conn.execute("ALTER TABLE journal ADD COLUMN parked_at REAL")
+
+    def append(self, submission):
+        # Returns the entry_id; appending the same idempotency key twice
+        # (a double-clicked form) returns the first entry
+        payload = json.dumps({
+            'category_id': int(submission.category_id),
+            'location_id': int(submission.location_id),
+            'description': submission.description,
+            'severity': submission.severity,
+            'photo_path': submission.photo_path,
+            'created_at': submission.created_at.isoformat(' '),
+        })
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO journal (idempotency_key, user_id, payload, submitted_at) VALUES (?, ?, ?, ?)",
+                (submission.idempotency_key, int(submission.user_id), payload, time.time()),
+            )
+            return self._conn.execute(
+                "SELECT entry_id FROM journal WHERE idempotency_key = ?", (submission.idempotency_key,)
+            ).fetchone()[0]
+
+    def due(self, limit, now):
+        # Undrained, unparked entries whose backoff has expired, oldest
+        # first, as ([(entry_id, attempts, Submission)], {entry_id:
+        # (attempts, error)} for payloads that cannot be read)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT entry_id, idempotency_key, user_id, payload, attempts FROM journal "
+                "WHERE issue_id IS NULL AND parked_at IS NULL AND next_attempt_at <= ? ORDER BY entry_id LIMIT ?",
+                (now, limit),
+            ).fetchall()
+        entries, unreadable = [], {}
+        for entry_id, key, user_id, payload, attempts in rows:
+            try:
+                data = json.loads(payload)
+                submission = civic_store.Submission(
+                    key, user_id, data['category_id'], data['location_id'], data['description'],
+                    data['severity'], data['photo_path'], datetime.fromisoformat(data['created_at']),
+                )
+            except (ValueError, KeyError, TypeError) as err:
+                unreadable[entry_id] = (attempts, f"{type(err).__name__}: {err}")
+                continue
+            entries.append((entry_id, attempts, submission))
+        return entries, unreadable
+
+    def mark_drained(self, issue_ids_by_entry, now):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE journal SET issue_id = ?, drained_at = ?, last_error = NULL, parked_at = NULL WHERE entry_id = ?",
+                [(issue_id, now, entry_id) for entry_id, issue_id in issue_ids_by_entry.items()],
+            )
+            self._conn.execute("DELETE FROM journal WHERE drained_at < ?", (now - RETENTION_SECONDS,))
+            self._conn.execute("COMMIT")
+
+    def mark_failed(self, attempts_by_entry, error, now):
+        # Backs each entry off, and parks it once it has had MAX_ATTEMPTS.
+        # Returns how many were parked.
+        parked = 0
+        with self._lock:
+            self._conn.execute("BEGIN")
+            for entry_id, attempts in attempts_by_entry.items():
+                park = attempts >= MAX_ATTEMPTS
+                parked += park
+                self._conn.execute(
+                    "UPDATE journal SET attempts = ?, next_attempt_at = ?, last_error = ?, parked_at = ? WHERE entry_id = ?",
+                    (attempts, now + min(2 ** attempts, MAX_BACKOFF), error, now if park else None, entry_id),
+                )
+            self._conn.execute("COMMIT")
+        return parked
+
+    def retry_now(self):
+        # Clears the backoff of every queued entry (parked ones stay parked)
+        with self._lock:
+            self._conn.execute("UPDATE journal SET next_attempt_at = 0 WHERE issue_id IS NULL AND parked_at IS NULL")
+
+    def unpark(self):
+        # Puts every parked entry back in the queue with a fresh attempt
+        # count. Returns how many there were.
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE journal SET parked_at = NULL, attempts = 0, next_attempt_at = 0 WHERE issue_id IS NULL AND parked_at IS NOT NULL"
+            ).rowcount
+
+    def lookup(self, entry_id):
+        # (issue_id or None, user_id) for an entry, or None if unknown/pruned
+        with self._lock:
+            return self._conn.execute("SELECT issue_id, user_id FROM journal WHERE entry_id = ?", (entry_id,)).fetchone()
+
+    def pending(self, user_id=None):
+        # [(entry_id, submitted_at, description)] not yet in ISSUES
+        sql = "SELECT entry_id, submitted_at, payload FROM journal WHERE issue_id IS NULL"
+        params = ()
+        if user_id is not None:
+            sql += " AND user_id = ?"
+            params = (int(user_id),)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY entry_id", params).fetchall()
+        return [(entry_id, submitted_at, json.loads(payload)['description']) for entry_id, submitted_at, payload in rows]
+
+    def backlog(self):
+        # (depth, oldest submitted_at or None, max attempts) of the entries
+        # still being retried, and the number parked
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COALESCE(SUM(parked_at IS NULL), 0), MIN(CASE WHEN parked_at IS NULL THEN submitted_at END), "
+                "COALESCE(MAX(CASE WHEN parked_at IS NULL THEN attempts END), 0), COALESCE(SUM(parked_at IS NOT NULL), 0) "
+                "FROM journal WHERE issue_id IS NULL"
+            ).fetchone()
+
+
+class Drainer:
+    # Background thread moving journal entries into the database
+
+    def __init__(self, journal):
+        self.journal = journal
+        self._wake = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'drained': 0,
+            'batches': 0,
+            'errors': 0,
+            'parked': 0,
+            'last_error': None,
+            'last_error_at': None,
+            'last_drain_at': None,
+        }
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='civic-journal-drainer', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                drained = self.drain_once()
+            except Exception as err:  # keep the thread alive whatever happens
+                self._record_error(f"{type(err).__name__}: {err}")
+                drained = 0
+            if drained < BATCH_SIZE:
+                self._wake.wait(POLL_SECONDS)
+                self._wake.clear()
+
+    def drain_once(self):
+        # Moves up to BATCH_SIZE due entries. Returns how many it took from
+        # the queue: stored, found already stored by another drainer, or
+        # failed and backed off (the 'drained' stat counts only the stored).
+        now = time.time()
+        entries, unreadable = self.journal.due(BATCH_SIZE, now)
+        for entry_id, (attempts, message) in unreadable.items():
+            self._fail(entry_id, attempts, message)
+        if len(entries) == 1:
+            self._drain_single(entries[0])
+        elif entries:
+            try:
+                stored, created = civic_store.submit_issues([submission for _, _, submission in entries])
+            except Exception:
+                # Retry one by one so a single bad entry only holds back itself
+                for entry in entries:
+                    self._drain_single(entry)
+            else:
+                self.journal.mark_drained({entry_id: stored[submission.idempotency_key] for entry_id, _, submission in entries}, time.time())
+                self._record_drained(len(created))
+        return len(entries) + len(unreadable)
+
+    def _drain_single(self, entry):
+        # Any error fails the entry, not just a database one: a payload the
+        # store rejects must back off (and eventually park) like the rest
+        entry_id, attempts, submission = entry
+        try:
+            stored, created = civic_store.submit_issues([submission])
+        except Exception as err:
+            self._fail(entry_id, attempts, str(err) if isinstance(err, civic_db.DatabaseError) else f"{type(err).__name__}: {err}")
+            return
+        self.journal.mark_drained({entry_id: stored[submission.idempotency_key]}, time.time())
+        self._record_drained(len(created))
+
+    def _fail(self, entry_id, attempts, message):
+        parked = self.journal.mark_failed({entry_id: attempts + 1}, message, time.time())
+        self._record_error(message, parked)
+
+    def _record_drained(self, count):
+        # count: issues this drainer stored itself. Entries another drainer
+        # (journal-drain next to the app) got to first are not counted.
+        if not count:
+            return
+        with self._stats_lock:
+            self._stats['drained'] += count
+            self._stats['batches'] += 1
+            self._stats['last_drain_at'] = time.time()
+
+    def _record_error(self, message, parked=0):
+        with self._stats_lock:
+            self._stats['errors'] += 1
+            self._stats['parked'] += parked
+            self._stats['last_error'] = message
+            self._stats['last_error_at'] = time.time()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        depth, oldest, max_attempts, parked = self.journal.backlog()
+        stats.update(
+            depth=depth,
+            parked_now=parked,
+            attempt_limit=MAX_ATTEMPTS,
+            lag_seconds=round(time.time() - oldest, 3) if oldest is not None else 0.0,
+            max_attempts=max_attempts,
+            running=self._thread is not None and self._thread.is_alive(),
+        )
+        return stats
+
+
+_drainer = None
+_drainer_lock = threading.Lock()
+
+
+def get_drainer():
+    global _drainer
+    if _drainer is None:
+        with _drainer_lock:
+            if _drainer is None:
+                _drainer = Drainer(Journal(JOURNAL_PATH))
+    return _drainer
+
+
+def start():
+    # Starts the background drainer (idempotent). Also picks up entries left
+    # over from a previous run.
+    get_drainer().start()
+
+
+def new_idempotency_key():
+    return uuid.uuid4().hex
+
+
+def submit(user_id, category_id, location_id, description, severity, photo_path=None, idempotency_key=None):
+    # Journals the submission and returns its provisional id at once
+    submission = civic_store.Submission(
+        idempotency_key or new_idempotency_key(), user_id, category_id, location_id,
+        description, severity, photo_path, datetime.now().replace(microsecond=0),
+    )
+    drainer = get_drainer()
+    entry_id = drainer.journal.append(submission)
+    drainer.start()
+    drainer.wake()
+    return f"{PROVISIONAL_PREFIX}{entry_id}"
+
+
+def resolve(provisional_id):
+    # The real issue_id behind a provisional id, or None while it is still
+    # queued (or once it has aged out of the journal)
+    entry_id = int(str(provisional_id).removeprefix(PROVISIONAL_PREFIX))
+    found = get_drainer().journal.lookup(entry_id)
+    return found[0] if found else None
+
+
+def pending(user_id=None):
+    return get_drainer().journal.pending(user_id)
+
+
+def stats():
+    # depth, lag_seconds (age of the oldest queued entry), drained, batches,
+    # errors, parked (by this process), parked_now (in the file), last_error,
+    # last_error_at, last_drain_at, max_attempts, attempt_limit, running
+    return get_drainer().stats()
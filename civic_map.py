@@ -0,0 +1,88 @@
+"""Server-side clustering for the Live Map.
+
+The map never receives individual issues. issue_location_counts holds the
+number of issues per location, status and severity (kept current by
+civic_store's write paths), and cluster() folds those rows into grid cells
+whose size follows the zoom level. The browser therefore gets at most
+CIVIC_MAP_MAX_CLUSTERS markers however many issues exist; when a zoom level
+would produce more, the grid is coarsened until it fits.
+"""
+import math
+import os
+from collections import namedtuple
+
+
+MAX_CLUSTERS = int(os.environ.get('CIVIC_MAP_MAX_CLUSTERS', '1500'))
+
+MIN_ZOOM, MAX_ZOOM = 10, 17
+DEFAULT_ZOOM = 12
+# Grid cells across one 512px map tile: at zoom 12 a cell is ~2.4 km, at
+# zoom 17 ~75 m
+CELLS_PER_TILE = 4
+
+Cluster = namedtuple('Cluster', ['latitude', 'longitude', 'issue_count', 'location_count', 'status_counts', 'severity_counts'])
+
+
+def cell_size_deg(zoom):
+    return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+
+def dominant(counts):
+    # The most frequent key; ties go to the first one seen
+    return max(counts, key=counts.get) if counts else None
+
+
+def _merge(into, counts):
+    for key, count in counts.items():
+        into[key] = into.get(key, 0) + count
+
+
+def _by_location(rows):
+    # One entry per distinct point, so re-clustering at a coarser zoom costs
+    # the number of locations rather than the number of rollup rows
+    points = {}
+    for lat, lon, status, severity, count in rows:
+        if lat is None or lon is None or not count or int(count) <= 0:
+            continue
+        count = int(count)
+        point = points.get((float(lat), float(lon)))
+        if point is None:
+            point = points[(float(lat), float(lon))] = [0, {}, {}]
+        point[0] += count
+        point[1][status] = point[1].get(status, 0) + count
+        point[2][severity] = point[2].get(severity, 0) + count
+    return [(lat, lon, count, statuses, severities) for (lat, lon), (count, statuses, severities) in points.items()]
+
+
+def _fold(points, cell_deg):
+    cells = {}
+    for lat, lon, count, statuses, severities in points:
+        key = (math.floor(lat / cell_deg), math.floor(lon / cell_deg))
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = [0.0, 0.0, 0, 0, {}, {}]
+        cell[0] += lat * count
+        cell[1] += lon * count
+        cell[2] += count
+        cell[3] += 1
+        _merge(cell[4], statuses)
+        _merge(cell[5], severities)
+    # Markers sit on the issue-weighted centre of their cell, not its corner
+    return [
+        Cluster(lat_sum / count, lon_sum / count, count, locations, statuses, severities)
+        for lat_sum, lon_sum, count, locations, statuses, severities in cells.values()
+    ]
+
+
+def cluster(rows, zoom, max_clusters=MAX_CLUSTERS):
+    # rows: (latitude, longitude, status, severity, issue_count) tuples.
+    # Returns (clusters, zoom used), largest clusters first.
+    points = _by_location(rows)
+    zoom = int(zoom)
+    while True:
+        clusters = _fold(points, cell_size_deg(zoom))
+        if len(clusters) <= max_clusters or zoom <= 0:
+            break
+        zoom -= 1
+    clusters.sort(key=lambda c: c.issue_count, reverse=True)
+    return clusters, zoom
@@ -0,0 +1,275 @@
+"""Query instrumentation: latency, rows and callers per statement and per page.
+
+civic_db reports every statement it runs to ``record()``, and how long the
+caller waited for a pooled connection to ``record_acquire()``. Statements
+are grouped by their SQL text (comments dropped, whitespace collapsed, IN
+lists folded) and totalled for the life of the process. civic_issue wraps
+each rerun in ``rerun(page)``, so the queries a rerun issued are also added
+up per page, and the rerun's own summary is available to show afterwards.
+
+Statements slower than CIVIC_SLOW_QUERY_MS (default 250, 0 turns the log
+off) are appended as JSON lines to CIVIC_SLOW_QUERY_LOG (default
+``civic-slow-queries.log`` next to the app), with the statement's query
+plan when CIVIC_SLOW_QUERY_EXPLAIN=1. Parameters are never logged, only
+their count. CIVIC_DIAGNOSTICS=1 adds a Diagnostics tab to the staff
+dashboard. CIVIC_METRICS=0 turns all of it off.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+
+
+ENABLED = os.environ.get('CIVIC_METRICS', '1') != '0'
+SLOW_QUERY_MS = float(os.environ.get('CIVIC_SLOW_QUERY_MS', '250'))
+SLOW_QUERY_LOG = os.environ.get('CIVIC_SLOW_QUERY_LOG') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'civic-slow-queries.log')
+SLOW_QUERY_EXPLAIN = os.environ.get('CIVIC_SLOW_QUERY_EXPLAIN', '0') == '1'
+DIAGNOSTICS = os.environ.get('CIVIC_DIAGNOSTICS', '0') == '1'
+
+# Distinct statements tracked; anything past this is counted under OTHER
+MAX_STATEMENTS = 500
+OTHER = '(other statements)'
+# Statements kept in a rerun's summary
+RERUN_TOP = 5
+
+_COMMENT = re.compile(r'--[^\n]*')
+_SPACES = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+_PLANNABLE = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+
+# Frames that are plumbing rather than the code that wanted the data
+_SKIP_FILES = {'civic_db.py', 'civic_metrics.py', 'contextlib.py'}
+_SKIP_FUNCTIONS = {'query_db', 'execute_db'}
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    sql = _SPACES.sub(' ', _COMMENT.sub('', sql)).strip()
+    return _IN_LIST.sub('(%s, ...)', sql)
+
+
+def _caller():
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        filename = os.path.basename(code.co_filename)
+        if filename not in _SKIP_FILES and code.co_name not in _SKIP_FUNCTIONS:
+            return f"{os.path.splitext(filename)[0]}.{code.co_name}"
+        frame = frame.f_back
+    return '?'
+
+
+# --- PROCESS-WIDE TOTALS ---
+
+_lock = threading.Lock()
+_statements = {}
+_pages = {}
+_totals = {'queries': 0, 'seconds': 0.0, 'errors': 0, 'acquires': 0, 'acquire_seconds': 0.0, 'slow': 0, 'log_errors': 0}
+_since = time.time()
+_local = threading.local()
+
+
+class Rerun:
+    # What one script run asked of the database
+
+    def __init__(self, page):
+        self.page = page
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.queries = 0
+        self.rows = 0
+        self.db_seconds = 0.0
+        self.acquire_seconds = 0.0
+        self.statements = {}  # fingerprint -> [calls, seconds, caller]
+
+    def add(self, key, seconds, rows, caller):
+        self.queries += 1
+        self.rows += rows or 0
+        self.db_seconds += seconds
+        entry = self.statements.setdefault(key, [0, 0.0, caller])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def summary(self):
+        top = sorted(self.statements.items(), key=lambda item: -item[1][1])[:RERUN_TOP]
+        return {
+            'page': self.page,
+            'seconds': self.seconds,
+            'db_seconds': self.db_seconds,
+            'acquire_seconds': self.acquire_seconds,
+            'queries': self.queries,
+            'rows': self.rows,
+            'top': [{'sql': sql, 'calls': calls, 'seconds': seconds, 'caller': caller} for sql, (calls, seconds, caller) in top],
+        }
+
+
+@contextmanager
+def rerun(page):
+    # Collects the statements run on this thread until the block exits and
+    # adds them to the page's totals. Yields the Rerun (None when disabled).
+    if not ENABLED:
+        yield None
+        return
+    current, previous = Rerun(page), getattr(_local, 'rerun', None)
+    _local.rerun = current
+    try:
+        yield current
+    finally:
+        _local.rerun = previous
+        current.seconds = time.perf_counter() - current.started
+        with _lock:
+            totals = _pages.setdefault(page, {'reruns': 0, 'seconds': 0.0, 'db_seconds': 0.0, 'acquire_seconds': 0.0, 'queries': 0, 'max_seconds': 0.0})
+            totals['reruns'] += 1
+            totals['seconds'] += current.seconds
+            totals['db_seconds'] += current.db_seconds
+            totals['acquire_seconds'] += current.acquire_seconds
+            totals['queries'] += current.queries
+            totals['max_seconds'] = max(totals['max_seconds'], current.seconds)
+
+
+def record(sql, seconds, rows=None, error=None, explain=None):
+    # One finished statement. rows: rows returned or affected; explain: a
+    # callable returning the query plan, run only for slow SELECTs when
+    # CIVIC_SLOW_QUERY_EXPLAIN is on, and inside capture_plans().
+    if not ENABLED:
+        return
+    key, caller = fingerprint(sql), _caller()
+    with _lock:
+        if key not in _statements and len(_statements) >= MAX_STATEMENTS:
+            key = OTHER
+        entry = _statements.get(key)
+        if entry is None:
+            entry = _statements[key] = {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'rows': 0, 'errors': 0, 'callers': {}}
+        entry['calls'] += 1
+        entry['seconds'] += seconds
+        entry['max_seconds'] = max(entry['max_seconds'], seconds)
+        entry['rows'] += rows or 0
+        entry['callers'][caller] = entry['callers'].get(caller, 0) + 1
+        _totals['queries'] += 1
+        _totals['seconds'] += seconds
+        if error is not None:
+            entry['errors'] += 1
+            _totals['errors'] += 1
+    current = getattr(_local, 'rerun', None)
+    if current is not None:
+        current.add(key, seconds, rows, caller)
+    plans = getattr(_local, 'plans', None)
+    if plans is not None and explain is not None and key not in plans and _PLANNABLE.match(sql):
+        try:
+            plans[key] = {'caller': caller, 'plan': explain()}
+        except Exception as err:
+            plans[key] = {'caller': caller, 'error': str(err)}
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        _log_slow(sql, seconds, rows, error, caller, current, explain)
+
+
+def record_acquire(seconds):
+    if not ENABLED:
+        return
+    with _lock:
+        _totals['acquires'] += 1
+        _totals['acquire_seconds'] += seconds
+    current = getattr(_local, 'rerun', None)
+    if current is not None:
+        current.acquire_seconds += seconds
+
+
+@contextmanager
+def capture_plans():
+    # Yields a dict that fills with {fingerprint: {'caller', 'plan' or
+    # 'error'}} for every distinct SELECT this thread runs in the block
+    # (used by civic_advisor)
+    plans, previous = {}, getattr(_local, 'plans', None)
+    _local.plans = plans
+    try:
+        yield plans
+    finally:
+        _local.plans = previous
+
+
+# --- SLOW-QUERY LOG ---
+
+_log_lock = threading.Lock()
+
+
+def _log_slow(sql, seconds, rows, error, caller, current, explain):
+    entry = {
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'ms': round(seconds * 1000, 1),
+        'rows': rows,
+        'caller': caller,
+        'page': current.page if current is not None else None,
+        'sql': fingerprint(sql),
+    }
+    if error is not None:
+        entry['error'] = str(error)
+    elif SLOW_QUERY_EXPLAIN and explain is not None and _PLANNABLE.match(sql):
+        try:
+            entry['plan'] = explain()
+        except Exception as err:
+            entry['plan_error'] = str(err)
+    with _lock:
+        _totals['slow'] += 1
+    try:
+        with _log_lock, open(SLOW_QUERY_LOG, 'a', encoding='utf-8') as handle:
+            handle.write(json.dumps(entry, default=str) + '\n')
+    except OSError:
+        with _lock:
+            _totals['log_errors'] += 1
+
+
+# --- REPORTING ---
+
+def top_statements(limit=20, order='seconds'):
+    # [{sql, calls, seconds, avg_ms, max_ms, rows, errors, callers}] by
+    # total time (or 'calls' / 'max_seconds')
+    with _lock:
+        items = [(sql, dict(entry, callers=dict(entry['callers']))) for sql, entry in _statements.items()]
+    items.sort(key=lambda item: -item[1][order])
+    return [{
+        'sql': sql,
+        'calls': entry['calls'],
+        'seconds': entry['seconds'],
+        'avg_ms': entry['seconds'] * 1000 / entry['calls'],
+        'max_ms': entry['max_seconds'] * 1000,
+        'rows': entry['rows'],
+        'errors': entry['errors'],
+        'callers': sorted(entry['callers'], key=lambda caller: -entry['callers'][caller]),
+    } for sql, entry in items[:limit]]
+
+
+def page_stats():
+    # {page: totals} with per-rerun averages added
+    with _lock:
+        pages = {page: dict(totals) for page, totals in _pages.items()}
+    for totals in pages.values():
+        reruns = totals['reruns']
+        totals.update(
+            avg_ms=totals['seconds'] * 1000 / reruns,
+            avg_db_ms=totals['db_seconds'] * 1000 / reruns,
+            avg_acquire_ms=totals['acquire_seconds'] * 1000 / reruns,
+            avg_queries=totals['queries'] / reruns,
+        )
+    return pages
+
+
+def stats():
+    with _lock:
+        result = dict(_totals)
+        result.update(statements=len(_statements), since=_since)
+    return result
+
+
+def reset():
+    global _since
+    with _lock:
+        _statements.clear()
+        _pages.clear()
+        for name in _totals:
+            _totals[name] = 0.0 if name.endswith('seconds') else 0
+        _since = time.time()
@@ -0,0 +1,84 @@
+"""Versioned schema migrations.
+
+Each backend has its own numbered SQL files in ``migrations/<backend>/``
+(``0002_performance_indexes.sql``), applied in order by
+``civic_admin.py migrate`` and recorded in ``schema_migrations``. A file is
+a series of statements separated by ``;`` at the end of a line. A
+``CREATE INDEX`` whose index already exists is skipped, so a migration that
+stopped half-way (MySQL commits every DDL statement on its own) can simply
+be run again.
+
+The tables civic_db maintains itself (APP_TABLES) are still created on
+connect; migrations are for changes to the core schema and for anything too
+slow to run on connect, such as building indexes on a large ISSUES table.
+"""
+import os
+import re
+from collections import namedtuple
+from datetime import datetime
+
+import civic_db
+
+
+Migration = namedtuple('Migration', ['version', 'name', 'path'])
+
+_FILE = re.compile(r'^(\d{4})_(\w+)\.sql$')
+_CREATE_INDEX = re.compile(r'^\s*CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s+ON\s+(\w+)', re.IGNORECASE)
+_STATEMENT_END = re.compile(r';\s*$', re.MULTILINE)
+
+
+def available(backend=None):
+    # Migrations shipped for the backend, oldest first
+    backend = backend or civic_db.get_backend()
+    directory = os.path.join(civic_db.MIGRATIONS_DIR, backend.name)
+    migrations = []
+    for filename in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        match = _FILE.match(filename)
+        if match:
+            migrations.append(Migration(int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    return migrations
+
+
+def statements(path):
+    # The file's statements without comment-only lines
+    with open(path, encoding='utf-8') as handle:
+        text = '\n'.join(line for line in handle.read().splitlines() if not line.lstrip().startswith('--'))
+    return [statement.strip() for statement in _STATEMENT_END.split(text) if statement.strip()]
+
+
+def applied():
+    # {version: applied_at}
+    with civic_db.connection() as conn:
+        return {int(row['version']): row['applied_at'] for row in conn.query("SELECT version, applied_at FROM schema_migrations")}
+
+
+def status():
+    # [(Migration, applied_at or None)] for every shipped migration
+    done = applied()
+    return [(migration, done.get(migration.version)) for migration in available()]
+
+
+def pending():
+    return [migration for migration, applied_at in status() if applied_at is None]
+
+
+def migrate(progress=None):
+    # Applies every pending migration in order and returns them. progress,
+    # if given, is called with (migration, statement, skipped) per statement.
+    done = []
+    for migration in pending():
+        with civic_db.connection() as conn:
+            for statement in statements(migration.path):
+                index = _CREATE_INDEX.match(statement)
+                skipped = bool(index) and conn.backend.index_exists(conn, index.group(2), index.group(1))
+                if progress:
+                    progress(migration, statement, skipped)
+                if not skipped:
+                    conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)",
+                (migration.version, migration.name, datetime.now().replace(microsecond=0)),
+            )
+            conn.commit()
+        done.append(migration)
+    return done
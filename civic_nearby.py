@@ -0,0 +1,181 @@
+"""Proximity queries: which open issues are already reported near a point.
+
+Issues are reported against LOCATIONS, so the index is two-level: a
+GridIndex (civic_spatial) over the locations that have open issues, and
+the open issues bucketed by location. A radius query visits only the grid
+cells overlapping the circle, then expands the matching locations into
+their issues and applies the filters, instead of scanning every issue.
+
+Like the duplicate detector, the index lives in process memory, is built
+from the database on first use, is kept current by civic_store's write
+paths and is rebuilt every CIVIC_NEARBY_TTL seconds to pick up changes
+made by other processes. CIVIC_NEARBY_RADIUS_M sets the default search
+radius (500 m).
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+
+import civic_db
+import civic_spatial
+
+
+RADIUS_M = float(os.environ.get('CIVIC_NEARBY_RADIUS_M', '500'))
+INDEX_TTL = float(os.environ.get('CIVIC_NEARBY_TTL', '300'))
+
+OPEN_STATUS_IDS = (1, 2)
+CELL_M = 250.0
+# k-nearest searches stop widening here
+MAX_RADIUS_M = 20000.0
+DESCRIPTION_CHARS = 160
+
+NearbyIssue = namedtuple('NearbyIssue', [
+    'issue_id', 'distance_m', 'location_id', 'status_id', 'category_id', 'severity', 'description', 'created_at',
+])
+_Entry = namedtuple('_Entry', ['location_id', 'status_id', 'category_id', 'severity', 'description', 'created_at'])
+
+
+def _matches(issue_id, entry, filters):
+    # filters: status_id, category_id, severity, exclude_issue_id (all optional)
+    if filters.get('exclude_issue_id') is not None and issue_id == int(filters['exclude_issue_id']):
+        return False
+    if filters.get('status_id') is not None and entry.status_id != int(filters['status_id']):
+        return False
+    if filters.get('category_id') is not None and entry.category_id != int(filters['category_id']):
+        return False
+    if filters.get('severity') is not None and entry.severity != filters['severity']:
+        return False
+    return True
+
+
+class NearbyIndex:
+    # Thread-safe; every method takes the lock for the little work it does
+
+    def __init__(self, cell_m=CELL_M):
+        self.built_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._grid = civic_spatial.GridIndex(cell_m=cell_m)  # location_id -> point
+        self._points = {}     # location_id -> (lat, lon), also for locations without open issues
+        self._by_location = {}  # location_id -> {issue_id}
+        self._issues = {}     # issue_id -> _Entry
+
+    def __len__(self):
+        return len(self._issues)
+
+    def set_location(self, location_id, lat, lon):
+        if lat is None or lon is None:
+            return
+        with self._lock:
+            self._points[int(location_id)] = (float(lat), float(lon))
+
+    def add(self, issue_id, location_id, status_id, category_id, severity, description, created_at):
+        issue_id, location_id = int(issue_id), int(location_id)
+        with self._lock:
+            point = self._points.get(location_id)
+            if point is None:
+                return
+            self._remove(issue_id)
+            self._issues[issue_id] = _Entry(location_id, int(status_id), int(category_id), severity, (description or '')[:DESCRIPTION_CHARS], created_at)
+            if location_id not in self._by_location:
+                self._grid.add(location_id, *point)
+            self._by_location.setdefault(location_id, set()).add(issue_id)
+
+    def remove(self, issue_ids):
+        with self._lock:
+            for issue_id in issue_ids:
+                self._remove(int(issue_id))
+
+    def _remove(self, issue_id):
+        entry = self._issues.pop(issue_id, None)
+        if entry is None:
+            return
+        members = self._by_location[entry.location_id]
+        members.discard(issue_id)
+        if not members:
+            del self._by_location[entry.location_id]
+            self._grid.remove(entry.location_id)
+
+    def set_status(self, issue_ids, status_id):
+        # Follows a status change: issues that are no longer open leave the
+        # index. Issues re-opened here are not known to it until the next
+        # rebuild, unless the caller add()s them.
+        status_id = int(status_id)
+        with self._lock:
+            for issue_id in issue_ids:
+                issue_id = int(issue_id)
+                entry = self._issues.get(issue_id)
+                if entry is None:
+                    continue
+                if status_id in OPEN_STATUS_IDS:
+                    self._issues[issue_id] = entry._replace(status_id=status_id)
+                else:
+                    self._remove(issue_id)
+
+    def nearby(self, lat, lon, radius_m=RADIUS_M, filters=None, limit=None):
+        # [NearbyIssue] within radius_m, nearest first (newest first at the
+        # same location)
+        filters = filters or {}
+        found = []
+        with self._lock:
+            for distance, location_id in self._grid.within(lat, lon, radius_m):
+                entries = [(issue_id, self._issues[issue_id]) for issue_id in self._by_location[location_id]]
+                entries.sort(key=lambda item: item[0], reverse=True)
+                for issue_id, entry in entries:
+                    if _matches(issue_id, entry, filters):
+                        found.append(NearbyIssue(issue_id, round(distance, 1), *entry))
+                        if limit is not None and len(found) >= limit:
+                            return found
+        return found
+
+    def nearest(self, lat, lon, k, filters=None, max_radius_m=MAX_RADIUS_M):
+        # The k closest matching issues, widening the search circle until
+        # enough are found or max_radius_m is reached
+        radius = self._grid.cell_deg * civic_spatial.METERS_PER_DEGREE_LAT
+        while True:
+            found = self.nearby(lat, lon, radius, filters, k)
+            if len(found) >= k or radius >= max_radius_m:
+                return found
+            radius = min(radius * 2, max_radius_m)
+
+
+def load():
+    # An index over every location and every open issue in the database
+    index = NearbyIndex()
+    placeholders = ', '.join(['%s'] * len(OPEN_STATUS_IDS))
+    with civic_db.connection() as conn:
+        locations = conn.query("SELECT location_id, latitude, longitude FROM LOCATIONS")
+        issues = conn.query(
+            "SELECT issue_id, location_id, status_id, category_id, severity, description, created_at "
+            f"FROM ISSUES WHERE status_id IN ({placeholders})",
+            OPEN_STATUS_IDS,
+        )
+    for row in locations:
+        index.set_location(row['location_id'], row['latitude'], row['longitude'])
+    for row in issues:
+        index.add(row['issue_id'], row['location_id'], row['status_id'], row['category_id'], row['severity'],
+                  row['description'], civic_db.to_datetime(row['created_at']))
+    return index
+
+
+_index = civic_spatial.SharedIndex(load, INDEX_TTL)
+
+
+def get_index():
+    # The process-wide index, (re)built when missing or older than the TTL
+    return _index.get()
+
+
+def loaded_index():
+    # The index if one has been built in this process, without loading
+    return _index.loaded()
+
+
+def nearby_issues(lat, lon, radius_m=RADIUS_M, filters=None, limit=None):
+    # Open issues within radius_m of (lat, lon), nearest first. filters is a
+    # dict with any of status_id, category_id, severity, exclude_issue_id.
+    return get_index().nearby(lat, lon, radius_m, filters, limit)
+
+
+def nearest_issues(lat, lon, k, filters=None, max_radius_m=MAX_RADIUS_M):
+    return get_index().nearest(lat, lon, k, filters, max_radius_m)
@@ -0,0 +1,253 @@
+"""Issue photo storage.
+
+Uploads are streamed to disk under their SHA-256, so the same photo sent
+twice is stored once and two different photos can never overwrite each
+other. ISSUES.photo_path holds the resulting key (``<sha256>.<ext>``).
+
+Originals stay private (they may carry GPS EXIF data). A process pool
+derives two public variants off the request path:
+
+* ``clean``: the full-size image re-encoded without EXIF (orientation applied)
+* ``thumb``: a small JPEG for the staff views
+
+The public variants are written under static/photos by default, so they
+are served by Streamlit's static file serving and the browser loads them
+lazily and caches them.
+
+Settings:
+
+* CIVIC_PHOTO_BACKEND (``local``)
+* CIVIC_PHOTO_DIR (originals, default ``uploads/``)
+* CIVIC_PHOTO_PUBLIC_DIR (default ``static/photos``)
+* CIVIC_PHOTO_MAX_BYTES (10 MB)
+* CIVIC_PHOTO_MAX_PIXELS (40 million)
+* CIVIC_PHOTO_WORKERS (2)
+"""
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import civic_assets
+
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PHOTO_BACKEND = os.environ.get('CIVIC_PHOTO_BACKEND', 'local')
+PHOTO_DIR = os.environ.get('CIVIC_PHOTO_DIR') or os.path.join(APP_DIR, 'uploads')
+PHOTO_PUBLIC_DIR = os.environ.get('CIVIC_PHOTO_PUBLIC_DIR') or os.path.join(civic_assets.STATIC_DIR, 'photos')
+MAX_BYTES = int(os.environ.get('CIVIC_PHOTO_MAX_BYTES', str(10 * 1024 * 1024)))
+MAX_PIXELS = int(os.environ.get('CIVIC_PHOTO_MAX_PIXELS', '40000000'))
+WORKERS = int(os.environ.get('CIVIC_PHOTO_WORKERS', '2'))
+
+THUMB_SIZE = (320, 320)
+CHUNK_SIZE = 64 * 1024
+
+ORIGINAL, CLEAN, THUMB = 'original', 'clean', 'thumb'
+
+# Magic bytes -> extension; anything else is rejected before it is stored
+SIGNATURES = [
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+]
+
+_KEY = re.compile(r'^[0-9a-f]{64}\.(jpg|png)$')
+
+
+class PhotoError(Exception):
+    pass
+
+
+class PhotoTooLarge(PhotoError):
+    pass
+
+
+class UnsupportedPhoto(PhotoError):
+    pass
+
+
+def is_photo_key(value):
+    # False for the old "/uploads/<name>" placeholders
+    return bool(value) and bool(_KEY.match(str(value)))
+
+
+class LocalPhotoStore:
+    name = 'local'
+
+    def __init__(self, root, public_root):
+        self.root = root
+        self.public_root = public_root
+
+    def path(self, key, variant=ORIGINAL):
+        # Two levels of fan-out keep directories small
+        digest = key.split('.')[0]
+        base = self.root if variant == ORIGINAL else os.path.join(self.public_root, variant)
+        name = key if variant == ORIGINAL else f"{digest}.jpg"
+        return os.path.join(base, digest[:2], digest[2:4], name)
+
+    def url(self, key, variant):
+        # URL for a public variant when it is served by Streamlit, else None
+        public = os.path.realpath(self.public_root)
+        static = os.path.realpath(civic_assets.STATIC_DIR)
+        if variant == ORIGINAL or os.path.commonpath([public, static]) != static:
+            return None
+        relative = os.path.relpath(self.path(key, variant), static).replace(os.sep, '/')
+        return f"{civic_assets.STATIC_URL}/{relative}"
+
+    def exists(self, key, variant=ORIGINAL):
+        return os.path.exists(self.path(key, variant))
+
+    def read(self, key, variant=ORIGINAL):
+        with open(self.path(key, variant), 'rb') as photo:
+            return photo.read()
+
+    def put(self, stream, max_bytes=MAX_BYTES):
+        # Streams to a temp file while hashing; returns the key. Identical
+        # content ends up at the same path, so a repeat upload is dropped.
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        size, extension = 0, None
+        handle, temp_path = tempfile.mkstemp(dir=self.root, prefix='.upload-')
+        try:
+            with os.fdopen(handle, 'wb') as temp:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if extension is None:
+                        extension = next((ext for magic, ext in SIGNATURES if chunk.startswith(magic)), None)
+                        if extension is None:
+                            raise UnsupportedPhoto("Only JPEG and PNG photos are accepted.")
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise PhotoTooLarge(f"Photos can be at most {max_bytes / (1024 * 1024):.3g} MB.")
+                    digest.update(chunk)
+                    temp.write(chunk)
+                temp.flush()
+                os.fsync(temp.fileno())
+            if extension is None:
+                raise UnsupportedPhoto("The photo is empty.")
+            key = f"{digest.hexdigest()}.{extension}"
+            final_path = self.path(key)
+            if os.path.exists(final_path):
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(temp_path, final_path)
+            return key
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+PHOTO_BACKENDS = {
+    'local': lambda: LocalPhotoStore(PHOTO_DIR, PHOTO_PUBLIC_DIR),
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if PHOTO_BACKEND not in PHOTO_BACKENDS:
+                    raise ValueError(f"Unknown CIVIC_PHOTO_BACKEND {PHOTO_BACKEND!r}; expected one of {sorted(PHOTO_BACKENDS)}")
+                _store = PHOTO_BACKENDS[PHOTO_BACKEND]()
+    return _store
+
+
+def save_upload(uploaded_file):
+    # Stores a Streamlit UploadedFile (or any binary stream) and queues its
+    # variants. Returns the photo key; raises PhotoError for bad uploads.
+    uploaded_file.seek(0)
+    key = get_store().put(uploaded_file)
+    schedule_variants(key)
+    return key
+
+
+# --- VARIANTS (process pool) ---
+
+def make_variants(original_path, clean_path, thumb_path, max_pixels=MAX_PIXELS):
+    # Runs in a worker process. Writes via temp files so a half-written
+    # variant is never served.
+    from PIL import Image, ImageOps
+
+    # Pillow only refuses images over twice MAX_IMAGE_PIXELS (it just warns
+    # below that), so the limit is checked here before anything is decoded
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    with Image.open(original_path) as image:
+        if image.width * image.height > max_pixels:
+            raise PhotoTooLarge(f"{image.width}x{image.height} is over {max_pixels} pixels")
+        # Apply the EXIF orientation before the EXIF block is dropped
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for path, resized in ((clean_path, image), (thumb_path, image.copy())):
+            if path == thumb_path:
+                resized.thumbnail(THUMB_SIZE)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.tmp"
+            # Saving without exif= writes no EXIF/GPS metadata
+            resized.save(temp_path, 'JPEG', quality=85, optimize=True, progressive=True)
+            os.replace(temp_path, path)
+    return thumb_path
+
+
+_pool = None
+_pending = {}
+# key -> error for images the workers could not process
+_failed = {}
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, not fork: forking the threaded Streamlit server can copy a
+        # lock some other thread holds and hang the worker. The workers only
+        # need PIL and their arguments.
+        _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def schedule_variants(key):
+    # Queues clean/thumb generation for key unless it is done, queued or
+    # already failed (an undecodable image is not retried on every view)
+    store = get_store()
+    if key in _failed or (store.exists(key, THUMB) and store.exists(key, CLEAN)):
+        return None
+    with _pool_lock:
+        future = _pending.get(key)
+        if future is not None:
+            return future
+        future = _get_pool().submit(make_variants, store.path(key, ORIGINAL), store.path(key, CLEAN), store.path(key, THUMB))
+        _pending[key] = future
+    # Outside the lock: the callback runs right here if the job already ended
+    future.add_done_callback(lambda done, key=key: _finished(key, done))
+    return future
+
+
+def _finished(key, future):
+    with _pool_lock:
+        _pending.pop(key, None)
+        if future.exception() is not None:
+            _failed[key] = f"{type(future.exception()).__name__}: {future.exception()}"
+
+
+def thumbnail(key):
+    # (thumb_url, clean_url) once the variants exist; otherwise queues them
+    # and returns None (raises PhotoError if processing failed). URLs are None when the public directory is not
+    # served statically - read the bytes with get_store().read() instead.
+    store = get_store()
+    if not store.exists(key, THUMB):
+        if key in _failed:
+            raise PhotoError(f"Photo could not be processed ({_failed[key]})")
+        if store.exists(key, ORIGINAL):
+            schedule_variants(key)
+        return None
+    return store.url(key, THUMB), store.url(key, CLEAN)
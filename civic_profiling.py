@@ -0,0 +1,272 @@
+"""Per-rerun render profiling, off unless CIVIC_PROFILE=1.
+
+While a profiled rerun runs, a sampler thread looks at the script thread's
+stack every CIVIC_PROFILE_INTERVAL_MS (default 5) and charges the time
+since its last look to one section. The section is the outermost library
+frame on the stack:
+
+    db       civic_db and the database drivers
+    figure   plotly (including the pandas work it does for a chart)
+    pandas   pandas / numpy called from app code (DataFrame copies, iterrows)
+    widgets  streamlit element emission (including its own serialisation)
+    css      anything under load_react_ui_css
+    app      our own Python when no library is involved
+
+Streamlit's caching wrappers are see-through, so a cache miss is charged to
+what the cached function does. Functions decorated with ``@profiled`` (the
+page functions) are also timed exactly, and each rerun records the change
+in process RSS and, with CIVIC_PROFILE_MEMORY=1, in tracemalloc's current
+and peak traced memory. Both are process-wide, so concurrent sessions blur
+them.
+
+Each rerun appends one JSON line to ``reruns.jsonl`` and its stacks, in the
+folded "frame;frame;frame weight" format flamegraph.pl and speedscope read
+(weight in microseconds, rooted at the page), to ``stacks.folded``. Both go
+in CIVIC_PROFILE_DIR (default ``profiles/`` next to the app).
+``civic_admin.py profile-report`` summarises reruns.jsonl per page.
+"""
+import json
+import os
+import sys
+import sysconfig
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+
+ENABLED = os.environ.get('CIVIC_PROFILE', '0') == '1'
+PROFILE_DIR = os.environ.get('CIVIC_PROFILE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+INTERVAL = float(os.environ.get('CIVIC_PROFILE_INTERVAL_MS', '5')) / 1000
+TRACE_MEMORY = ENABLED and os.environ.get('CIVIC_PROFILE_MEMORY', '0') == '1'
+
+RERUNS_FILE = 'reruns.jsonl'
+STACKS_FILE = 'stacks.folded'
+SECTIONS = ('db', 'figure', 'pandas', 'widgets', 'css', 'app')
+
+# (module prefix, section), checked from the outermost frame inwards
+_LIBRARIES = (
+    ('civic_db', 'db'), ('sqlite3', 'db'), ('mysql', 'db'),
+    ('plotly', 'figure'),
+    ('pandas', 'pandas'), ('numpy', 'pandas'),
+    ('streamlit', 'widgets'),
+)
+_CSS_FUNCTIONS = {'load_react_ui_css'}
+# Plumbing that should not decide the section
+_TRANSPARENT = ('streamlit.runtime.caching', 'civic_metrics', 'civic_profiling', 'contextlib', 'functools', 'threading')
+
+_LIBRARY_DIRS = tuple(sorted(
+    {os.path.normpath(path) + os.sep for name, path in sysconfig.get_paths().items() if name in ('purelib', 'platlib', 'stdlib', 'platstdlib')},
+    key=len, reverse=True,
+))
+_modules = {}
+
+
+def _module(filename):
+    # "pandas.core.frame" for library files, "civic_issue" for ours
+    module = _modules.get(filename)
+    if module is None:
+        path = os.path.normpath(filename)
+        for prefix in _LIBRARY_DIRS:
+            if path.startswith(prefix):
+                path = path[len(prefix):]
+                break
+        else:
+            path = os.path.basename(path)
+        module = _modules[filename] = os.path.splitext(path)[0].replace(os.sep, '.')
+    return module
+
+
+def _section(frames):
+    # frames: [(module, function name)] outermost first
+    for module, function in frames:
+        if function in _CSS_FUNCTIONS:
+            return 'css'
+        if module.startswith(_TRANSPARENT):
+            continue
+        for prefix, section in _LIBRARIES:
+            if module.startswith(prefix):
+                return section
+    return 'app'
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as handle:
+            return int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class RerunProfile:
+    def __init__(self, page, thread_id, root_depth):
+        self.page = page
+        self.thread_id = thread_id
+        # Frames above the profiled block (Streamlit's script runner) are cut off
+        self.root_depth = root_depth
+        self.started = time.perf_counter()
+        self.last_sample = self.started
+        self.samples = 0
+        self.sections = dict.fromkeys(SECTIONS, 0.0)
+        self.functions = {}
+        self.stacks = Counter()
+        self.rss = _rss_bytes()
+        self.traced = tracemalloc.get_traced_memory()[0] if TRACE_MEMORY else None
+
+    def sample(self, frame, now):
+        elapsed, self.last_sample = now - self.last_sample, now
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack.reverse()
+        frames = [(_module(code.co_filename), code.co_name) for code in stack[self.root_depth:]]
+        self.samples += 1
+        self.sections[_section(frames)] += elapsed
+        self.stacks[';'.join([self.page] + [f"{module}.{function}" for module, function in frames])] += int(elapsed * 1000000)
+
+
+# --- SAMPLER ---
+
+_lock = threading.Condition()
+_active = {}  # thread id -> RerunProfile
+_sampler = None
+_write_lock = threading.Lock()
+_local = threading.local()
+
+
+def _sample_forever():
+    while True:
+        with _lock:
+            while not _active:
+                _lock.wait()
+        time.sleep(INTERVAL)
+        frames = sys._current_frames()
+        now = time.perf_counter()
+        with _lock:
+            for thread_id, profile in _active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    profile.sample(frame, now)
+
+
+def _start_sampler():
+    global _sampler
+    with _lock:
+        if _sampler is None:
+            if TRACE_MEMORY and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            _sampler = threading.Thread(target=_sample_forever, name='civic-profiler', daemon=True)
+            _sampler.start()
+
+
+@contextmanager
+def rerun(page, metrics=None):
+    # Profiles the block (the whole rerun) on this thread. metrics: the
+    # civic_metrics Rerun for the same block, for exact DB time and queries.
+    if not ENABLED:
+        yield None
+        return
+    _start_sampler()
+    if TRACE_MEMORY:
+        tracemalloc.reset_peak()
+    depth, frame = 0, sys._getframe(2)
+    while frame is not None:
+        depth, frame = depth + 1, frame.f_back
+    profile = RerunProfile(page, threading.get_ident(), depth - 1)
+    with _lock:
+        _active[profile.thread_id] = profile
+        _lock.notify()
+    previous, _local.profile = getattr(_local, 'profile', None), profile
+    try:
+        yield profile
+    finally:
+        _local.profile = previous
+        with _lock:
+            _active.pop(profile.thread_id, None)
+        _write(profile, time.perf_counter() - profile.started, metrics)
+
+
+def profiled(func):
+    # Times every call of func into the current rerun's profile
+    if not ENABLED:
+        return func
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        profile = getattr(_local, 'profile', None)
+        if profile is None:
+            return func(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.functions[func.__name__] = profile.functions.get(func.__name__, 0.0) + time.perf_counter() - started
+    return wrapper
+
+
+def _write(profile, seconds, metrics):
+    # The time after the last sample is charged to nothing: it is under one
+    # interval and the exact total is in 'ms'
+    memory = {}
+    rss = _rss_bytes()
+    if rss is not None and profile.rss is not None:
+        memory['rss_delta_kb'] = (rss - profile.rss) // 1024
+    if TRACE_MEMORY:
+        current, peak = tracemalloc.get_traced_memory()
+        memory['traced_delta_kb'] = (current - profile.traced) // 1024
+        memory['traced_peak_kb'] = (peak - profile.traced) // 1024
+    entry = {
+        'at': datetime.now().isoformat(timespec='seconds'),
+        'page': profile.page,
+        'pid': os.getpid(),
+        'ms': round(seconds * 1000, 1),
+        'samples': profile.samples,
+        'sections_ms': {name: round(value * 1000, 1) for name, value in profile.sections.items()},
+        'functions_ms': {name: round(value * 1000, 1) for name, value in profile.functions.items()},
+        'memory': memory,
+    }
+    if metrics is not None:
+        entry.update(db_ms=round(metrics.db_seconds * 1000, 1), queries=metrics.queries)
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with _write_lock:
+            with open(os.path.join(PROFILE_DIR, RERUNS_FILE), 'a', encoding='utf-8') as handle:
+                handle.write(json.dumps(entry) + '\n')
+            with open(os.path.join(PROFILE_DIR, STACKS_FILE), 'a', encoding='utf-8') as handle:
+                handle.writelines(f"{stack} {weight}\n" for stack, weight in profile.stacks.items() if weight)
+    except OSError:
+        pass
+
+
+# --- REPORT ---
+
+def summarize(path=None):
+    # {page: averages per rerun} from a reruns.jsonl file
+    path = path or os.path.join(PROFILE_DIR, RERUNS_FILE)
+    pages = {}
+    with open(path, encoding='utf-8') as handle:
+        for line in handle:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            totals = pages.setdefault(entry['page'], {'reruns': 0, 'ms': 0.0, 'db_ms': 0.0, 'rss_delta_kb': 0, 'sections_ms': dict.fromkeys(SECTIONS, 0.0), 'functions_ms': {}})
+            totals['reruns'] += 1
+            totals['ms'] += entry['ms']
+            totals['db_ms'] += entry.get('db_ms', 0.0)
+            totals['rss_delta_kb'] += entry.get('memory', {}).get('rss_delta_kb', 0)
+            for name, value in entry['sections_ms'].items():
+                totals['sections_ms'][name] = totals['sections_ms'].get(name, 0.0) + value
+            for name, value in entry['functions_ms'].items():
+                totals['functions_ms'][name] = totals['functions_ms'].get(name, 0.0) + value
+    for totals in pages.values():
+        reruns = totals['reruns']
+        for name in ('ms', 'db_ms', 'rss_delta_kb'):
+            totals[name] /= reruns
+        for group in ('sections_ms', 'functions_ms'):
+            totals[group] = {name: value / reruns for name, value in totals[group].items()}
+    return pages
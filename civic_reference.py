@@ -0,0 +1,94 @@
+"""Process-wide reference data: locations, categories and statuses.
+
+One immutable snapshot is shared by every session in the process, with the
+id -> row and label -> id dicts the pages need already built. ``get()``
+reloads it when the civic_cache REFERENCE version is bumped, or once it is
+older than CIVIC_REFERENCE_TTL seconds (default 3600) so edits made outside
+the app still show up.
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+import civic_cache
+import civic_db
+
+
+REFERENCE_TTL = float(os.environ.get('CIVIC_REFERENCE_TTL', '3600'))
+
+Location = namedtuple('Location', 'location_id area address latitude longitude')
+Category = namedtuple('Category', 'category_id name')
+Status = namedtuple('Status', 'status_id name')
+
+
+def location_label(location):
+    # How a location is shown in pickers
+    return f"{location.area} ({location.address})"
+
+
+class ReferenceData:
+    # Read-only once built: the mappings are MappingProxyType views over
+    # dicts nobody else holds, in display order.
+
+    def __init__(self, version, locations, categories, statuses):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.locations = MappingProxyType({loc.location_id: loc for loc in locations})
+        self.location_ids_by_label = MappingProxyType({location_label(loc): loc.location_id for loc in locations})
+        self.categories = MappingProxyType({cat.category_id: cat for cat in categories})
+        self.category_ids_by_name = MappingProxyType({cat.name: cat.category_id for cat in categories})
+        self.statuses = MappingProxyType({status.status_id: status for status in statuses})
+        self.status_ids_by_name = MappingProxyType({status.name: status.status_id for status in statuses})
+
+
+# Returned to callers when loading fails; never stored as the snapshot
+EMPTY = ReferenceData(-1, [], [], [])
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def load(version=0):
+    with civic_db.connection() as conn:
+        locations = [
+            Location(int(row['location_id']), row['area'], row['address'], row['latitude'], row['longitude'])
+            for row in conn.query("SELECT location_id, area, address, latitude, longitude FROM LOCATIONS ORDER BY area, location_id")
+        ]
+        categories = [
+            Category(int(row['category_id']), row['Name'])
+            for row in conn.query("SELECT category_id, Name FROM CATEGORIES ORDER BY Name")
+        ]
+        statuses = [
+            Status(int(row['status_id']), row['status_name'])
+            for row in conn.query("SELECT status_id, status_name FROM STATUS ORDER BY status_id")
+        ]
+    return ReferenceData(version, locations, categories, statuses)
+
+
+def _is_current(snapshot, version):
+    return (
+        snapshot is not None
+        and snapshot.version == version
+        and time.monotonic() - snapshot.loaded_at < REFERENCE_TTL
+    )
+
+
+def get():
+    # The current snapshot, reloading it (once, under a lock) if stale.
+    # Raises civic_db.DatabaseError if it has to load and cannot.
+    global _snapshot
+    version = civic_cache.version(civic_cache.REFERENCE)
+    snapshot = _snapshot
+    if _is_current(snapshot, version):
+        return snapshot
+    with _lock:
+        if not _is_current(_snapshot, version):
+            _snapshot = load(version)
+        return _snapshot
+
+
+def invalidate():
+    # Call after changing LOCATIONS, CATEGORIES or STATUS
+    civic_cache.bump(civic_cache.REFERENCE)
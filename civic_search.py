@@ -0,0 +1,87 @@
+"""Full-text search over issue descriptions, areas and addresses.
+
+Every issue has one row in ``issue_search`` holding its description, area
+and address. On MySQL that table carries a FULLTEXT index (boolean mode,
+every term required, ranked by relevance; words under three letters are
+not indexed and are matched with LIKE instead); on SQLite it is an FTS5 table
+(Porter stemming, ranked by bm25). The dialect details live on the
+civic_db backend, so the queries in civic_issue are written once.
+
+civic_store indexes new issues in the same transaction that inserts them.
+``rebuild()`` (``civic_admin.py rebuild-search``) fills the table for an
+existing database and picks up edits to LOCATIONS.
+
+Ranking scores every candidate, so a query ranks only its newest
+CIVIC_SEARCH_WINDOW matches (default 10000): a one-word query that matches
+a tenth of a million issues still answers in tens of milliseconds, and the
+staff list says when a search should be narrowed.
+"""
+import os
+import re
+
+import civic_cache
+import civic_db
+
+
+RANK_WINDOW = int(os.environ.get('CIVIC_SEARCH_WINDOW', '10000'))
+MAX_TERMS = 8
+REBUILD_BATCH = 5000
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def terms(text):
+    # Search terms from what the user typed: lower-cased words, without
+    # repeats or any query-syntax characters
+    found = []
+    for token in _TOKEN.findall(str(text or '').lower()):
+        if token not in found:
+            found.append(token)
+    return found[:MAX_TERMS]
+
+
+def document(description, area, address):
+    return ' '.join(part for part in (description, area, address) if part)
+
+
+def index_issues(conn, issues):
+    # issues: [(issue_id, description, location_id)], written through conn
+    # so they commit (or roll back) with the caller's transaction
+    if not issues:
+        return
+    location_ids = sorted({int(location_id) for _, _, location_id in issues})
+    placeholders = ', '.join(['%s'] * len(location_ids))
+    locations = {
+        int(row['location_id']): (row['area'], row['address'])
+        for row in conn.query(f"SELECT location_id, area, address FROM LOCATIONS WHERE location_id IN ({placeholders})", location_ids)
+    }
+    conn.executemany(
+        conn.backend.search_upsert_sql,
+        [(int(issue_id), document(description, *locations.get(int(location_id), (None, None)))) for issue_id, description, location_id in issues],
+    )
+
+
+def rebuild(batch_size=REBUILD_BATCH):
+    # Re-indexes every issue, a batch per transaction so the table stays
+    # searchable while it runs. Returns the number of issues indexed.
+    indexed, after = 0, 0
+    while True:
+        with civic_db.connection() as conn:
+            conn.begin()
+            rows = conn.query(
+                "SELECT i.issue_id, i.description, l.area, l.address FROM ISSUES i "
+                "LEFT JOIN LOCATIONS l ON i.location_id = l.location_id "
+                "WHERE i.issue_id > %s ORDER BY i.issue_id LIMIT %s",
+                (after, batch_size),
+            )
+            if not rows:
+                break
+            conn.executemany(
+                conn.backend.search_upsert_sql,
+                [(int(row['issue_id']), document(row['description'], row['area'], row['address'])) for row in rows],
+            )
+            conn.commit()
+        indexed += len(rows)
+        after = int(rows[-1]['issue_id'])
+    civic_cache.bump(civic_cache.ISSUES)
+    return indexed
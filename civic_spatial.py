@@ -0,0 +1,110 @@
+"""Small spatial helpers: great-circle distance and a uniform grid index.
+
+GridIndex buckets points into square-ish cells of ``cell_m`` metres, so a
+radius query only looks at the few cells overlapping the search circle
+instead of every point; the exact distance check then runs on that short
+candidate list. Good enough for one city's worth of issues without
+pulling in a geo library.
+
+SharedIndex holds the one process-wide copy of an in-memory index built
+from the database (the duplicate detector, the nearby index) and rebuilds
+it once it is older than its TTL.
+"""
+import math
+import threading
+import time
+
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE_LAT = 111320.0
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GridIndex:
+    # id -> (lat, lon), bucketed by cell. Cells are cell_m tall; their width
+    # in degrees is the same, so they are narrower (in metres) away from the
+    # equator, which the query accounts for.
+
+    def __init__(self, cell_m=250.0):
+        self.cell_deg = cell_m / METERS_PER_DEGREE_LAT
+        self.points = {}
+        self.cells = {}
+
+    def __len__(self):
+        return len(self.points)
+
+    def __contains__(self, item_id):
+        return item_id in self.points
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+
+    def add(self, item_id, lat, lon):
+        if item_id in self.points:
+            self.remove(item_id)
+        lat, lon = float(lat), float(lon)
+        self.points[item_id] = (lat, lon)
+        self.cells.setdefault(self._cell(lat, lon), set()).add(item_id)
+
+    def remove(self, item_id):
+        point = self.points.pop(item_id, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(item_id)
+            if not members:
+                del self.cells[cell]
+
+    def within(self, lat, lon, radius_m):
+        # [(distance_m, id)] for points within radius_m, nearest first
+        lat, lon = float(lat), float(lon)
+        lat_span = radius_m / METERS_PER_DEGREE_LAT
+        lon_span = radius_m / (METERS_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 1e-6))
+        lat_lo, lon_lo = self._cell(lat - lat_span, lon - lon_span)
+        lat_hi, lon_hi = self._cell(lat + lat_span, lon + lon_span)
+        found = []
+        for cell_lat in range(lat_lo, lat_hi + 1):
+            for cell_lon in range(lon_lo, lon_hi + 1):
+                for item_id in self.cells.get((cell_lat, cell_lon), ()):
+                    distance = haversine_m(lat, lon, *self.points[item_id])
+                    if distance <= radius_m:
+                        found.append((distance, item_id))
+        found.sort()
+        return found
+
+
+class SharedIndex:
+    # load() builds the index; the result must have built_at (a
+    # time.monotonic() stamp). Readers never wait unless it needs building.
+
+    def __init__(self, load, ttl):
+        self._load = load
+        self.ttl = ttl
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _fresh(self, index):
+        return index is not None and time.monotonic() - index.built_at < self.ttl
+
+    def get(self):
+        # The index, (re)built (once, under the lock) when missing or stale
+        index = self._index
+        if self._fresh(index):
+            return index
+        with self._lock:
+            if not self._fresh(self._index):
+                self._index = self._load()
+            return self._index
+
+    def loaded(self):
+        # The index if one has been built, without loading
+        return self._index
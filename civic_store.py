@@ -0,0 +1,507 @@
+"""Issue write paths shared by the Streamlit app, scripts and benchmarks.
+
+Nothing in here touches Streamlit: callers decide how to report errors.
+Database failures surface as civic_db.DatabaseError.
+"""
+import threading
+import uuid
+from collections import namedtuple
+from datetime import datetime
+
+import civic_cache
+import civic_db
+import civic_dedupe
+import civic_nearby
+import civic_reference
+import civic_search
+
+
+# user_id used for the city-wide row in issue_status_counts
+ALL_USERS = 0
+PENDING_STATUS_ID = 1
+DUPLICATE_STATUS_ID = 5
+# Reaching either of these for the first time counts as "resolved"
+RESOLVED_STATUS_IDS = (3, 4)
+
+# Rows in app_kpis
+KPI_CITIZENS = 'citizens'
+KPI_RESOLVED_ISSUES = 'resolved_issues'
+KPI_RESOLUTION_SECONDS = 'resolution_seconds'
+
+
+def _count_status(deltas, user_id, status_id, amount):
+    for owner in (ALL_USERS, user_id):
+        key = (owner, status_id)
+        deltas[key] = deltas.get(key, 0) + amount
+
+
+def _count_day(deltas, created_at, status_id, category_id, location_id, amount):
+    key = (created_at.date(), status_id, category_id, location_id)
+    deltas[key] = deltas.get(key, 0) + amount
+
+
+DAILY_COUNT_KEYS = ('stat_date', 'status_id', 'category_id', 'location_id')
+LOCATION_COUNT_KEYS = ('location_id', 'status_id', 'severity')
+
+
+def _count_location(deltas, location_id, status_id, severity, amount):
+    key = (location_id, status_id, severity)
+    deltas[key] = deltas.get(key, 0) + amount
+
+
+# --- USERS ---
+
+def register_citizen(name, phone, email, password_hash):
+    # Creates the account and bumps the citizen KPI in one transaction
+    backfill_derived()
+    with civic_db.connection() as conn:
+        conn.begin()
+        _, user_id = conn.execute(
+            "INSERT INTO USERS (name, phone, email, role, password_hash) VALUES (%s, %s, %s, 'citizen', %s)",
+            (name, phone, email, password_hash),
+        )
+        conn.increment('app_kpis', ('name',), 'value', {(KPI_CITIZENS,): 1})
+        conn.commit()
+    return user_id
+
+
+def get_user_by_email(email):
+    # The account row for a sign-in (email is unique), or None
+    with civic_db.connection() as conn:
+        rows = conn.query(
+            "SELECT user_id, name, phone, email, role, password_hash FROM USERS WHERE email = %s",
+            (email,),
+        )
+    return rows[0] if rows else None
+
+
+def update_password_hash(user_id, old_hash, new_hash):
+    # Swaps the stored hash only if it is still old_hash. Returns whether it did.
+    with civic_db.connection() as conn:
+        updated, _ = conn.execute(
+            "UPDATE USERS SET password_hash = %s WHERE user_id = %s AND password_hash = %s",
+            (new_hash, int(user_id), old_hash),
+        )
+        conn.commit()
+    return updated == 1
+
+
+# --- SUBMISSION ---
+
+Submission = namedtuple('Submission', [
+    'idempotency_key', 'user_id', 'category_id', 'location_id',
+    'description', 'severity', 'photo_path', 'created_at',
+])
+
+
+def submit_issue(user_id, category_id, location_id, description, severity, photo_path=None, idempotency_key=None):
+    # Synchronous single submission. Returns the new issue_id (the existing
+    # one if idempotency_key was already stored).
+    submission = Submission(
+        idempotency_key or uuid.uuid4().hex, user_id, category_id, location_id,
+        description, severity, photo_path, datetime.now().replace(microsecond=0),
+    )
+    issue_ids, _ = submit_issues([submission])
+    return issue_ids[submission.idempotency_key]
+
+
+def submit_issues(submissions):
+    # Inserts a batch of issues, their idempotency keys, the status counters
+    # and the daily rollup in one transaction. Returns ({idempotency_key:
+    # issue_id}, keys stored by this call). A key that was already stored (a
+    # retried batch whose commit did get through, or another drainer) maps to
+    # the existing issue instead of a duplicate and is not in the set.
+    if not submissions:
+        return {}, set()
+    backfill_derived()
+    keys = [submission.idempotency_key for submission in submissions]
+    placeholders = ", ".join(["%s"] * len(keys))
+    # Built before taking a connection: loading the index and the location
+    # coordinates needs one of its own
+    detector = _duplicate_detector()
+    fingerprints = {}
+    if detector is not None:
+        for submission in submissions:
+            lat, lon = civic_dedupe.location_point(submission.location_id)
+            fingerprints[submission.idempotency_key] = (lat, lon, civic_dedupe.signature(submission.description))
+    indexed = []
+    try:
+        with civic_db.connection() as conn:
+            conn.begin()
+            rows = conn.query(
+                f"SELECT idempotency_key, issue_id FROM issue_submissions WHERE idempotency_key IN ({placeholders}) FOR UPDATE",
+                keys,
+            )
+            issue_ids = {row['idempotency_key']: int(row['issue_id']) for row in rows}
+            stored_keys, linked = set(issue_ids), set()
+            status_deltas, day_deltas, location_deltas, new_users = {}, {}, {}, set()
+            searchable = []
+            for submission in submissions:
+                if submission.idempotency_key in issue_ids:
+                    continue
+                user_id, category_id, location_id = int(submission.user_id), int(submission.category_id), int(submission.location_id)
+                created_at = submission.created_at
+                match = None
+                if detector is not None:
+                    lat, lon, sig = fingerprints[submission.idempotency_key]
+                    match = detector.check(category_id, lat, lon, submission.description, sig)
+                auto_link = civic_dedupe.should_auto_link(match)
+                status_id = DUPLICATE_STATUS_ID if auto_link else PENDING_STATUS_ID
+                _, issue_id = conn.execute(
+                    "INSERT INTO ISSUES "
+                    "(user_id, category_id, location_id, status_id, description, severity, photo_path, created_at, updated_at, master_issue_id) "
+                    "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                    (user_id, category_id, location_id, status_id, submission.description, submission.severity, submission.photo_path, created_at, created_at,
+                     match.issue_id if auto_link else None),
+                )
+                conn.execute(
+                    "INSERT INTO issue_submissions (idempotency_key, issue_id, submitted_at) VALUES (%s, %s, %s)",
+                    (submission.idempotency_key, issue_id, created_at),
+                )
+                if match is not None:
+                    conn.execute(
+                        "INSERT INTO issue_duplicate_candidates (issue_id, master_issue_id, similarity, distance_m, detected_at) VALUES (%s, %s, %s, %s, %s)",
+                        (issue_id, match.issue_id, match.similarity, match.distance_m, created_at),
+                    )
+                if detector is not None and status_id in civic_dedupe.OPEN_STATUS_IDS:
+                    # Every open issue, including one only suggested as a
+                    # duplicate: later reports (in this batch too) can match
+                    # it. Undone below if the transaction fails.
+                    detector.add(issue_id, category_id, lat, lon, submission.description, sig)
+                    indexed.append(issue_id)
+                issue_ids[submission.idempotency_key] = issue_id
+                searchable.append((issue_id, submission.description, location_id))
+                if auto_link:
+                    linked.add(issue_id)
+                new_users.add(user_id)
+                _count_status(status_deltas, user_id, status_id, 1)
+                _count_day(day_deltas, created_at, status_id, category_id, location_id, 1)
+                _count_location(location_deltas, location_id, status_id, submission.severity, 1)
+            conn.increment('issue_status_counts', ('user_id', 'status_id'), 'issue_count', status_deltas)
+            conn.increment('issue_daily_counts', DAILY_COUNT_KEYS, 'issue_count', day_deltas)
+            conn.increment('issue_location_counts', LOCATION_COUNT_KEYS, 'issue_count', location_deltas)
+            civic_search.index_issues(conn, searchable)
+            conn.commit()
+    except BaseException:
+        if indexed:
+            detector.remove(indexed)
+        raise
+
+    index = civic_nearby.loaded_index()
+    if index is not None:
+        for submission in submissions:
+            if submission.idempotency_key in stored_keys:
+                continue
+            status_id = DUPLICATE_STATUS_ID if issue_ids[submission.idempotency_key] in linked else PENDING_STATUS_ID
+            if status_id in civic_nearby.OPEN_STATUS_IDS:
+                index.add(issue_ids[submission.idempotency_key], submission.location_id, status_id, submission.category_id,
+                          submission.severity, submission.description, submission.created_at)
+
+    # Only the submitters' lists and the all-issue aggregates change;
+    # reference data and other users' caches stay warm.
+    if new_users:
+        civic_cache.bump(civic_cache.ISSUES, *(civic_cache.user(user_id) for user_id in new_users))
+    return issue_ids, set(issue_ids) - stored_keys
+
+
+def _duplicate_detector():
+    # Duplicate detection is best effort: a failure to build the index must
+    # not stop a citizen's report from being stored
+    try:
+        detector = civic_dedupe.get_detector()
+        if detector is not None:
+            civic_reference.get()
+        return detector
+    except civic_db.DatabaseError:
+        return None
+
+
+# --- STATUS TRANSITIONS ---
+
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+CONFLICT = 'conflict'      # the issue moved away from the status the caller saw
+NOT_FOUND = 'not_found'
+
+TransitionResult = namedtuple('TransitionResult', ['outcome', 'old_status_id'])
+
+def change_status(issue_id, new_status_id, staff_user_id, expected_status_id=None):
+    expected = None if expected_status_id is None else {int(issue_id): expected_status_id}
+    outcomes = change_status_bulk([issue_id], new_status_id, staff_user_id, expected)
+    return outcomes[int(issue_id)]
+
+
+def change_status_bulk(issue_ids, new_status_id, staff_user_id, expected_status_ids=None, master_issue_ids=None):
+    # Applies one status to many issues in a single transaction and returns
+    # {issue_id: TransitionResult}. master_issue_ids ({issue_id: master})
+    # also links the changed issues to the report they duplicate. The row locks taken by the SELECT keep a
+    # concurrent update from slipping in between reading the old status and
+    # writing it to resolution_history; rows are locked in issue_id order so
+    # two overlapping bulk updates can't deadlock each other.
+    issue_ids = sorted({int(issue_id) for issue_id in issue_ids})
+    new_status_id, staff_user_id = int(new_status_id), int(staff_user_id)
+    expected_status_ids = {int(k): int(v) for k, v in (expected_status_ids or {}).items() if v is not None}
+    if not issue_ids:
+        return {}
+    backfill_derived()
+
+    placeholders = ', '.join(['%s'] * len(issue_ids))
+    with civic_db.connection() as conn:
+        conn.begin()
+        rows = conn.query(
+            f"SELECT issue_id, status_id, user_id, category_id, location_id, severity, description, created_at FROM ISSUES "
+            f"WHERE issue_id IN ({placeholders}) ORDER BY issue_id FOR UPDATE",
+            issue_ids,
+        )
+        current = {int(row['issue_id']): int(row['status_id']) for row in rows}
+        issue_rows = {int(row['issue_id']): row for row in rows}
+        reporters = {issue_id: int(row['user_id']) for issue_id, row in issue_rows.items()}
+
+        results, changed = {}, []
+        for issue_id in issue_ids:
+            old_status_id = current.get(issue_id)
+            if old_status_id is None:
+                results[issue_id] = TransitionResult(NOT_FOUND, None)
+            elif issue_id in expected_status_ids and old_status_id != expected_status_ids[issue_id]:
+                results[issue_id] = TransitionResult(CONFLICT, old_status_id)
+            elif old_status_id == new_status_id:
+                results[issue_id] = TransitionResult(UNCHANGED, old_status_id)
+            else:
+                results[issue_id] = TransitionResult(UPDATED, old_status_id)
+                changed.append((issue_id, old_status_id))
+
+        if changed:
+            conn.executemany(
+                "UPDATE ISSUES SET status_id = %s, updated_at = NOW() WHERE issue_id = %s",
+                [(new_status_id, issue_id) for issue_id, _ in changed],
+            )
+            if master_issue_ids:
+                conn.executemany(
+                    "UPDATE ISSUES SET master_issue_id = %s WHERE issue_id = %s",
+                    [(int(master_issue_ids[issue_id]), issue_id) for issue_id, _ in changed if issue_id in master_issue_ids],
+                )
+            conn.executemany(
+                "INSERT INTO resolution_history (issue_id, old_status_id, new_status_id, changed_by, timestamp) "
+                "VALUES (%s, %s, %s, %s, NOW())",
+                [(issue_id, old_status_id, new_status_id, staff_user_id) for issue_id, old_status_id in changed],
+            )
+            conn.executemany(
+                "REPLACE INTO issue_latest_update (issue_id, changed_by, changed_at) VALUES (%s, %s, NOW())",
+                [(issue_id, staff_user_id) for issue_id, _ in changed],
+            )
+            status_deltas, day_deltas, location_deltas = {}, {}, {}
+            for issue_id, old_status_id in changed:
+                row = issue_rows[issue_id]
+                created_at, category_id, location_id = civic_db.to_datetime(row['created_at']), int(row['category_id']), int(row['location_id'])
+                _count_status(status_deltas, reporters[issue_id], old_status_id, -1)
+                _count_status(status_deltas, reporters[issue_id], new_status_id, 1)
+                _count_day(day_deltas, created_at, old_status_id, category_id, location_id, -1)
+                _count_day(day_deltas, created_at, new_status_id, category_id, location_id, 1)
+                _count_location(location_deltas, location_id, old_status_id, row['severity'], -1)
+                _count_location(location_deltas, location_id, new_status_id, row['severity'], 1)
+            conn.increment('issue_status_counts', ('user_id', 'status_id'), 'issue_count', status_deltas)
+            conn.increment('issue_daily_counts', DAILY_COUNT_KEYS, 'issue_count', day_deltas)
+            conn.increment('issue_location_counts', LOCATION_COUNT_KEYS, 'issue_count', location_deltas)
+            if new_status_id in RESOLVED_STATUS_IDS:
+                _record_first_resolutions(conn, [issue_id for issue_id, _ in changed])
+            conn.commit()
+
+    if changed:
+        detector = civic_dedupe.loaded_detector()
+        if detector is not None and new_status_id not in civic_dedupe.OPEN_STATUS_IDS:
+            detector.remove([issue_id for issue_id, _ in changed])
+        index = civic_nearby.loaded_index()
+        if index is not None:
+            if new_status_id in civic_nearby.OPEN_STATUS_IDS:
+                # add() also brings in issues that were re-opened
+                for issue_id, _ in changed:
+                    row = issue_rows[issue_id]
+                    index.add(issue_id, row['location_id'], new_status_id, row['category_id'], row['severity'],
+                              row['description'], civic_db.to_datetime(row['created_at']))
+            else:
+                index.set_status([issue_id for issue_id, _ in changed], new_status_id)
+        civic_cache.bump(
+            civic_cache.ISSUES,
+            *[civic_cache.issue(issue_id) for issue_id, _ in changed],
+            *{civic_cache.user(reporters[issue_id]) for issue_id, _ in changed},
+        )
+    return results
+
+
+def link_duplicate(issue_id, master_issue_id, staff_user_id, expected_status_id=None):
+    # Marks issue_id as a Duplicate of master_issue_id. Returns a TransitionResult.
+    expected = None if expected_status_id is None else {int(issue_id): expected_status_id}
+    outcomes = change_status_bulk([issue_id], DUPLICATE_STATUS_ID, staff_user_id, expected, {int(issue_id): int(master_issue_id)})
+    return outcomes[int(issue_id)]
+
+
+def _record_first_resolutions(conn, issue_ids):
+    # Issues reaching Resolved/Closed for the first time add their resolution
+    # time to the running KPI totals. The caller holds the ISSUES row locks,
+    # so the "already recorded?" check can't race another transition.
+    placeholders = ', '.join(['%s'] * len(issue_ids))
+    seen = {int(row['issue_id']) for row in conn.query(
+        f"SELECT issue_id FROM issue_first_resolution WHERE issue_id IN ({placeholders})", issue_ids)}
+    first_time = [issue_id for issue_id in issue_ids if issue_id not in seen]
+    if not first_time:
+        return
+    conn.executemany(
+        "INSERT INTO issue_first_resolution (issue_id, resolved_at, resolution_seconds) "
+        "SELECT issue_id, NOW(), TIMESTAMPDIFF(SECOND, created_at, NOW()) FROM ISSUES WHERE issue_id = %s",
+        [(issue_id,) for issue_id in first_time],
+    )
+    placeholders = ', '.join(['%s'] * len(first_time))
+    seconds = conn.query(
+        f"SELECT SUM(resolution_seconds) as total FROM issue_first_resolution WHERE issue_id IN ({placeholders})", first_time)
+    conn.increment('app_kpis', ('name',), 'value', {
+        (KPI_RESOLVED_ISSUES,): len(first_time),
+        (KPI_RESOLUTION_SECONDS,): int(seconds[0]['total'] or 0),
+    })
+
+
+# --- MAINTENANCE ---
+
+def rebuild_latest_updates():
+    # Recomputes issue_latest_update from resolution_history (backfill for
+    # existing databases, repair after manual edits). Returns rows written.
+    with civic_db.connection() as conn:
+        conn.begin()
+        conn.execute("DELETE FROM issue_latest_update")
+        written, _ = conn.execute("""
+            INSERT INTO issue_latest_update (issue_id, changed_by, changed_at)
+            SELECT issue_id, changed_by, timestamp
+            FROM (
+                SELECT
+                    rh.issue_id,
+                    rh.changed_by,
+                    rh.timestamp,
+                    ROW_NUMBER() OVER (PARTITION BY rh.issue_id ORDER BY rh.timestamp DESC) as rn
+                FROM resolution_history rh
+            ) ranked
+            WHERE rn = 1
+        """)
+        conn.commit()
+        return written
+
+
+def reconcile_status_counts(fix=True):
+    # Compares issue_status_counts with a full GROUP BY over ISSUES and, if
+    # fix is set, overwrites the drifted rows. Returns a list of
+    # (user_id, status_id, stored, actual) for every row that was off.
+    with civic_db.connection() as conn:
+        conn.begin()
+        # FOR UPDATE keeps status changes out until the counters are rewritten
+        rows = conn.query("SELECT user_id, status_id, COUNT(*) as n FROM ISSUES GROUP BY user_id, status_id FOR UPDATE")
+        actual = {}
+        for row in rows:
+            _count_status(actual, int(row['user_id']), int(row['status_id']), int(row['n']))
+        stored = {
+            (int(row['user_id']), int(row['status_id'])): int(row['issue_count'])
+            for row in conn.query("SELECT user_id, status_id, issue_count FROM issue_status_counts")
+        }
+
+        drift = [
+            (user_id, status_id, stored.get((user_id, status_id), 0), actual.get((user_id, status_id), 0))
+            for user_id, status_id in sorted(set(actual) | set(stored))
+            if stored.get((user_id, status_id), 0) != actual.get((user_id, status_id), 0)
+        ]
+        if fix and drift:
+            conn.executemany(
+                "REPLACE INTO issue_status_counts (user_id, status_id, issue_count) VALUES (%s, %s, %s)",
+                [(user_id, status_id, count) for user_id, status_id, _, count in drift],
+            )
+            conn.commit()
+
+    if fix and drift:
+        civic_cache.bump(civic_cache.ISSUES, *{civic_cache.user(user_id) for user_id, _, _, _ in drift if user_id != ALL_USERS})
+    return drift
+
+
+def rebuild_kpis():
+    # Recomputes issue_first_resolution and app_kpis from resolution_history
+    # and USERS. Returns the new KPI values.
+    with civic_db.connection() as conn:
+        conn.begin()
+        conn.execute("DELETE FROM issue_first_resolution")
+        conn.execute("""
+            INSERT INTO issue_first_resolution (issue_id, resolved_at, resolution_seconds)
+            SELECT i.issue_id, MIN(rh.timestamp), TIMESTAMPDIFF(SECOND, i.created_at, MIN(rh.timestamp))
+            FROM ISSUES i
+            JOIN resolution_history rh ON i.issue_id = rh.issue_id
+            WHERE rh.new_status_id IN (3, 4) -- 3: Resolved, 4: Closed
+            GROUP BY i.issue_id, i.created_at
+        """)
+        resolved = conn.query("SELECT COUNT(*) as n, SUM(resolution_seconds) as seconds FROM issue_first_resolution")[0]
+        citizens = conn.query("SELECT COUNT(*) as n FROM USERS WHERE role = 'citizen'")[0]
+        kpis = {
+            KPI_CITIZENS: int(citizens['n']),
+            KPI_RESOLVED_ISSUES: int(resolved['n']),
+            KPI_RESOLUTION_SECONDS: int(resolved['seconds'] or 0),
+        }
+        conn.executemany("REPLACE INTO app_kpis (name, value) VALUES (%s, %s)", list(kpis.items()))
+        conn.commit()
+    return kpis
+
+
+def rebuild_rollups():
+    # Regenerates issue_daily_counts and issue_location_counts from ISSUES.
+    # Returns {table: rows written}.
+    with civic_db.connection() as conn:
+        conn.begin()
+        conn.execute("DELETE FROM issue_daily_counts")
+        daily, _ = conn.execute("""
+            INSERT INTO issue_daily_counts (stat_date, status_id, category_id, location_id, issue_count)
+            SELECT DATE(created_at), status_id, category_id, location_id, COUNT(*)
+            FROM ISSUES
+            GROUP BY DATE(created_at), status_id, category_id, location_id
+        """)
+        conn.execute("DELETE FROM issue_location_counts")
+        by_location, _ = conn.execute("""
+            INSERT INTO issue_location_counts (location_id, status_id, severity, issue_count)
+            SELECT location_id, status_id, severity, COUNT(*)
+            FROM ISSUES
+            GROUP BY location_id, status_id, severity
+        """)
+        conn.commit()
+    civic_cache.bump(civic_cache.ISSUES)
+    return {'issue_daily_counts': daily, 'issue_location_counts': by_location}
+
+
+# (source table, derived tables, rebuild) for backfill_derived, in the order
+# the admin commands list them
+DERIVED = (
+    ('resolution_history', ('issue_latest_update',), rebuild_latest_updates),
+    ('ISSUES', ('issue_status_counts',), reconcile_status_counts),
+    ('USERS', ('app_kpis',), rebuild_kpis),
+    ('ISSUES', ('issue_daily_counts', 'issue_location_counts'), rebuild_rollups),
+    ('ISSUES', ('issue_search',), civic_search.rebuild),
+)
+
+_backfill_lock = threading.Lock()
+_backfilled = False
+
+
+def backfill_derived():
+    # Rebuilds every derived table that is empty while its source has rows,
+    # i.e. an existing database that predates the table. Checked once per
+    # process, before the first write, so counters are never adjusted from
+    # missing rows. Returns the names of the tables it filled.
+    global _backfilled
+    if _backfilled:
+        return []
+    with _backfill_lock:
+        if _backfilled:
+            return []
+        with civic_db.connection() as conn:
+            def empty(table):
+                return not conn.query(f"SELECT 1 FROM {table} LIMIT 1")
+            pending = [
+                (tables, rebuild) for source, tables, rebuild in DERIVED
+                if any(empty(table) for table in tables) and not empty(source)
+            ]
+        filled = []
+        for tables, rebuild in pending:
+            rebuild()
+            filled.extend(tables)
+        _backfilled = True
+    return filled
@@ -0,0 +1,66 @@
+-- Core tables the app expects. Until now they were created by hand from the
+-- project's SQL scripts; IF NOT EXISTS makes this a no-op on such a database.
+-- The tables the app maintains itself (issue_status_counts, ...) are created
+-- by civic_db on connect.
+
+CREATE TABLE IF NOT EXISTS USERS (
+    user_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    phone VARCHAR(15) UNIQUE,
+    email VARCHAR(100) NOT NULL UNIQUE,
+    role ENUM('citizen', 'staff') NOT NULL DEFAULT 'citizen',
+    password_hash VARCHAR(255) NOT NULL
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS STATUS (
+    status_id INT NOT NULL PRIMARY KEY,
+    status_name VARCHAR(20) NOT NULL UNIQUE
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS CATEGORIES (
+    category_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    Name VARCHAR(100) NOT NULL UNIQUE
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS LOCATIONS (
+    location_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    area VARCHAR(100) NOT NULL,
+    address VARCHAR(255),
+    latitude DECIMAL(9, 6),
+    longitude DECIMAL(9, 6)
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS ISSUES (
+    issue_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    user_id INT NOT NULL,
+    category_id INT NOT NULL,
+    location_id INT NOT NULL,
+    status_id INT NOT NULL DEFAULT 1,
+    description TEXT NOT NULL,
+    severity ENUM('Low', 'Medium', 'High') NOT NULL,
+    photo_path VARCHAR(255),
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    master_issue_id INT,
+    FOREIGN KEY (user_id) REFERENCES USERS (user_id),
+    FOREIGN KEY (category_id) REFERENCES CATEGORIES (category_id),
+    FOREIGN KEY (location_id) REFERENCES LOCATIONS (location_id),
+    FOREIGN KEY (status_id) REFERENCES STATUS (status_id),
+    FOREIGN KEY (master_issue_id) REFERENCES ISSUES (issue_id)
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS resolution_history (
+    history_id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    issue_id INT NOT NULL,
+    old_status_id INT NOT NULL,
+    new_status_id INT NOT NULL,
+    changed_by INT NOT NULL,
+    timestamp DATETIME NOT NULL,
+    FOREIGN KEY (issue_id) REFERENCES ISSUES (issue_id),
+    FOREIGN KEY (old_status_id) REFERENCES STATUS (status_id),
+    FOREIGN KEY (new_status_id) REFERENCES STATUS (status_id),
+    FOREIGN KEY (changed_by) REFERENCES USERS (user_id)
+) ENGINE=InnoDB;
+
+INSERT IGNORE INTO STATUS (status_id, status_name) VALUES
+    (1, 'Pending'), (2, 'In-Progress'), (3, 'Resolved'), (4, 'Closed'), (5, 'Duplicate');
@@ -0,0 +1,20 @@
+-- Indexes for the app's access patterns; `civic_admin.py advise-indexes`
+-- shows the plans they give. ALGORITHM=INPLACE, LOCK=NONE builds each one
+-- online, and MySQL fails the statement rather than lock the table if it
+-- cannot. An index that already exists under the same name is skipped.
+
+-- A citizen's own reports, newest first (get_user_issues)
+CREATE INDEX issues_user_created ON ISSUES (user_id, created_at) ALGORITHM=INPLACE LOCK=NONE;
+-- Staff list filtered by status, in keyset order; also the open-issue loads
+-- for duplicate detection and the nearby index
+CREATE INDEX issues_status_created ON ISSUES (status_id, created_at) ALGORITHM=INPLACE LOCK=NONE;
+-- Unfiltered staff list pages: (created_at, issue_id) keyset
+CREATE INDEX issues_created ON ISSUES (created_at) ALGORITHM=INPLACE LOCK=NONE;
+-- Staff list filtered by category
+CREATE INDEX issues_category_created ON ISSUES (category_id, created_at) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX issues_location ON ISSUES (location_id) ALGORITHM=INPLACE LOCK=NONE;
+
+-- An issue's history in time order (get_issue_history, latest update backfill)
+CREATE INDEX history_issue_time ON resolution_history (issue_id, timestamp) ALGORITHM=INPLACE LOCK=NONE;
+-- First resolutions for the home page KPIs (rebuild-kpis)
+CREATE INDEX history_new_status ON resolution_history (new_status_id) ALGORITHM=INPLACE LOCK=NONE;
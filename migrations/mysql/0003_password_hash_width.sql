@@ -0,0 +1,6 @@
+-- scrypt hashes (scrypt$n$r$p$salt$hash, about 86 characters) do not fit a
+-- password_hash column sized for the old 64-character SHA-256 digests.
+-- Databases created from 0001 already have VARCHAR(255); this is a no-op
+-- for them.
+
+ALTER TABLE USERS MODIFY password_hash VARCHAR(255) NOT NULL;
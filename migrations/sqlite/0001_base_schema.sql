@@ -0,0 +1,55 @@
+-- Core tables, as the MySQL schema defines them. civic_db also runs this
+-- file on the first connection of every process, so it must stay idempotent.
+
+CREATE TABLE IF NOT EXISTS USERS (
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL,
+    phone VARCHAR(15) UNIQUE,
+    email VARCHAR(100) NOT NULL UNIQUE,
+    role VARCHAR(10) NOT NULL DEFAULT 'citizen' CHECK (role IN ('citizen', 'staff')),
+    password_hash VARCHAR(255) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS STATUS (
+    status_id INTEGER PRIMARY KEY,
+    status_name VARCHAR(20) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS CATEGORIES (
+    category_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    Name VARCHAR(100) NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS LOCATIONS (
+    location_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    area VARCHAR(100) NOT NULL,
+    address VARCHAR(255),
+    latitude DECIMAL(9, 6),
+    longitude DECIMAL(9, 6)
+);
+
+CREATE TABLE IF NOT EXISTS ISSUES (
+    issue_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES USERS (user_id),
+    category_id INTEGER NOT NULL REFERENCES CATEGORIES (category_id),
+    location_id INTEGER NOT NULL REFERENCES LOCATIONS (location_id),
+    status_id INTEGER NOT NULL DEFAULT 1 REFERENCES STATUS (status_id),
+    description TEXT NOT NULL,
+    severity VARCHAR(10) NOT NULL CHECK (severity IN ('Low', 'Medium', 'High')),
+    photo_path VARCHAR(255),
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    master_issue_id INTEGER REFERENCES ISSUES (issue_id)
+);
+
+CREATE TABLE IF NOT EXISTS resolution_history (
+    history_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    issue_id INTEGER NOT NULL REFERENCES ISSUES (issue_id),
+    old_status_id INTEGER NOT NULL REFERENCES STATUS (status_id),
+    new_status_id INTEGER NOT NULL REFERENCES STATUS (status_id),
+    changed_by INTEGER NOT NULL REFERENCES USERS (user_id),
+    timestamp DATETIME NOT NULL
+);
+
+INSERT OR IGNORE INTO STATUS (status_id, status_name) VALUES
+    (1, 'Pending'), (2, 'In-Progress'), (3, 'Resolved'), (4, 'Closed'), (5, 'Duplicate');
@@ -0,0 +1,21 @@
+-- Indexes for the app's access patterns; `civic_admin.py advise-indexes`
+-- shows the plans they give. Same indexes and names as the MySQL migration.
+
+-- A citizen's own reports, newest first (get_user_issues)
+CREATE INDEX IF NOT EXISTS issues_user_created ON ISSUES (user_id, created_at);
+-- Staff list filtered by status, in keyset order; also the open-issue loads
+-- for duplicate detection and the nearby index
+CREATE INDEX IF NOT EXISTS issues_status_created ON ISSUES (status_id, created_at);
+-- Unfiltered staff list pages: (created_at, issue_id) keyset
+CREATE INDEX IF NOT EXISTS issues_created ON ISSUES (created_at);
+-- Staff list filtered by category
+CREATE INDEX IF NOT EXISTS issues_category_created ON ISSUES (category_id, created_at);
+CREATE INDEX IF NOT EXISTS issues_location ON ISSUES (location_id);
+
+-- An issue's history in time order (get_issue_history, latest update backfill)
+CREATE INDEX IF NOT EXISTS history_issue_time ON resolution_history (issue_id, timestamp);
+-- First resolutions for the home page KPIs (rebuild-kpis)
+CREATE INDEX IF NOT EXISTS history_new_status ON resolution_history (new_status_id);
+
+-- Gives the query planner row counts to choose between these indexes
+ANALYZE;
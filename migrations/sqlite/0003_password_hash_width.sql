@@ -0,0 +1,2 @@
+-- Nothing to do: SQLite does not enforce VARCHAR lengths, so password_hash
+-- already holds scrypt hashes. Kept so the version numbers match MySQL's.